@@ -0,0 +1,300 @@
+"""Server-side price alerts evaluated incrementally as observations arrive.
+
+Users subscribe rules such as "teff in Jimma above 80 ETB/kg" or "opportunity
+score for coffee in Addis Ababa crosses 70". Rules are edge-triggered: one
+fires when its condition becomes true and re-arms once the condition is false
+again. Both rules and fired alerts live in SQLite, so every worker process
+sees the same subscriptions and the same alerts.
+
+The engine keeps two in-memory indexes. Price rules are indexed by
+(product, market). Score and risk rules are indexed by product, since a new
+observation in any market shifts the national average they are scored
+against. price_store notifies the engine of the series each write touched,
+so only the rules on those series are re-checked. Writes made by another
+process (such as the ingest CLI) are noticed through the store's data
+version, and all rules are then re-checked once.
+"""
+import math
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+import price_store
+from market_analysis import lookup_analysis
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'alerts.db')
+
+# kind -> (watched value, fires when value is above the threshold)
+RULE_KINDS = {
+    'price_above': ('price', True),
+    'price_below': ('price', False),
+    'score_above': ('score', True),
+    'score_below': ('score', False),
+    'risk_above': ('risk', True),
+}
+
+# risk_above thresholds are given as one of these levels
+RISK_LEVELS = ('Low', 'Medium', 'High', 'Very High')
+
+# Most rules one user may subscribe
+MAX_RULES_PER_USER = 100
+
+# Most alerts returned by one pull
+MAX_EVENTS = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rules (
+    rule_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    product TEXT NOT NULL,
+    market TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    threshold REAL NOT NULL,
+    active INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rules_user ON rules (user_id);
+CREATE TABLE IF NOT EXISTS events (
+    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    rule_id INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    product TEXT NOT NULL,
+    market TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    threshold REAL NOT NULL,
+    value REAL NOT NULL,
+    fired_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_user ON events (user_id, event_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta VALUES ('version', 0);
+"""
+
+
+class Rule:
+    __slots__ = ('rule_id', 'user_id', 'product', 'market', 'kind', 'threshold')
+
+    def __init__(self, rule_id, user_id, product, market, kind, threshold):
+        self.rule_id = rule_id
+        self.user_id = user_id
+        self.product = product
+        self.market = market
+        self.kind = kind
+        self.threshold = threshold
+
+    def to_dict(self):
+        threshold = RISK_LEVELS[int(self.threshold)] if self.kind == 'risk_above' else self.threshold
+        return {'id': self.rule_id, 'product': self.product, 'market': self.market,
+                'kind': self.kind, 'threshold': threshold}
+
+
+def parse_rule(data):
+    """(product, market, kind, threshold) from request data; raises ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    product = str(data.get('product') or '').strip().lower()
+    market = str(data.get('market') or '').strip().lower()
+    kind = data.get('kind')
+    if not product or not market:
+        raise ValueError('product and market are required')
+    if kind not in RULE_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(sorted(RULE_KINDS))}")
+    threshold = data.get('threshold')
+    if kind == 'risk_above':
+        if threshold not in RISK_LEVELS:
+            raise ValueError(f"threshold must be one of {', '.join(RISK_LEVELS)}")
+        return product, market, kind, float(RISK_LEVELS.index(threshold))
+    # bool is an int subclass, and float() accepts 'nan' and 'inf'
+    if isinstance(threshold, bool):
+        raise ValueError('threshold must be a number')
+    try:
+        threshold = float(threshold)
+    except (TypeError, ValueError):
+        raise ValueError('threshold must be a number')
+    if not math.isfinite(threshold):
+        raise ValueError('threshold must be a finite number')
+    return product, market, kind, threshold
+
+
+def watched_value(watch, product, market):
+    """Current latest price, opportunity score or risk level index, or None without data"""
+    if watch == 'price':
+        stats = price_store.get_price_stats(product, market)
+        return stats['latest'] if stats else None
+    insights = lookup_analysis('farmer', product, market)['detailed_insights']
+    if watch == 'score':
+        return insights['opportunity_score']
+    return RISK_LEVELS.index(insights['risk_assessment']['overall_risk'])
+
+
+class AlertEngine:
+    """Alert rules and fired alerts, with indexes for incremental evaluation"""
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('ALERT_DB_PATH', DEFAULT_DB_PATH)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._fired = threading.Condition()
+        self._rules_version = None
+        self._by_series = {}
+        self._by_product = {}
+        self._all_rules = ()
+        self._seen_data_version = price_store.data_version()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def reset_connections(self):
+        """Forget connections opened before a fork; each worker opens its own"""
+        self._local = threading.local()
+
+    def _bump_version(self, conn):
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def _refresh_index(self):
+        """Rebuild the rule indexes when any process has changed the rules"""
+        conn = self._conn()
+        version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        if version == self._rules_version:
+            return
+        by_series = defaultdict(list)
+        by_product = defaultdict(list)
+        rules = [Rule(row['rule_id'], row['user_id'], row['product'], row['market'], row['kind'], row['threshold'])
+                 for row in conn.execute('SELECT * FROM rules')]
+        for rule in rules:
+            if RULE_KINDS[rule.kind][0] == 'price':
+                by_series[(rule.product, rule.market)].append(rule)
+            else:
+                by_product[rule.product].append(rule)
+        self._by_series, self._by_product, self._all_rules = dict(by_series), dict(by_product), tuple(rules)
+        self._rules_version = version
+
+    def add_rule(self, user_id, product, market, kind, threshold):
+        """Subscribe a rule and check it right away; returns (rule dict, alerts it fired)"""
+        conn = self._conn()
+        count = conn.execute('SELECT COUNT(*) FROM rules WHERE user_id = ?', (user_id,)).fetchone()[0]
+        if count >= MAX_RULES_PER_USER:
+            raise ValueError(f'At most {MAX_RULES_PER_USER} alert rules per user')
+        rule_id = conn.execute(
+            'INSERT INTO rules (user_id, product, market, kind, threshold, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (user_id, product, market, kind, threshold, datetime.now().isoformat(timespec='seconds'))).lastrowid
+        self._bump_version(conn)
+        conn.commit()
+        rule = Rule(rule_id, user_id, product, market, kind, threshold)
+        with self._lock:
+            fired = self._evaluate([rule])
+        return rule.to_dict(), fired
+
+    def remove_rule(self, user_id, rule_id):
+        """Delete one of a user's rules; returns False if it does not exist"""
+        conn = self._conn()
+        deleted = conn.execute('DELETE FROM rules WHERE rule_id = ? AND user_id = ?', (rule_id, user_id)).rowcount
+        if deleted:
+            self._bump_version(conn)
+        conn.commit()
+        return deleted > 0
+
+    def rules(self, user_id):
+        rows = self._conn().execute('SELECT * FROM rules WHERE user_id = ? ORDER BY rule_id', (user_id,))
+        return [Rule(row['rule_id'], row['user_id'], row['product'], row['market'], row['kind'],
+                     row['threshold']).to_dict() for row in rows]
+
+    def _evaluate(self, rules):
+        """Check rules against current data and record those whose condition became true"""
+        if not rules:
+            return []
+        conn = self._conn()
+        values = {}
+        fired = []
+        now = datetime.now().isoformat(timespec='seconds')
+        for rule in rules:
+            watch, above = RULE_KINDS[rule.kind]
+            key = (watch, rule.product, rule.market)
+            if key not in values:
+                values[key] = watched_value(watch, rule.product, rule.market)
+            value = values[key]
+            holds = value is not None and (value > rule.threshold if above else value < rule.threshold)
+            # Compare-and-set, so workers evaluating the same write fire each alert once
+            changed = conn.execute('UPDATE rules SET active = ? WHERE rule_id = ? AND active = ?',
+                                   (int(holds), rule.rule_id, int(not holds))).rowcount
+            if changed and holds:
+                event_id = conn.execute(
+                    'INSERT INTO events (rule_id, user_id, product, market, kind, threshold, value, fired_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (rule.rule_id, rule.user_id, rule.product, rule.market, rule.kind, rule.threshold, value,
+                     now)).lastrowid
+                fired.append(self._event_dict(event_id, rule.rule_id, rule.product, rule.market, rule.kind,
+                                              rule.threshold, value, now))
+        conn.commit()
+        if fired:
+            with self._fired:
+                self._fired.notify_all()
+        return fired
+
+    def on_observations(self, series):
+        """price_store listener: re-check only the rules on the (product, market) series just written"""
+        with self._lock:
+            self._refresh_index()
+            affected = {}
+            for key in series:
+                for rule in self._by_series.get(key, ()):
+                    affected[rule.rule_id] = rule
+            for product in {product for product, _ in series}:
+                for rule in self._by_product.get(product, ()):
+                    affected[rule.rule_id] = rule
+            fired = self._evaluate(list(affected.values()))
+            self._seen_data_version = price_store.data_version()
+        return fired
+
+    def catch_up(self):
+        """Re-check every rule once if another process has written observations since the last check"""
+        version = price_store.data_version()
+        if version == self._seen_data_version:
+            return []
+        with self._lock:
+            if version == self._seen_data_version:
+                return []
+            self._refresh_index()
+            fired = self._evaluate(list(self._all_rules))
+            self._seen_data_version = version
+        return fired
+
+    @staticmethod
+    def _event_dict(event_id, rule_id, product, market, kind, threshold, value, fired_at):
+        if kind == 'risk_above':
+            threshold, value = RISK_LEVELS[int(threshold)], RISK_LEVELS[int(value)]
+        return {'id': event_id, 'rule_id': rule_id, 'product': product, 'market': market, 'kind': kind,
+                'threshold': threshold, 'value': value, 'fired_at': fired_at}
+
+    def events(self, user_id, after=0, limit=MAX_EVENTS):
+        """A user's alerts with id greater than after, oldest first"""
+        self.catch_up()
+        rows = self._conn().execute(
+            'SELECT * FROM events WHERE user_id = ? AND event_id > ? ORDER BY event_id LIMIT ?',
+            (user_id, after, limit))
+        return [self._event_dict(row['event_id'], row['rule_id'], row['product'], row['market'], row['kind'],
+                                 row['threshold'], row['value'], row['fired_at']) for row in rows]
+
+    def wait_for_events(self, user_id, after, timeout):
+        """Block until the user has alerts after the given id or the timeout passes"""
+        events = self.events(user_id, after)
+        if events:
+            return events
+        with self._fired:
+            # Alerts fired by other workers are only seen on the next poll
+            self._fired.wait(timeout)
+        return self.events(user_id, after)
@@ -0,0 +1,237 @@
+"""National market analytics over every catalog product and market.
+
+Prices, market multipliers and volatilities are held as product x market
+NumPy matrices. Risk levels, regional price indices, the volatility heatmap
+and per-product and per-market aggregates are derived from those matrices
+with array operations instead of building one analysis per pair.
+
+The matrices are materialized incrementally: the price_store listener
+recomputes only the product rows whose observations were just written.
+When another process writes observations, the data version changes and the
+next read rebuilds every row once. Derived tables are immutable tuples of
+rows, replaced whole on each change, and are served in pages with column
+projection.
+"""
+import threading
+
+import numpy as np
+
+import price_store
+from catalog import DEFAULT_MARKET, DEFAULT_PRODUCT, MARKETS_BY_ID, PRODUCTS_BY_ID
+from market_analysis import generate_economic_indicators, generate_risk_assessment, get_observed_prices
+from scenarios import daily_volatility
+
+RISK_LEVELS = ('Low', 'Medium', 'High', 'Very High')
+
+# Markets listed under highest_risk_markets in the overview summary
+TOP_RISK_MARKETS = 5
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+TABLE_FIELDS = {
+    'cells': ('product', 'market', 'region', 'price', 'multiplier', 'volatility_pct', 'risk'),
+    'products': ('product', 'unit', 'national_price', 'price_index', 'dispersion_pct', 'volatility_pct',
+                 'high_risk_markets', 'overall_risk', 'market_stability', 'market_health',
+                 'inflation_pressure', 'demand_growth'),
+    'markets': ('market', 'region', 'price_index', 'volatility_pct', 'risk_score', 'risk', 'high_risk_products'),
+    'regions': ('region', 'markets', 'price_index', 'volatility_pct'),
+    'heatmap': ('product',) + tuple(market.key for market in MARKETS_BY_ID),
+}
+
+
+def risk_codes(multipliers, highly_perishable):
+    """Index into RISK_LEVELS per cell, by the same rules as generate_risk_assessment"""
+    codes = np.select([multipliers <= 0.85, multipliers >= 1.15], [2, 1], 0)
+    perishable = highly_perishable[:, None]
+    return np.where(perishable & (codes == 2), 3, np.where(perishable, 2, codes))
+
+
+def product_row(product_info):
+    """(prices, multipliers, daily volatilities, national price) across markets for one product"""
+    prices = np.empty(len(MARKETS_BY_ID))
+    multipliers = np.empty(len(MARKETS_BY_ID))
+    volatilities = np.empty(len(MARKETS_BY_ID))
+    national = product_info.avg
+    for market in MARKETS_BY_ID:
+        observed = get_observed_prices(product_info.key, market.key)
+        if observed is None:
+            multiplier = market.multiplier
+            prices[market.id] = product_info.avg * multiplier
+            multipliers[market.id] = multiplier
+            volatilities[market.id] = daily_volatility(product_info, prices[market.id])
+            continue
+        national_min, national, national_max, market_avg, fitted = observed
+        multipliers[market.id] = round(market_avg / national, 2) if national else market.multiplier
+        prices[market.id] = market_avg
+        info = product_info.replace(min=national_min, avg=national, max=national_max)
+        current, rmse = (fitted[0], fitted[3]) if fitted else (market_avg, None)
+        volatilities[market.id] = daily_volatility(info, current, rmse)
+    return prices, multipliers, volatilities, national
+
+
+def _round(values, digits=2):
+    return [round(float(value), digits) for value in values]
+
+
+def build_tables(prices, multipliers, volatilities, national):
+    """Every analytics table from the product x market matrices"""
+    reference = np.array([product.avg for product in PRODUCTS_BY_ID])
+    highly_perishable = np.array([product.perishability == 'highly perishable' for product in PRODUCTS_BY_ID])
+    codes = risk_codes(multipliers, highly_perishable)
+    high_risk = codes >= 2
+    volatility_pct = volatilities * 100
+    # Market price relative to the product's national price, per cell
+    relative = prices / national[:, None]
+
+    cells = tuple(
+        {'product': product.key, 'market': market.key, 'region': market.region,
+         'price': round(float(prices[product.id, market.id]), 2),
+         'multiplier': float(multipliers[product.id, market.id]),
+         'volatility_pct': round(float(volatility_pct[product.id, market.id]), 2),
+         'risk': RISK_LEVELS[codes[product.id, market.id]]}
+        for product in PRODUCTS_BY_ID for market in MARKETS_BY_ID)
+
+    # National price against the catalog reference price acts as the product's multiplier
+    price_index = national / reference
+    dispersion = prices.std(axis=1) / prices.mean(axis=1) * 100
+    products = []
+    for product, index, spread, volatility, high in zip(
+            PRODUCTS_BY_ID, price_index, dispersion, volatility_pct.mean(axis=1), high_risk.sum(axis=1)):
+        indicators = generate_economic_indicators(float(index), product)
+        risk = generate_risk_assessment(float(index), product, DEFAULT_MARKET)
+        products.append({
+            'product': product.key, 'unit': product.unit, 'national_price': round(float(national[product.id]), 2),
+            'price_index': round(float(index) * 100, 1), 'dispersion_pct': round(float(spread), 2),
+            'volatility_pct': round(float(volatility), 2), 'high_risk_markets': int(high),
+            'overall_risk': risk['overall_risk'], 'market_stability': risk['market_stability'],
+            'market_health': indicators['market_health'], 'inflation_pressure': indicators['inflation_pressure'],
+            'demand_growth': indicators['demand_growth'],
+        })
+
+    market_index = relative.mean(axis=0) * 100
+    market_volatility = volatility_pct.mean(axis=0)
+    risk_score = codes.mean(axis=0)
+    markets = tuple(sorted((
+        {'market': market.key, 'region': market.region, 'price_index': round(float(market_index[market.id]), 1),
+         'volatility_pct': round(float(market_volatility[market.id]), 2),
+         'risk_score': round(float(risk_score[market.id]), 3),
+         'risk': RISK_LEVELS[int(codes[:, market.id].max())],
+         'high_risk_products': int(high_risk[:, market.id].sum())}
+        for market in MARKETS_BY_ID), key=lambda row: (-row['risk_score'], -row['volatility_pct'])))
+
+    # Markets without a region (farm gate) are left out of regional indices
+    regions = sorted({market.region for market in MARKETS_BY_ID if market.region})
+    membership = np.array([[market.region == region for region in regions] for market in MARKETS_BY_ID], dtype=float)
+    counts = membership.sum(axis=0)
+    region_index = market_index @ membership / counts
+    region_volatility = market_volatility @ membership / counts
+    regions = tuple(
+        {'region': region, 'markets': int(count), 'price_index': round(float(index), 1),
+         'volatility_pct': round(float(volatility), 2)}
+        for region, count, index, volatility in zip(regions, counts, region_index, region_volatility))
+
+    heatmap = tuple(
+        dict(zip(TABLE_FIELDS['heatmap'], [product.key] + _round(volatility_pct[product.id])))
+        for product in PRODUCTS_BY_ID)
+
+    national_multiplier = float(price_index.mean())
+    indicators = generate_economic_indicators(national_multiplier, DEFAULT_PRODUCT)
+    summary = {
+        'price_index': round(national_multiplier * 100, 1),
+        'volatility_pct': round(float(volatility_pct.mean()), 2),
+        'high_risk_share': round(float(high_risk.mean()), 3),
+        'market_health': indicators['market_health'],
+        'inflation_pressure': indicators['inflation_pressure'],
+        'demand_growth': indicators['demand_growth'],
+        'market_efficiency': indicators['market_efficiency'],
+    }
+    return summary, {'cells': cells, 'products': tuple(products), 'markets': markets,
+                     'regions': regions, 'heatmap': heatmap}
+
+
+def parse_fields(table, value):
+    """Requested columns of a table, in table order; raises ValueError for unknown columns"""
+    fields = TABLE_FIELDS[table]
+    if not value:
+        return fields
+    wanted = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = wanted.difference(fields)
+    if unknown:
+        raise ValueError(f"Unknown fields for {table}: {', '.join(sorted(unknown))}")
+    return tuple(field for field in fields if field in wanted)
+
+
+class MarketOverview:
+    """Incrementally materialized national analytics"""
+
+    def __init__(self):
+        n_products, n_markets = len(PRODUCTS_BY_ID), len(MARKETS_BY_ID)
+        self._prices = np.empty((n_products, n_markets))
+        self._multipliers = np.empty((n_products, n_markets))
+        self._volatilities = np.empty((n_products, n_markets))
+        self._national = np.empty(n_products)
+        self._seen_data_version = None
+        self._built = False
+        self._summary = None
+        self._tables = None
+        # Bumped every time tables change, so serialized pages can be cached per generation
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def _update_rows(self, products):
+        for product in products:
+            (self._prices[product.id], self._multipliers[product.id],
+             self._volatilities[product.id], self._national[product.id]) = product_row(product)
+        self._summary, self._tables = build_tables(self._prices, self._multipliers, self._volatilities,
+                                                   self._national)
+        self.generation += 1
+
+    def on_observations(self, series):
+        """price_store listener: recompute only the products just written"""
+        touched = {product for product, _ in series}
+        with self._lock:
+            if not self._built:
+                return
+            products = [product for product in PRODUCTS_BY_ID if product.key in touched]
+            if products:
+                self._update_rows(products)
+            self._seen_data_version = price_store.data_version()
+
+    def catch_up(self):
+        """Rebuild every row if this is the first read or another process has written observations"""
+        version = price_store.data_version()
+        if self._built and version == self._seen_data_version:
+            return
+        with self._lock:
+            if self._built and version == self._seen_data_version:
+                return
+            self._update_rows(PRODUCTS_BY_ID)
+            self._built = True
+            self._seen_data_version = version
+
+    def summary(self):
+        """National aggregates, regional indices and the highest-risk markets"""
+        self.catch_up()
+        tables = self._tables
+        return {
+            'national': self._summary,
+            'regional_indices': list(tables['regions']),
+            'highest_risk_markets': [
+                {field: row[field] for field in ('market', 'region', 'risk', 'risk_score')}
+                for row in tables['markets'][:TOP_RISK_MARKETS]],
+            'tables': {name: {'rows': len(rows), 'fields': list(TABLE_FIELDS[name])} for name, rows in tables.items()},
+        }
+
+    def page(self, table, fields, offset=0, limit=DEFAULT_PAGE_SIZE):
+        """One page of a table with only the requested fields"""
+        self.catch_up()
+        rows = self._tables[table]
+        return {
+            'table': table,
+            'total': len(rows),
+            'offset': offset,
+            'limit': limit,
+            'fields': list(fields),
+            'rows': [{field: row[field] for field in fields} for row in rows[offset:offset + limit]],
+        }
@@ -1,17 +1,49 @@
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for, flash
+from flask import Flask, Response, request, jsonify, render_template, session, redirect, url_for, flash
 from flask_cors import CORS
+import hmac
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
 import re
 import json
+import threading
 from functools import wraps
+from market_analysis import generate_smart_fallback, analyze_batch, normalize_key, lookup_analysis
+from market_ranking import rank_markets, find_arbitrage
+from routing import quantity_bucket, quantity_error
+from scenarios import DEFAULT_HORIZON_DAYS, MAX_HORIZON_DAYS
+from role_rules import LANGUAGES
+import translation_cache
+from llm_gateway import create_gateway
+import llm_model
+from user_store import UserStore
+from history_store import MAX_QUANTITY_LENGTH, HistoryStore, normalize_quantity
+import metrics
+import precompute
+import assets
+import price_store
+from price_store import data_version
+from response_cache import LRUCache, cached_page, analysis_cache, json_body, conditional_response
+from alert_engine import AlertEngine, parse_rule
+from price_stream import PricePublisher, RESYNC, parse_pairs
+from sync_snapshot import SnapshotBuilder
+from analytics import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, TABLE_FIELDS, MarketOverview, parse_fields
+import sse
 
 load_dotenv()
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)  # For session management
+# Sessions are signed cookies, so every worker must share the same key
+app.secret_key = os.getenv('SECRET_KEY') or os.urandom(24)
+if not os.getenv('SECRET_KEY'):
+    print("Warning: SECRET_KEY not set; sessions will not survive restarts or span multiple workers")
 CORS(app)
+metrics.init_app(app)
+# Precompute progress lives in its job table, shared with the worker processes
+metrics.REGISTRY.add_collector(precompute.collect_metrics)
+assets.init_app(app)
+
+# Persistent translation cache shared by /translate-text and /translate-text/batch
+translations_cache = translation_cache.TranslationCache()
 
 # Translation dictionaries
 TRANSLATIONS = {
@@ -87,66 +119,106 @@ def get_translation(key, lang='en'):
 
 def translate_text_with_gemini(text, target_lang):
     """Translate text using Gemini API"""
-    if not model or target_lang == 'en':
+    if not llm or target_lang == 'en':
         return text
 
     try:
-        lang_map = {'am': 'Amharic', 'en': 'English'}
-        target_language = lang_map.get(target_lang, 'English')
+        return translation_cache.translate(text, target_lang, llm, translations_cache)
+    except Exception as e:
+        print(f"Translation error: {e}")
+        return text  # Return original text if translation fails
+
 
-        prompt = f"Translate the following text to {target_language}. Only return the translated text, no explanations:\n\n{text}"
+def translate_texts_with_gemini(texts, target_lang):
+    """Translate many texts with as few Gemini calls as possible"""
+    if not llm or target_lang == 'en':
+        return list(texts)
 
-        response = model.generate_content(prompt)
-        return response.text.strip()
+    try:
+        return translation_cache.translate_batch(texts, target_lang, llm, translations_cache)
     except Exception as e:
         print(f"Translation error: {e}")
-        return text  # Return original text if translation fails
+        return list(texts)  # Return original texts if translation fails
 
 
-# Configure Gemini API
-try:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        print("Warning: GEMINI_API_KEY not found in environment variables")
-        model = None
-    else:
-        genai.configure(api_key=api_key)
-        # Use the most basic model name that should work
-        try:
-            model = genai.GenerativeModel('gemini-pro-latest')
-            print("Using model: gemini-pro-latest")
-        except:
-            try:
-                model = genai.GenerativeModel('gemini-pro')
-                print("Using model: gemini-pro")
-            except:
-                try:
-                    model = genai.GenerativeModel('text-bison-001')
-                    print("Using model: text-bison-001")
-                except:
-                    model = None
-                    print("Could not initialize any Gemini model")
-
-        if model:
-            print("Gemini API configured successfully")
-except Exception as e:
-    print(f"Warning: Gemini API not configured - {e}")
-    model = None
-
-# Simple user database (in production, use a real database)
-users = {}
+# All model calls go through the gateway for deadlines, concurrency limits and coalescing.
+# The Gemini SDK is imported and the model chosen on first use, or by llm_model.warm_up()
+llm = create_gateway()
+
+# User database shared by all worker processes
+users = UserStore()
+
+# Per-user analysis log and running aggregates, shared by all worker processes
+history = HistoryStore()
+
+# Analyses from a user's most recent (product, market) pairs computed ahead at login
+WARM_ANALYSES = 8
+
+# Alert rules are re-checked whenever observations are written in this process
+alert_engine = AlertEngine()
+price_store.add_listener(alert_engine.on_observations)
+
+# One publisher computes live prices per tick for every /stream/prices client
+price_publisher = PricePublisher()
+
+# National analytics are recomputed per product as observations arrive
+market_overview = MarketOverview()
+price_store.add_listener(market_overview.on_observations)
+
+# Serialized /analytics/overview pages per (generation, table, fields, offset, limit)
+overview_cache = LRUCache(256)
+
+# Offline snapshots for the mobile page, built once per price data version
+snapshots = SnapshotBuilder()
+
+# Serialized /sync responses per (client version, current version)
+sync_cache = LRUCache(64)
 
 
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        user = users.get(session['user_id']) if 'user_id' in session else None
+        if user is None:
+            session.pop('user_id', None)
+            session.pop('user_role', None)
             flash('Please log in to access this page', 'warning')
             return redirect(url_for('auth'))
+        # The stored role wins, so a role set in another session reaches this one
+        if user['role'] and session.get('user_role') != user['role']:
+            session['user_role'] = user['role']
         return f(*args, **kwargs)
     return decorated_function
 
 
+def start_session(user):
+    """Log a user in, keeping the role they chose before"""
+    session['user_id'] = user['user_id']
+    session.pop('user_role', None)
+    if user['role']:
+        session['user_role'] = user['role']
+    threading.Thread(target=warm_analysis_cache, args=(user['user_id'],), name='warm-analyses', daemon=True).start()
+
+
+def analysis_cache_key(key, quantity, horizon, lang):
+    """analysis_cache key for a normalized (role, product, market) request at the current price data"""
+    return key, normalize_quantity(quantity), horizon, lang, data_version()
+
+
+def warm_analysis_cache(user_id):
+    """Compute the analyses a user asked for last into the shared analysis cache"""
+    try:
+        with app.app_context():
+            for series in history.series(user_id, WARM_ANALYSES):
+                key = normalize_key(series['role'], series['product'], series['market'])
+                cache_key = analysis_cache_key(key, series['quantity'], series['horizon'], series['lang'])
+                if analysis_cache.get(cache_key) is None:
+                    result = generate_smart_fallback(*key, series['quantity'], series['horizon'], series['lang'])
+                    analysis_cache.put(cache_key, json_body(result))
+    except Exception as e:
+        print(f"Warning: could not warm analyses for user: {e}")
+
+
 @app.route('/')
 def index():
     """Landing page"""
@@ -176,6 +248,33 @@ def translate_text():
     return jsonify({'translated_text': translated})
 
 
+# Upper bounds on texts per batch translation request and characters per text
+MAX_TRANSLATE_TEXTS = 200
+MAX_TRANSLATE_LENGTH = 2000
+
+
+@app.route('/translate-text/batch', methods=['POST'])
+@login_required
+def translate_text_batch():
+    """Translate many texts in one request"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    texts = data.get('texts')
+    target_lang = data.get('target_lang', 'en')
+
+    if not isinstance(texts, list) or not texts or not all(isinstance(text, str) for text in texts):
+        return jsonify({'error': 'No texts provided'}), 400
+    if len(texts) > MAX_TRANSLATE_TEXTS:
+        return jsonify({'error': f'Too many texts (max {MAX_TRANSLATE_TEXTS})'}), 400
+    if any(len(text) > MAX_TRANSLATE_LENGTH for text in texts):
+        return jsonify({'error': f'Text too long (max {MAX_TRANSLATE_LENGTH} characters)'}), 400
+    if target_lang not in LANGUAGES:
+        return jsonify({'error': f"target_lang must be one of {', '.join(LANGUAGES)}"}), 400
+
+    return jsonify({'translated_texts': translate_texts_with_gemini(texts, target_lang)})
+
+
 @app.route('/auth')
 def auth():
     """Authentication page"""
@@ -191,12 +290,7 @@ def login():
 
     # Simple validation (in production, use proper authentication)
     if email and password:
-        user_id = str(hash(email))  # Simple user identification
-        users[user_id] = {
-            'email': email,
-            'role': None  # Will be set after role selection
-        }
-        session['user_id'] = user_id
+        start_session(users.get_or_create(email))
         flash('Login successful! Please select your role.', 'success')
         return redirect(url_for('role_selection'))
     else:
@@ -219,13 +313,11 @@ def signup():
         flash('Passwords do not match', 'error')
         return redirect(url_for('auth'))
 
-    # Create new user
-    user_id = str(hash(email))
-    users[user_id] = {
-        'email': email,
-        'role': None
-    }
-    session['user_id'] = user_id
+    user = users.create(email)
+    if user is None:
+        flash('An account with this email already exists. Please log in.', 'error')
+        return redirect(url_for('auth'))
+    start_session(user)
     flash('Account created successfully! Please select your role.', 'success')
     return redirect(url_for('role_selection'))
 
@@ -244,8 +336,7 @@ def set_role():
     role = request.form.get('role')
     if role in ['farmer', 'trader', 'business', 'consumer', 'cooperative', 'government']:
         user_id = session['user_id']
-        if user_id in users:
-            users[user_id]['role'] = role
+        if users.set_role(user_id, role):
             session['user_role'] = role
             flash(f'Role set as {role}', 'success')
             return redirect(url_for('dashboard'))
@@ -256,6 +347,7 @@ def set_role():
 
 @app.route('/dashboard')
 @login_required
+@cached_page
 def dashboard():
     """Main dashboard"""
     user_role = session.get('user_role', 'farmer')
@@ -265,14 +357,29 @@ def dashboard():
 
 @app.route('/analysis')
 @login_required
+@cached_page
 def analysis():
     """Analysis page"""
     user_role = session.get('user_role', 'farmer')
     return render_template('analysis.html', user_role=user_role)
 
 
+@app.route('/analysis/history')
+@login_required
+def analysis_history():
+    """The user's recent analyses, per-market summaries and most-queried products"""
+    user_id = session['user_id']
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    return jsonify({
+        'recent': history.recent(user_id, limit),
+        'markets': history.series(user_id, limit),
+        'products': history.top_products(user_id),
+    })
+
+
 @app.route('/alerts')
 @login_required
+@cached_page
 def alerts():
     """Alerts page"""
     user_role = session.get('user_role', 'farmer')
@@ -281,12 +388,35 @@ def alerts():
 
 @app.route('/mobile')
 @login_required
+@cached_page
 def mobile():
     """Mobile access page"""
     return render_template('mobile.html')
 
 
+@app.route('/sync')
+@login_required
+def sync():
+    """Offline snapshot for the mobile page, or the changes since the client's version"""
+    since = request.args.get('since', '').strip()
+    snapshot = snapshots.current()
+    cached = sync_cache.get((since, snapshot['version']))
+    if cached is None:
+        delta = snapshots.delta(since) if since else None
+        if delta is not None:
+            cached = json_body(delta)
+            sync_cache.put((since, snapshot['version']), cached)
+        else:
+            # Clients with no version or an expired one all share the full snapshot body
+            cached = sync_cache.get(('', snapshot['version']))
+            if cached is None:
+                cached = json_body(dict(snapshot, type='snapshot'))
+                sync_cache.put(('', snapshot['version']), cached)
+    return conditional_response(cached, 'private, no-cache')
+
+
 @app.route('/about')
+@cached_page
 def about():
     """About page"""
     return render_template('about.html')
@@ -312,340 +442,278 @@ def analyze_market():
         product = data.get('product', '')
         market = data.get('market', '')
         quantity = data.get('quantity', '')
+        lang = data.get('lang') or session.get('language', 'en')
 
         if not all([user_role, product, market]):
             return jsonify({'error': 'Missing required fields'}), 400
+        if not all(isinstance(value, str) for value in (user_role, product, market)):
+            return jsonify({'error': 'role, product and market must be strings'}), 400
+
+        try:
+            horizon = int(data.get('horizon_days') or DEFAULT_HORIZON_DAYS)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'horizon_days must be a whole number of days'}), 400
+        if not 1 <= horizon <= MAX_HORIZON_DAYS:
+            return jsonify({'error': f'horizon_days must be between 1 and {MAX_HORIZON_DAYS}'}), 400
+        if lang not in LANGUAGES:
+            return jsonify({'error': f"lang must be one of {', '.join(LANGUAGES)}"}), 400
+        # Longer text would be cut when stored, and warm a different analysis than the one asked for
+        if len(str(quantity).strip()) > MAX_QUANTITY_LENGTH:
+            return jsonify({'error': f'quantity must be at most {MAX_QUANTITY_LENGTH} characters'}), 400
+        error = quantity_error(quantity)
+        if error:
+            return jsonify({'error': error}), 400
+
+        # Identical requests reuse the serialized result until price data changes
+        key = normalize_key(user_role, product, market)
+        cache_key = analysis_cache_key(key, quantity, horizon, lang)
+        cached = analysis_cache.get(cache_key)
+        if cached is None:
+            # Smart fallback analysis (works without Gemini API)
+            result = generate_smart_fallback(user_role, product, market, quantity, horizon, lang)
+            cached = json_body(result)
+            analysis_cache.put(cache_key, cached)
 
-        # Smart fallback analysis (works without Gemini API)
-        result = generate_smart_fallback(user_role, product, market, quantity)
-        return jsonify(result)
+        try:
+            history.record(session['user_id'], key, quantity, horizon, lang, lookup_analysis(*key))
+        except Exception as e:
+            print(f"Warning: could not record analysis history: {e}")
+        return conditional_response(cached, 'private, no-cache')
 
     except Exception as e:
         return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
 
 
-def generate_smart_fallback(user_role, product, market, quantity):
-    """Generate intelligent market analysis without AI"""
-
-    # Product-specific price ranges (ETB per kg for crops, ETB per animal for livestock)
-    price_ranges = {
-        'teff': {'min': 45, 'max': 85, 'avg': 65},
-        'coffee': {'min': 120, 'max': 280, 'avg': 200},
-        'maize': {'min': 15, 'max': 35, 'avg': 25},
-        'wheat': {'min': 20, 'max': 40, 'avg': 30},
-        'sorghum': {'min': 18, 'max': 38, 'avg': 28},
-        'beans': {'min': 25, 'max': 55, 'avg': 40},
-        'lentils': {'min': 30, 'max': 60, 'avg': 45},
-        'vegetables': {'min': 8, 'max': 25, 'avg': 15},
-        'fruits': {'min': 12, 'max': 40, 'avg': 25},
-        'livestock': {'min': 3000, 'max': 8000, 'avg': 5500},
-        # Average cow/ox price in ETB
-        'cattle': {'min': 15000, 'max': 35000, 'avg': 25000},
-        # Average goat price in ETB
-        'goats': {'min': 2500, 'max': 6000, 'avg': 4000},
-        # Average sheep price in ETB
-        'sheep': {'min': 2000, 'max': 5000, 'avg': 3200},
-        # Average chicken price in ETB
-        'chickens': {'min': 300, 'max': 800, 'avg': 500},
-        # Average camel price in ETB
-        'camels': {'min': 25000, 'max': 60000, 'avg': 40000},
-        # Average bee colony with honey in ETB
-        'bees_honey': {'min': 800, 'max': 2000, 'avg': 1200}
-    }
-
-    # Market-specific multipliers
-    market_multipliers = {
-        'addis-ababa': 1.2,
-        'mekelle': 1.1,
-        'gondar': 1.0,
-        'bahirdar': 1.05,
-        'hawassa': 0.95,
-        'jimma': 0.9,
-        'dire-dawa': 1.15,
-        'adama': 1.0,
-        'shashemene': 0.85,
-        'local': 0.8
-    }
-
-    # Get base price for product
-    product_info = price_ranges.get(
-        product.lower(), {'min': 20, 'max': 50, 'avg': 35, 'category': 'general', 'seasonality': 'standard market patterns', 'demand': 'moderate demand', 'perishability': 'standard', 'storage': 'standard storage requirements'})
-    base_price = product_info['avg']
-
-    # Apply market multiplier
-    multiplier = market_multipliers.get(market.lower(), 1.0)
-    estimated_price = int(base_price * multiplier)
-
-    # Create market_info structure for detailed insights
-    market_info = {
-        'multiplier': multiplier,
-        'characteristics': f"{market.title()} market",
-        'infrastructure': 'standard infrastructure',
-        'buyer_types': 'general buyers',
-        'price_sensitivity': 'moderate price sensitivity',
-        'competition': 'moderate competition'
-    }
-
-    # Role-specific recommendations
-    role_recommendations = {
-        'farmer': {
-            'recommendation': 'Sell Immediately' if multiplier >= 1.15 else 'Sell This Week' if multiplier >= 1.05 else 'Wait 2-3 Weeks' if multiplier >= 0.95 else 'Hold for Better Prices',
-            'reasoning': f"As a farmer, {market.title()} offers {'excellent prices' if multiplier >= 1.15 else 'good prices' if multiplier >= 1.05 else 'fair prices' if multiplier >= 0.95 else 'below average prices'} for your {product}. Consider seasonal factors and market competition."
-        },
-        'trader': {
-            'recommendation': 'Buy Now - Bulk Discount Available' if multiplier <= 0.9 else 'Buy and Hold for Price Increase' if multiplier <= 1.0 else 'Wait for Better Supply' if multiplier <= 1.1 else 'Seek Alternative Markets',
-            'reasoning': f"As a trader, {market.title()} presents {'excellent buying opportunity' if multiplier <= 0.9 else 'good opportunity' if multiplier <= 1.0 else 'moderate opportunity' if multiplier <= 1.1 else 'challenging conditions'} for {product}. Consider transport costs and market competition."
-        },
-        'business': {
-            'recommendation': 'Bulk Purchase Now' if multiplier <= 0.85 else 'Negotiate Volume Discount' if multiplier <= 0.95 else 'Standard Purchase' if multiplier <= 1.05 else 'Seek Alternatives or Reduce Usage',
-            'reasoning': f"For your business, {market.title()} offers {'cost-effective procurement' if multiplier <= 0.85 else 'reasonable pricing' if multiplier <= 0.95 else 'market rates' if multiplier <= 1.05 else 'premium pricing'} for {product}. Consider supply chain reliability and quality consistency."
-        },
-        'consumer': {
-            'recommendation': 'Buy Now - Good Value' if multiplier <= 0.85 else 'Standard Purchase' if multiplier <= 0.95 else 'Wait for Sales or Alternatives' if multiplier <= 1.05 else 'Consider Substitutes or Reduce Consumption',
-            'reasoning': f"As a consumer, {product} prices in {market.title()} are {'excellent value' if multiplier <= 0.85 else 'fair' if multiplier <= 0.95 else 'above average' if multiplier <= 1.05 else 'expensive'}. Consider quality vs price and seasonal availability."
-        },
-        'cooperative': {
-            'recommendation': 'Organize Group Sale Immediately' if multiplier >= 1.15 else 'Coordinate Group Sale This Week' if multiplier >= 1.05 else 'Pool Resources for Better Timing' if multiplier >= 0.95 else 'Collective Bargaining for Future Sale',
-            'reasoning': f"Your cooperative can leverage collective bargaining power in {market.title()}. Current conditions {'favor immediate group action' if multiplier >= 1.15 else 'support coordinated selling' if multiplier >= 1.05 else 'require strategic timing' if multiplier >= 0.95 else 'suggest waiting for better conditions'} for {product}."
-        },
-        'government': {
-            'recommendation': 'Monitor Market Stability' if multiplier <= 1.1 else 'Investigate Price Volatility' if multiplier <= 1.2 else 'Implement Market Intervention Measures',
-            'reasoning': f"Market analysis for {product} in {market.title()} shows {'stable conditions' if multiplier <= 1.1 else 'moderate volatility' if multiplier <= 1.2 else 'high volatility'}. Monitor supply chain factors and market efficiency impacts."
-        }
-    }
-
-    # Enhanced trend analysis based on market and product
-    if multiplier >= 1.15:
-        trend = 'Rising Rapidly'
-        confidence = 'High'
-    elif multiplier >= 1.05:
-        trend = 'Rising'
-        confidence = 'High'
-    elif multiplier <= 0.85:
-        trend = 'Falling'
-        confidence = 'Medium'
-    elif multiplier <= 0.95:
-        trend = 'Stable to Falling'
-        confidence = 'Medium'
-    else:
-        trend = 'Stable'
-        confidence = 'High'
-
-    # Get role-specific recommendation
-    role_info = role_recommendations.get(
-        user_role, role_recommendations['farmer'])
-    recommendation = role_info['recommendation']
-
-    # Find best alternative market
-    best_market = max(market_multipliers.keys(),
-                      key=lambda k: market_multipliers[k])
-
-    return {
-        'recommendation': role_info['recommendation'],
-        'best_market': best_market.replace('-', ' ').title(),
-        'trend': trend,
-        'reasoning': role_info['reasoning'],
-        'confidence': confidence,
-        'estimated_price': f'{estimated_price} ETB/kg' if product.lower() not in ['cattle', 'goats', 'sheep', 'chickens', 'camels', 'bees_honey'] else f'{estimated_price} ETB per animal',
-        'detailed_insights': {
-            'price_forecast': generate_price_forecast(product, market, multiplier, product_info),
-            'market_analysis': generate_market_analysis(market, market_info, multiplier),
-            'risk_assessment': generate_risk_assessment(multiplier, product_info, market_info),
-            'opportunity_score': calculate_opportunity_score(multiplier, product_info, market_info),
-            'seasonal_impact': analyze_seasonal_impact(product, product_info),
-            'competitor_analysis': generate_competitor_analysis(market, market_info),
-            'economic_indicators': generate_economic_indicators(multiplier, product_info),
-            'action_timeline': generate_action_timeline(recommendation, multiplier)
-        }
-    }
-
-
-def generate_price_forecast(product, market, multiplier, product_info):
-    """Generate detailed price forecast"""
-    base_price = product_info['avg']  # Direct access to avg price
-
-    # Calculate 30-day forecast
-    if multiplier >= 1.15:
-        forecast_trend = "Strong upward trajectory expected"
-        next_week = int(base_price * multiplier * 1.05)
-        next_month = int(base_price * multiplier * 1.12)
-    elif multiplier >= 1.05:
-        forecast_trend = "Moderate growth projected"
-        next_week = int(base_price * multiplier * 1.02)
-        next_month = int(base_price * multiplier * 1.06)
-    elif multiplier <= 0.85:
-        forecast_trend = "Declining trend anticipated"
-        next_week = int(base_price * multiplier * 0.95)
-        next_month = int(base_price * multiplier * 0.88)
-    else:
-        forecast_trend = "Stable prices expected"
-        next_week = int(base_price * multiplier)
-        next_month = int(base_price * multiplier)
-
-    return {
-        'current_price': int(base_price * multiplier),
-        'next_week': next_week,
-        'next_month': next_month,
-        'trend': forecast_trend,
-        'volatility': 'High' if multiplier >= 1.15 or multiplier <= 0.85 else 'Medium' if multiplier >= 1.1 or multiplier <= 0.9 else 'Low'
-    }
+# Upper bound on items per batch request (16 products x 10 markets x 6 roles)
+MAX_BATCH_ITEMS = 960
 
 
-def generate_market_analysis(market, market_info, multiplier):
-    """Generate detailed market analysis"""
-    return {
-        'market_strength': 'Strong' if multiplier >= 1.1 else 'Moderate' if multiplier >= 0.95 else 'Weak',
-        'buyer_behavior': 'Aggressive purchasing' if multiplier >= 1.1 else 'Selective buying' if multiplier >= 0.95 else 'Cautious approach',
-        'supply_level': 'Limited supply' if multiplier >= 1.1 else 'Adequate supply' if multiplier >= 0.95 else 'Excess supply',
-        'market_competition': 'High competition' if market_info['multiplier'] >= 1.1 else 'Moderate competition' if market_info['multiplier'] >= 0.95 else 'Low competition',
-        'infrastructure_quality': market_info['infrastructure'],
-        'market_reach': market_info['characteristics']
-    }
+@app.route('/analyze/batch', methods=['POST'])
+@login_required
+def analyze_market_batch():
+    """Analyze many product/market items in a single request"""
+    data = request.get_json(silent=True)
+    if isinstance(data, list):
+        data = {'items': data}
+    if not isinstance(data, dict) or not isinstance(data.get('items'), list):
+        return jsonify({'error': 'Expected a list of items'}), 400
 
+    items = data['items']
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({'error': f'Too many items (max {MAX_BATCH_ITEMS})'}), 400
 
-def generate_risk_assessment(multiplier, product_info, market_info):
-    """Generate comprehensive risk assessment"""
-    risk_factors = []
-    risk_level = 'Low'
-
-    if multiplier >= 1.15:
-        risk_factors.append("Price correction risk due to rapid increase")
-        risk_level = 'Medium'
-    elif multiplier <= 0.85:
-        risk_factors.append("Market oversupply risk")
-        risk_level = 'High'
-
-    if product_info.get('perishability') == 'highly perishable':
-        risk_factors.append("High perishability risk")
-        risk_level = 'High' if risk_level != 'High' else 'Very High'
-
-    if market_info['multiplier'] < 1.0:
-        risk_factors.append("Limited market access")
-
-    return {
-        'overall_risk': risk_level,
-        'risk_factors': risk_factors,
-        'mitigation_strategies': [
-            "Diversify market outlets",
-            "Monitor price trends daily",
-            "Consider storage options",
-            "Build buyer relationships"
-        ],
-        'market_stability': 'Stable' if 0.9 <= multiplier <= 1.1 else 'Unstable'
-    }
+    default_role = session.get('user_role', 'farmer')
+    results = analyze_batch(items, default_role)
 
+    # Stream one JSON document per line so clients can render as results arrive
+    if data.get('stream') or request.args.get('format') == 'ndjson':
+        def generate():
+            for entry in results:
+                yield json.dumps(entry) + '\n'
+        return Response(generate(), mimetype='application/x-ndjson')
 
-def calculate_opportunity_score(multiplier, product_info, market_info):
-    """Calculate market opportunity score (0-100)"""
-    base_score = 50
+    return jsonify({'results': list(results)})
 
-    # Price momentum score
-    if multiplier >= 1.15:
-        price_score = 25
-    elif multiplier >= 1.05:
-        price_score = 15
-    elif multiplier <= 0.85:
-        price_score = -10
-    else:
-        price_score = 0
 
-    # Market quality score
-    market_score = 10 if market_info['multiplier'] >= 1.1 else 5 if market_info['multiplier'] >= 0.95 else -5
+@app.route('/markets/rank')
+@login_required
+def markets_rank():
+    """Top markets for a product, ranked for buying or selling"""
+    product = request.args.get('product', '').strip().lower()
+    user_role = request.args.get('role', session.get('user_role', 'farmer'))
+    origin = request.args.get('origin', '').strip().lower() or None
+    side = request.args.get('side')
+    n = request.args.get('n', 5, type=int)
+    quantity = request.args.get('quantity')
+
+    if side not in (None, 'buy', 'sell'):
+        return jsonify({'error': 'side must be buy or sell'}), 400
+    error = quantity_error(quantity)
+    if error:
+        return jsonify({'error': error}), 400
+    bucket = quantity_bucket(product, quantity)
+
+    markets = rank_markets(product, user_role, n, origin, side, bucket)
+    if markets is None:
+        return jsonify({'error': 'Unknown product or origin market'}), 404
+    return jsonify({'product': product, 'role': user_role, 'markets': markets})
+
+
+@app.route('/markets/arbitrage')
+@login_required
+def markets_arbitrage():
+    """Most profitable buy/sell market pairs for a product"""
+    product = request.args.get('product', '').strip().lower()
+    n = request.args.get('n', 5, type=int)
 
-    # Product demand score
-    demand_score = 10 if product_info.get(
-        'demand') == 'high demand' else 5 if product_info.get('demand') == 'stable demand' else 0
+    opportunities = find_arbitrage(product, n)
+    if opportunities is None:
+        return jsonify({'error': 'Unknown product'}), 404
+    return jsonify({'product': product, 'opportunities': opportunities})
 
-    total_score = base_score + price_score + market_score + demand_score
-    return max(0, min(100, total_score))
 
+@app.route('/analytics/overview')
+@login_required
+def analytics_overview():
+    """National aggregates for government users, or one page of an analytics table"""
+    if session.get('user_role') != 'government':
+        return jsonify({'error': 'Analytics are available in government mode'}), 403
+
+    table = request.args.get('table')
+    if table is not None and table not in TABLE_FIELDS:
+        return jsonify({'error': f"table must be one of {', '.join(TABLE_FIELDS)}"}), 400
+    try:
+        fields = parse_fields(table, request.args.get('fields')) if table else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = max(0, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+
+    market_overview.catch_up()
+    key = (market_overview.generation, table, fields, offset, limit)
+    cached = overview_cache.get(key)
+    if cached is None:
+        result = market_overview.page(table, fields, offset, limit) if table else market_overview.summary()
+        cached = json_body(result)
+        overview_cache.put(key, cached)
+    return conditional_response(cached, 'private, no-cache')
+
+
+@app.route('/alerts/rules', methods=['GET', 'POST'])
+@login_required
+def alert_rules():
+    """List or subscribe the user's alert rules"""
+    user_id = session['user_id']
+    if request.method == 'GET':
+        return jsonify({'rules': alert_engine.rules(user_id)})
 
-def analyze_seasonal_impact(product, product_info):
-    """Analyze seasonal impact on product"""
-    seasonal_factors = product_info.get(
-        'seasonality', 'Standard market patterns')
+    try:
+        rule, fired = alert_engine.add_rule(user_id, *parse_rule(request.get_json(silent=True) or {}))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'rule': rule, 'fired': fired}), 201
 
-    return {
-        'current_season': 'Peak season' if 'peak' in seasonal_factors.lower() else 'Growing season' if 'season' in seasonal_factors.lower() else 'Off-season',
-        'seasonal_trend': seasonal_factors,
-        'best_timing': product_info.get('seasonality', 'Year-round availability'),
-        'storage_impact': product_info.get('storage', 'Standard storage requirements')
-    }
 
+@app.route('/alerts/rules/<int:rule_id>', methods=['DELETE'])
+@login_required
+def delete_alert_rule(rule_id):
+    """Unsubscribe an alert rule"""
+    if not alert_engine.remove_rule(session['user_id'], rule_id):
+        return jsonify({'error': 'Unknown rule'}), 404
+    return jsonify({'deleted': rule_id})
 
-def generate_competitor_analysis(market, market_info):
-    """Generate competitor analysis"""
-    competition_level = market_info['competition']
-
-    return {
-        'competition_intensity': competition_level,
-        'market_saturation': 'High' if 'high' in competition_level.lower() else 'Medium' if 'moderate' in competition_level.lower() else 'Low',
-        'competitive_advantage': [
-            "Quality differentiation",
-            "Supply reliability",
-            "Price competitiveness",
-            "Market relationships"
-        ],
-        'barriers_to_entry': 'Low' if market_info['multiplier'] < 1.0 else 'Medium' if market_info['multiplier'] < 1.1 else 'High'
-    }
 
+@app.route('/alerts/events')
+@login_required
+def alert_events():
+    """Alerts fired for the user after the given event id"""
+    after = request.args.get('after', 0, type=int)
+    events = alert_engine.events(session['user_id'], after)
+    return jsonify({'events': events, 'last_id': events[-1]['id'] if events else after})
 
-def generate_economic_indicators(multiplier, product_info):
-    """Generate economic indicators"""
-    return {
-        'market_health': 'Excellent' if multiplier >= 1.15 else 'Good' if multiplier >= 1.05 else 'Fair' if multiplier >= 0.95 else 'Poor',
-        'inflation_pressure': 'High' if multiplier >= 1.1 else 'Moderate' if multiplier >= 0.95 else 'Low',
-        'demand_growth': 'Strong' if multiplier >= 1.1 else 'Moderate' if multiplier >= 0.95 else 'Weak',
-        'market_efficiency': 85 if multiplier >= 0.95 else 70,
-        'price_elasticity': 'Inelastic' if product_info.get('category') == 'cereal' else 'Elastic'
-    }
 
+@app.route('/alerts/stream')
+@login_required
+def alert_stream():
+    """Server-Sent Events stream of the user's alerts, resuming after Last-Event-ID"""
+    user_id = session['user_id']
+    after = sse.last_event_id(request)
+
+    def messages():
+        last = after
+        while True:
+            events = alert_engine.wait_for_events(user_id, last, sse.HEARTBEAT_INTERVAL)
+            if not events:
+                yield sse.HEARTBEAT
+            for event in events:
+                last = event['id']
+                yield sse.format_event(event, event='alert', event_id=last)
+    return sse.event_stream(messages(), 'alerts')
+
+
+@app.route('/stream/prices')
+@login_required
+def stream_prices():
+    """Server-Sent Events stream of price changes for ?pairs=product:market,..."""
+    pairs = request.args.get('pairs')
+    if pairs is None and request.args.get('product') and request.args.get('market'):
+        pairs = f"{request.args['product']}:{request.args['market']}"
+    try:
+        pairs = parse_pairs(pairs)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    after = sse.last_event_id(request, default=None)
 
-def generate_action_timeline(recommendation, multiplier):
-    """Generate detailed action timeline"""
-    if 'Immediately' in recommendation:
-        return {
-            'urgent_actions': ['Execute sale today', 'Contact buyers', 'Finalize logistics'],
-            'short_term': ['Monitor market reaction', 'Plan next transaction'],
-            'medium_term': ['Evaluate performance', 'Adjust strategy'],
-            'optimal_window': '24-48 hours'
-        }
-    elif 'This Week' in recommendation:
-        return {
-            'urgent_actions': ['Prepare for sale', 'Identify buyers', 'Quality check'],
-            'short_term': ['Execute within 3-5 days', 'Monitor price changes'],
-            'medium_term': ['Plan next cycle', 'Build relationships'],
-            'optimal_window': '3-7 days'
-        }
-    elif 'Wait' in recommendation:
-        return {
-            'urgent_actions': ['Monitor market trends', 'Prepare storage', 'Research alternatives'],
-            'short_term': ['Weekly price review', 'Market research'],
-            'medium_term': ['Strategic planning', 'Market expansion'],
-            'optimal_window': '2-4 weeks'
-        }
-    else:
-        return {
-            'urgent_actions': ['Market analysis', 'Risk assessment', 'Strategic planning'],
-            'short_term': ['Trend monitoring', 'Opportunity identification'],
-            'medium_term': ['Long-term positioning', 'Market development'],
-            'optimal_window': '4-8 weeks'
-        }
+    def messages():
+        subscriber = price_publisher.subscribe(pairs)
+        try:
+            replayed = price_publisher.replay(pairs, after) if after is not None else None
+            if replayed is None:
+                last, snapshot = price_publisher.snapshot(pairs)
+                yield sse.format_event(snapshot, event='snapshot', event_id=last)
+            else:
+                last = after
+                for event_id, changes in replayed:
+                    last = event_id
+                    yield sse.format_event(changes, event='prices', event_id=event_id)
+            while True:
+                item = subscriber.next(sse.HEARTBEAT_INTERVAL)
+                if item is None:
+                    yield sse.HEARTBEAT
+                elif item is RESYNC:
+                    last, snapshot = price_publisher.snapshot(pairs)
+                    yield sse.format_event(snapshot, event='snapshot', event_id=last)
+                elif item[0] > last:
+                    last = item[0]
+                    yield sse.format_event(item[1], event='prices', event_id=last)
+        finally:
+            price_publisher.unsubscribe(subscriber)
+    return sse.event_stream(messages(), 'prices')
+
+
+# Most observations accepted by one POST /prices/observations
+MAX_OBSERVATIONS = 10000
+
+# Shared national price data can only be written by clients holding this token; unset disables the endpoint
+PRICE_INGEST_TOKEN = os.getenv('PRICE_INGEST_TOKEN', '')
+
+
+@app.route('/prices/observations', methods=['POST'])
+def add_price_observations():
+    """Record price observations and evaluate the alert rules they affect"""
+    if not PRICE_INGEST_TOKEN:
+        return jsonify({'error': 'Price ingest over HTTP is disabled'}), 403
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.strip(), PRICE_INGEST_TOKEN):
+        return jsonify({'error': 'A valid ingest token is required'}), 401
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('observations')
+    if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+        return jsonify({'error': 'Expected a list of observations'}), 400
+    if len(data) > MAX_OBSERVATIONS:
+        return jsonify({'error': f'Too many observations (max {MAX_OBSERVATIONS})'}), 400
+
+    inserted, skipped = price_store.add_observations(data)
+    return jsonify({'inserted': inserted, 'skipped': skipped})
 
 
 @app.route('/api/status')
 def api_status():
     """Check API status"""
     return jsonify({
-        'gemini_api': model is not None,
-        'users_count': len(users),
+        'gemini_api': llm is not None,
+        'gemini_model_loaded': llm_model.loaded() and llm_model.get_model() is not None,
+        'users_count': users.count(),
         'version': '1.0.0'
     })
 
 
 if __name__ == '__main__':
     print("Starting Market X Flask server...")
-    print("Gemini API Status:", "Connected" if model else "Not Connected")
+    print("Gemini API Status:", "Configured" if llm else "Not Connected")
+    llm_model.warm_up()
     print("Templates folder:", app.template_folder)
 
     # Check if templates folder exists
@@ -0,0 +1,213 @@
+"""Build-time asset pipeline for templates.
+
+    python assets.py build
+
+Inline <style> and <script> blocks are moved out of every template into
+minified, content-hashed files under static/dist/. Blocks that contain
+Jinja syntax stay inline. Each file is precompressed with gzip, and with
+brotli too when the optional brotli package is installed. The rewritten
+templates go to build/templates/. static/dist/manifest.json records each
+source template's hash, so a template edited after the last build is
+rendered from its source until the next build.
+
+init_app(app) serves files from static/dist/ in the best precompressed
+encoding the client accepts, with immutable cache headers (names change
+whenever content does). It also renders built templates in place of their
+sources.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+
+from flask import abort, request, send_from_directory
+from jinja2 import BaseLoader, ChoiceLoader, TemplateNotFound
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(ROOT, 'templates')
+STATIC_DIR = os.path.join(ROOT, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+BUILD_TEMPLATE_DIR = os.path.join(ROOT, 'build', 'templates')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+# Fingerprinted names never change content, so clients may keep them for a year
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# (file suffix, Content-Encoding) in order of preference
+ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+
+MIMETYPES = {'.css': 'text/css', '.js': 'text/javascript'}
+
+INLINE_BLOCK = re.compile(r'<(style|script)>(.*?)</\1>', re.S)
+STRING_LITERAL = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+
+
+def _minify_css_code(code):
+    code = re.sub(r'\s+', ' ', code)
+    code = re.sub(r'\s*([{};,>])\s*', r'\1', code)
+    return code.replace(': ', ':').replace(';}', '}')
+
+
+def minify_css(source):
+    """Drop comments and insignificant whitespace, leaving string literals untouched"""
+    parts = STRING_LITERAL.split(CSS_COMMENT.sub('', source))
+    # Odd parts are the string literals captured by the split
+    return ''.join(part if i % 2 else _minify_css_code(part) for i, part in enumerate(parts)).strip()
+
+
+def minify_js(source):
+    """Strip indentation, blank lines and whole-line // comments
+
+    Line breaks are kept so automatic semicolon insertion still applies.
+    """
+    lines = (line.strip() for line in source.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+def fingerprint(content):
+    return hashlib.sha1(content).hexdigest()[:10]
+
+
+def write_asset(name, ext, content):
+    """Write content and its precompressed variants as dist/<name>.<hash><ext>"""
+    filename = f'{name}.{fingerprint(content)}{ext}'
+    path = os.path.join(DIST_DIR, filename)
+    with open(path, 'wb') as f:
+        f.write(content)
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(content))
+    return filename
+
+
+def extract_inline_assets(name, source):
+    """Template source with inline CSS/JS replaced by links to built files"""
+    stem = os.path.splitext(name)[0]
+    counts = {}
+
+    def replace(match):
+        tag, body = match.group(1), match.group(2)
+        if '{{' in body or '{%' in body or '{#' in body:
+            return match.group(0)
+        ext = '.css' if tag == 'style' else '.js'
+        minified = minify_css(body) if tag == 'style' else minify_js(body)
+        index = counts[ext] = counts.get(ext, 0) + 1
+        filename = write_asset(stem if index == 1 else f'{stem}-{index}', ext, minified.encode('utf-8'))
+        href = "{{ url_for('dist_asset', filename='%s') }}" % filename
+        if tag == 'style':
+            return f'<link rel="stylesheet" href="{href}">'
+        return f'<script src="{href}"></script>'
+
+    return INLINE_BLOCK.sub(replace, source)
+
+
+def build():
+    """Build every template; returns the manifest"""
+    os.makedirs(DIST_DIR, exist_ok=True)
+    os.makedirs(BUILD_TEMPLATE_DIR, exist_ok=True)
+    for filename in os.listdir(DIST_DIR):
+        os.remove(os.path.join(DIST_DIR, filename))
+
+    manifest = {'templates': {}}
+    for name in sorted(os.listdir(TEMPLATE_DIR)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(TEMPLATE_DIR, name), 'rb') as f:
+            raw = f.read()
+        built = extract_inline_assets(name, raw.decode('utf-8'))
+        with open(os.path.join(BUILD_TEMPLATE_DIR, name), 'w', encoding='utf-8') as f:
+            f.write(built)
+        manifest['templates'][name] = hashlib.sha1(raw).hexdigest()
+
+    with open(MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'templates': {}}
+
+
+class BuiltTemplateLoader(BaseLoader):
+    """Loads built templates whose source has not changed since the build"""
+
+    def __init__(self, templates):
+        self.templates = templates
+
+    def get_source(self, environment, template):
+        expected = self.templates.get(template)
+        if expected is None:
+            raise TemplateNotFound(template)
+        source_path = os.path.join(TEMPLATE_DIR, template)
+        path = os.path.join(BUILD_TEMPLATE_DIR, template)
+        try:
+            with open(source_path, 'rb') as f:
+                if hashlib.sha1(f.read()).hexdigest() != expected:
+                    raise TemplateNotFound(template)
+            with open(path, encoding='utf-8') as f:
+                source = f.read()
+            mtimes = (os.path.getmtime(source_path), os.path.getmtime(path))
+        except OSError:
+            raise TemplateNotFound(template)
+
+        def uptodate():
+            try:
+                return (os.path.getmtime(source_path), os.path.getmtime(path)) == mtimes
+            except OSError:
+                return False
+        return source, path, uptodate
+
+
+def init_app(app):
+    """Serve built assets and render built templates when a build exists"""
+    manifest = load_manifest()
+    if manifest['templates']:
+        app.jinja_loader = ChoiceLoader([BuiltTemplateLoader(manifest['templates']), app.jinja_loader])
+    else:
+        print("Warning: assets not built; run 'python assets.py build' to serve compressed CSS/JS")
+
+    @app.route('/static/dist/<path:filename>')
+    def dist_asset(filename):
+        """Fingerprinted asset in the best precompressed encoding the client accepts"""
+        ext = os.path.splitext(filename)[1]
+        if ext not in MIMETYPES or not os.path.exists(os.path.join(DIST_DIR, filename)):
+            abort(404)
+        served, encoding = filename, None
+        for suffix, name in ENCODINGS:
+            if request.accept_encodings[name] and os.path.exists(os.path.join(DIST_DIR, filename + suffix)):
+                served, encoding = filename + suffix, name
+                break
+        response = send_from_directory(DIST_DIR, served, mimetype=MIMETYPES[ext])
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    return manifest
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['build']:
+        print('Usage: python assets.py build')
+        sys.exit(1)
+    result = build()
+    for filename in sorted(os.listdir(DIST_DIR)):
+        print(f'{os.path.getsize(os.path.join(DIST_DIR, filename)):8d}  static/dist/{filename}')
+    if brotli is None:
+        print('brotli not installed; only gzip variants were written')
+    print(f"Built {len(result['templates'])} templates into build/templates")
@@ -1,8 +1,17 @@
 from flask import Flask, request, jsonify, render_template
 from flask_cors import CORS
 import os
+import sys
 from dotenv import load_dotenv
-import google.generativeai as genai
+
+# Shared modules live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from market_analysis import generate_smart_fallback  # noqa: E402
+from llm_gateway import create_gateway, LLMUnavailable  # noqa: E402
+import llm_model  # noqa: E402
+from structured_analysis import StructuredAnalyzer, InvalidReply  # noqa: E402
+import metrics  # noqa: E402
 
 load_dotenv()
 
@@ -11,14 +20,14 @@ app = Flask(__name__,
                 os.path.dirname(__file__)), 'templates'),
             static_folder=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static'))
 CORS(app)
+metrics.init_app(app)
+
+# All model calls go through the gateway for deadlines, concurrency limits and coalescing.
+# The Gemini model is shared with the main app and loaded on first use
+llm = create_gateway()
 
-# Configure Gemini API
-try:
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-    model = genai.GenerativeModel('gemini-pro')
-except Exception as e:
-    print(f"Warning: Gemini API not configured - {e}")
-    model = None
+# Validated Gemini analyses, cached per (role, product, market, quantity bucket)
+analyzer = StructuredAnalyzer(llm) if llm is not None else None
 
 
 @app.route('/')
@@ -72,78 +81,26 @@ def analyze_market():
         if not all([user_role, product, market]):
             return jsonify({'error': 'Missing required fields'}), 400
 
-        if model is None:
-            # Fallback response when Gemini is not available
-            return jsonify({
-                'recommendation': 'Wait for better prices',
-                'best_market': market,
-                'trend': 'Stable',
-                'reasoning': 'AI service not available. Please check API configuration.',
-                'confidence': 'Low'
-            })
-
-        # Create tailored prompt based on user role
-        role_specific_prompts = {
-            'farmer': 'As a farmer in Ethiopia, you want to maximize your selling price.',
-            'trader': 'As a trader in Ethiopia, you want to buy low and sell efficiently.',
-            'business': 'As a small business owner in Ethiopia, you want to reduce costs and avoid price spikes.',
-            'consumer': 'As a consumer in Ethiopia, you want to buy essentials at the lowest cost.'
-        }
-
-        prompt = f"""
-        You are an AI market analyst for Ethiopian markets. {role_specific_prompts.get(user_role, '')}
-        
-        Market Analysis Request:
-        - Product: {product}
-        - Market/Location: {market}
-        - Quantity: {quantity}
-        - User Role: {user_role}
-        
-        Provide market intelligence in JSON format with these exact keys:
-        - recommendation: Clear action (e.g., "Sell Now", "Wait 3-5 days", "Buy Now", "Hold")
-        - best_market: Specific market recommendation
-        - trend: Price trend for next 7 days (Rising/Falling/Stable)
-        - reasoning: Brief explanation (2-3 sentences max)
-        - confidence: Confidence level (High/Medium/Low)
-        
-        Consider Ethiopian market conditions, seasonal factors, and typical supply/demand patterns.
-        Be practical and actionable. Keep responses concise.
-        """
-
-        response = model.generate_content(prompt)
-
-        # Parse the response
+        if analyzer is None:
+            # Rule-based analysis when Gemini is not available
+            metrics.ANALYSIS_FALLBACKS.inc('no_model')
+            return jsonify(generate_smart_fallback(user_role, product, market, quantity))
+
         try:
-            result_text = response.text
-            # Try to extract JSON from the response
-            import re
-            json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-            if json_match:
-                import json
-                result = json.loads(json_match.group())
-            else:
-                # Fallback if JSON parsing fails
-                result = {
-                    'recommendation': 'Wait for better information',
-                    'best_market': market,
-                    'trend': 'Stable',
-                    'reasoning': result_text[:200] + '...' if len(result_text) > 200 else result_text,
-                    'confidence': 'Medium'
-                }
-        except Exception as parse_error:
-            result = {
-                'recommendation': 'Consult local market',
-                'best_market': market,
-                'trend': 'Uncertain',
-                'reasoning': f'Analysis error: {str(parse_error)}',
-                'confidence': 'Low'
-            }
-
-        return jsonify(result)
+            result, cache_state = analyzer.analyze(user_role, product, market, quantity)
+        except (LLMUnavailable, InvalidReply) as e:
+            print(f"Gemini analysis unavailable, using rule-based analysis - {e}")
+            metrics.ANALYSIS_FALLBACKS.inc(type(e).__name__)
+            return jsonify(generate_smart_fallback(user_role, product, market, quantity))
+
+        response = jsonify(result)
+        response.headers['X-Analysis-Cache'] = cache_state
+        return response
 
     except Exception as e:
         return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
 
 
 if __name__ == '__main__':
+    llm_model.warm_up()
     app.run(debug=True, host='0.0.0.0', port=5000)
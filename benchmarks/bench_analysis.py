@@ -0,0 +1,96 @@
+"""Micro-benchmarks for the analysis engine.
+
+    python benchmarks/bench_analysis.py [--repeat 5] [--output bench_analysis.json]
+
+Times generate_smart_fallback (the precomputed-table path and a full
+uncached build) and every generate_* helper across all roles, products
+and markets.
+"""
+import argparse
+import time
+
+from common import summarize, write_results
+
+import market_analysis
+from catalog import PRODUCTS, MARKETS, ROLES
+
+
+def time_calls(calls, repeat):
+    """Per-call latencies for a list of zero-argument callables, repeated"""
+    latencies = []
+    clock = time.perf_counter
+    for _ in range(repeat):
+        for call in calls:
+            start = clock()
+            call()
+            latencies.append(clock() - start)
+    return latencies
+
+
+def helper_calls():
+    """Zero-argument calls for every helper across all products and markets"""
+    calls = {
+        'generate_price_forecast': [],
+        'generate_market_analysis': [],
+        'generate_risk_assessment': [],
+        'calculate_opportunity_score': [],
+        'analyze_seasonal_impact': [],
+        'generate_competitor_analysis': [],
+        'generate_economic_indicators': [],
+        'generate_action_timeline': [],
+    }
+    for product, product_info in PRODUCTS.items():
+        for market, market_info in MARKETS.items():
+            multiplier = market_info.multiplier
+            calls['generate_price_forecast'].append(
+                lambda p=product, m=market, x=multiplier, i=product_info:
+                market_analysis.generate_price_forecast(p, m, x, i))
+            calls['generate_market_analysis'].append(
+                lambda m=market, i=market_info, x=multiplier: market_analysis.generate_market_analysis(m, i, x))
+            calls['generate_risk_assessment'].append(
+                lambda x=multiplier, p=product_info, i=market_info: market_analysis.generate_risk_assessment(x, p, i))
+            calls['calculate_opportunity_score'].append(
+                lambda x=multiplier, p=product_info, i=market_info:
+                market_analysis.calculate_opportunity_score(x, p, i))
+            calls['analyze_seasonal_impact'].append(
+                lambda p=product, i=product_info: market_analysis.analyze_seasonal_impact(p, i))
+            calls['generate_competitor_analysis'].append(
+                lambda m=market, i=market_info, x=multiplier: market_analysis.generate_competitor_analysis(m, i, x))
+            calls['generate_economic_indicators'].append(
+                lambda x=multiplier, p=product_info: market_analysis.generate_economic_indicators(x, p))
+            for role in ROLES:
+                recommendation = market_analysis.build_role_recommendation(role, product, market, multiplier)['code']
+                calls['generate_action_timeline'].append(
+                    lambda r=recommendation, x=multiplier: market_analysis.generate_action_timeline(r, x))
+    return calls
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-benchmark the analysis engine')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default='bench_analysis.json')
+    args = parser.parse_args(argv)
+
+    combos = [(role, product, market) for role in ROLES for product in PRODUCTS for market in MARKETS]
+    results = {}
+
+    results['generate_smart_fallback'] = summarize(time_calls(
+        [lambda c=combo: market_analysis.generate_smart_fallback(*c, '100 kg') for combo in combos], args.repeat))
+    results['build_analysis_uncached'] = summarize(time_calls(
+        [lambda c=combo: market_analysis.build_analysis(*c) for combo in combos], args.repeat))
+
+    start = time.perf_counter()
+    market_analysis.build_analysis_table()
+    results['build_analysis_table'] = {'total_ms': round((time.perf_counter() - start) * 1000, 3),
+                                       'entries': len(combos)}
+
+    for name, calls in helper_calls().items():
+        results[name] = summarize(time_calls(calls, args.repeat))
+
+    for name, summary in results.items():
+        print(f"{name:32s} {summary}")
+    write_results('analysis', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
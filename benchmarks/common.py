@@ -0,0 +1,58 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed=None, errors=0):
+    """Latency summary in milliseconds, plus throughput when elapsed wall time is known"""
+    ordered = sorted(latencies)
+    summary = {
+        'count': len(ordered),
+        'errors': errors,
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 4) if ordered else 0.0,
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 4),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 4),
+        'max_ms': round(ordered[-1] * 1000, 4) if ordered else 0.0,
+    }
+    if elapsed:
+        summary['rps'] = round(len(ordered) / elapsed, 1)
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(kind, results, output):
+    """Write results with enough metadata to compare runs across commits"""
+    document = {
+        'benchmark': kind,
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    print(f"Results written to {output}")
+    return document
@@ -0,0 +1,58 @@
+"""Compare two benchmark result files.
+
+    python benchmarks/compare.py baseline.json candidate.json [--threshold 10]
+
+Prints the relative change of every latency and throughput figure and
+exits non-zero when any latency regresses by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+LATENCY_KEYS = ('mean_ms', 'p50_ms', 'p99_ms', 'total_ms')
+
+
+def flatten(results, prefix=''):
+    """{'a': {'b': {'p50_ms': 1}}} -> {'a.b.p50_ms': 1}"""
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare benchmark results between commits')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed latency regression in percent')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"{baseline.get('commit')} -> {candidate.get('commit')}")
+    before = flatten(baseline['results'])
+    after = flatten(candidate['results'])
+    regressions = 0
+    for name in sorted(before.keys() & after.keys()):
+        metric = name.rsplit('.', 1)[-1]
+        if metric not in LATENCY_KEYS and metric != 'rps':
+            continue
+        old, new = before[name], after[name]
+        change = (new - old) / old * 100 if old else 0.0
+        # Higher latency is worse; lower throughput is worse
+        worse = change > args.threshold if metric in LATENCY_KEYS else change < -args.threshold
+        regressions += worse and metric in LATENCY_KEYS
+        print(f"{'!' if worse else ' '} {name:50s} {old:12.4f} -> {new:12.4f} ({change:+.1f}%)")
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
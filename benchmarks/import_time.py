@@ -0,0 +1,93 @@
+"""Startup-time report: how long importing the app takes, and which imports cost the most.
+
+    python benchmarks/import_time.py [--module app] [--top 15] [--repeat 3] [--warm-up] [--output import_time.json]
+
+Each run imports the module in a fresh interpreter with `python -X importtime`
+and reports the wall time of the import plus the slowest modules by
+cumulative import time (median over runs). --warm-up also times
+llm_model.get_model(), the Gemini load that workers run in the background.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from common import ROOT, write_results
+
+# "import time:       376 |     638396 |     google.generativeai.types"
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+# Written to stderr after the import, so later warm-up imports are not counted
+_MARKER = 'import time: done'
+
+_SCRIPT = '''
+import sys
+import time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+sys.stderr.write('{marker}\\n')
+if {warm_up}:
+    import llm_model
+    llm_model.get_model()
+print(imported - start, time.perf_counter() - imported)
+'''
+
+
+def run_once(module, warm_up):
+    """(import seconds, warm-up seconds, {module: (self us, cumulative us, depth)})"""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _SCRIPT.format(module=module, warm_up=warm_up, marker=_MARKER)],
+        cwd=ROOT, capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'))
+    if completed.returncode != 0:
+        raise SystemExit(completed.stderr)
+    imported, warmed = (float(value) for value in completed.stdout.strip().splitlines()[-1].split())
+
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if line == _MARKER:
+            break
+        match = _LINE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2)
+    return imported, warmed, modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report import time of the app and its slowest imports')
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--warm-up', action='store_true', help='also time loading the Gemini model')
+    parser.add_argument('--output', default='import_time.json')
+    args = parser.parse_args(argv)
+
+    runs = [run_once(args.module, args.warm_up) for _ in range(args.repeat)]
+    names = set().union(*(modules for _, _, modules in runs))
+    cumulative = {name: statistics.median(modules.get(name, (0, 0, 0))[1] for _, _, modules in runs)
+                  for name in names}
+    slowest = sorted(cumulative, key=cumulative.get, reverse=True)[:args.top]
+
+    results = {
+        'import': {'total_ms': round(statistics.median(run[0] for run in runs) * 1000, 1)},
+        'modules': {name: {'cumulative_ms': round(cumulative[name] / 1000, 1)} for name in slowest},
+        'sdk_imported': any('google.generativeai' in modules for _, _, modules in runs),
+    }
+    if args.warm_up:
+        results['warm_up'] = {'total_ms': round(statistics.median(run[1] for run in runs) * 1000, 1)}
+
+    print(f"import {args.module}: {results['import']['total_ms']} ms (median of {args.repeat})")
+    if args.warm_up:
+        print(f"llm_model.get_model(): {results['warm_up']['total_ms']} ms")
+    print(f"google.generativeai imported at startup: {'yes' if results['sdk_imported'] else 'no'}")
+    depth = runs[0][2]
+    for name in slowest:
+        indent = '  ' * depth.get(name, (0, 0, 0))[2]
+        print(f"{cumulative[name] / 1000:10.1f} ms  {indent}{name}")
+    write_results('import_time', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
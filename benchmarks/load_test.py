@@ -0,0 +1,167 @@
+"""Load generator for /analyze, /dashboard and /translate-text.
+
+    python benchmarks/load_test.py [--mode both] [--requests 500] [--concurrency 8] [--output load_test.json]
+
+In test-client mode, requests go through Flask's test client in-process,
+which measures handler cost without any network. In server mode, a real
+threaded WSGI server is started on a local port and loaded over HTTP from
+several client threads. Gemini is replaced by the gateway's fake backend,
+and users, caches and every database live in a temporary directory, so
+nothing under data/ is read or written.
+"""
+import argparse
+import http.client
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from common import summarize, write_results
+
+_workdir = tempfile.mkdtemp(prefix='marketx-bench-')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ['USER_DB_PATH'] = os.path.join(_workdir, 'users.db')
+os.environ['HISTORY_DB_PATH'] = os.path.join(_workdir, 'history.db')
+os.environ['TRANSLATION_CACHE_PATH'] = os.path.join(_workdir, 'translations.db')
+os.environ['PRICE_DB_PATH'] = os.path.join(_workdir, 'prices.db')
+os.environ['ALERT_DB_PATH'] = os.path.join(_workdir, 'alerts.db')
+os.environ['PRECOMPUTE_DB_PATH'] = os.path.join(_workdir, 'precompute.db')
+
+import app as marketx  # noqa: E402
+from llm_gateway import LLMGateway, FakeBackend  # noqa: E402
+from werkzeug.serving import make_server, WSGIRequestHandler  # noqa: E402
+
+ANALYZE_BODIES = [
+    {'role': role, 'product': product, 'market': market, 'quantity': '100 kg'}
+    for role in ('farmer', 'trader')
+    for product in ('teff', 'coffee', 'maize', 'cattle')
+    for market in ('addis-ababa', 'jimma', 'local')
+]
+
+TRANSLATE_TEXTS = ['Sell This Week', 'Rising', 'Stable prices expected', 'Monitor market trends']
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def scenarios():
+    """(name, method, path, body factory) for each measured endpoint"""
+    return [
+        ('analyze', 'POST', '/analyze', lambda i: ANALYZE_BODIES[i % len(ANALYZE_BODIES)]),
+        ('dashboard', 'GET', '/dashboard', None),
+        ('translate_text', 'POST', '/translate-text',
+         lambda i: {'text': TRANSLATE_TEXTS[i % len(TRANSLATE_TEXTS)], 'target_lang': 'am'}),
+    ]
+
+
+def run_test_client(total, fake_latency):
+    marketx.llm = LLMGateway(FakeBackend(latency=fake_latency))
+    client = marketx.app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench'})
+
+    results = {}
+    for name, method, path, body in scenarios():
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for i in range(total):
+            start = time.perf_counter()
+            if method == 'POST':
+                response = client.post(path, json=body(i))
+            else:
+                response = client.get(path)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+        results[name] = summarize(latencies, time.perf_counter() - started, errors)
+    return results
+
+
+def _login(host, port):
+    conn = http.client.HTTPConnection(host, port)
+    conn.request('POST', '/login', urllib.parse.urlencode({'email': 'bench@example.com', 'password': 'bench'}),
+                 {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.getheader('Set-Cookie').split(';', 1)[0]
+
+
+def run_server(total, concurrency, fake_latency):
+    marketx.llm = LLMGateway(FakeBackend(latency=fake_latency))
+    server = make_server('127.0.0.1', 0, marketx.app, threaded=True, request_handler=QuietRequestHandler)
+    host, port = server.server_address
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        cookie = _login(host, port)
+        results = {}
+        for name, method, path, body in scenarios():
+            latencies = []
+            errors = [0]
+            counter = iter(range(total))
+            lock = threading.Lock()
+
+            def worker():
+                conn = http.client.HTTPConnection(host, port)
+                while True:
+                    with lock:
+                        i = next(counter, None)
+                    if i is None:
+                        break
+                    headers = {'Cookie': cookie}
+                    payload = None
+                    if method == 'POST':
+                        payload = json.dumps(body(i))
+                        headers['Content-Type'] = 'application/json'
+                    start = time.perf_counter()
+                    conn.request(method, path, payload, headers)
+                    response = conn.getresponse()
+                    response.read()
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                        errors[0] += response.status >= 400
+                conn.close()
+
+            threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            results[name] = summarize(latencies, time.perf_counter() - started, errors[0])
+        return results
+    finally:
+        server.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test Market X endpoints')
+    parser.add_argument('--mode', choices=['test-client', 'server', 'both'], default='both')
+    parser.add_argument('--requests', type=int, default=500, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads in server mode')
+    parser.add_argument('--fake-latency', type=float, default=0.0,
+                        help='seconds the fake LLM takes per uncached translation')
+    parser.add_argument('--output', default='load_test.json')
+    args = parser.parse_args(argv)
+
+    results = {}
+    if args.mode in ('test-client', 'both'):
+        results['test_client'] = run_test_client(args.requests, args.fake_latency)
+    if args.mode in ('server', 'both'):
+        results['server'] = run_server(args.requests, args.concurrency, args.fake_latency)
+
+    for mode, endpoints in results.items():
+        for name, summary in endpoints.items():
+            print(f"{mode:12s} {name:15s} {summary}")
+    results['config'] = {'requests': args.requests, 'concurrency': args.concurrency,
+                         'fake_latency': args.fake_latency}
+    write_results('load', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Product and market catalog, loaded once from catalog.json.
+
+Products and markets are immutable records with __slots__ and dense integer
+ids (0..n-1), so other modules can index arrays by id. Prices are ETB per kg
+for crops and ETB per animal for livestock (see Product.unit), and
+freight_per_km is the cost of moving one such unit one kilometre. Unknown
+products and markets get records built from the file's defaults. The file
+also lists road distances between markets, used by routing.py.
+"""
+import json
+import os
+from functools import lru_cache
+from types import MappingProxyType
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog.json')
+
+
+class _Record:
+    """Immutable record whose fields are its __slots__"""
+
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        missing = [name for name in self.__slots__ if name not in fields]
+        if missing:
+            raise ValueError(f"{type(self).__name__} {fields.get('key')!r} is missing {', '.join(missing)}")
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def replace(self, **changes):
+        """Copy with some fields changed"""
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return type(self)(**fields)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.key!r})'
+
+
+class Product(_Record):
+    __slots__ = ('id', 'key', 'name', 'unit', 'min', 'avg', 'max', 'freight_per_km',
+                 'category', 'seasonality', 'demand', 'perishability', 'storage')
+
+
+class Market(_Record):
+    __slots__ = ('id', 'key', 'name', 'region', 'multiplier', 'characteristics', 'infrastructure',
+                 'buyer_types', 'price_sensitivity', 'competition', 'lat', 'lon')
+
+
+def _load_records(cls, entries):
+    records = tuple(cls(**entry) for entry in sorted(entries, key=lambda entry: entry['id']))
+    if [record.id for record in records] != list(range(len(records))):
+        raise ValueError(f'{cls.__name__} ids must be 0..{len(records) - 1}')
+    return records
+
+
+def load_catalog(path=None):
+    """(products by id, markets by id, default product, default market, roads, roles) from a catalog file
+
+    roads are (market, market, km) tuples for direct road links.
+    """
+    with open(path or os.getenv('CATALOG_PATH', DEFAULT_CATALOG_PATH), encoding='utf-8') as f:
+        data = json.load(f)
+    return (_load_records(Product, data['products']), _load_records(Market, data['markets']),
+            Product(**data['default_product']), Market(**data['default_market']),
+            tuple((a, b, float(km)) for a, b, km in data['roads']), tuple(data['roles']))
+
+
+PRODUCTS_BY_ID, MARKETS_BY_ID, DEFAULT_PRODUCT, DEFAULT_MARKET, ROADS, ROLES = load_catalog()
+
+# Known records keyed by normalized name, in id order
+PRODUCTS = MappingProxyType({product.key: product for product in PRODUCTS_BY_ID})
+MARKETS = MappingProxyType({market.key: market for market in MARKETS_BY_ID})
+
+
+def get_product(product):
+    """Catalog record for a normalized product name, or the default record"""
+    return PRODUCTS.get(product, DEFAULT_PRODUCT)
+
+
+@lru_cache(maxsize=1024)
+def _unknown_market(market):
+    return DEFAULT_MARKET.replace(key=market, name=market.title(), characteristics=f'{market.title()} market')
+
+
+def get_market(market):
+    """Catalog record for a normalized market name, or a default record named after it"""
+    record = MARKETS.get(market)
+    return record if record is not None else _unknown_market(market)
+
+
+def get_market_multiplier(market):
+    """Get price multiplier for a normalized market name"""
+    return get_market(market).multiplier
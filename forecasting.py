@@ -0,0 +1,267 @@
+"""Holt-Winters price forecasting over every product x market series at once.
+
+All series are pivoted into one (series x day) array, and the smoothing
+recursions run over time with NumPy operations across every series and
+every candidate smoothing parameter at the same time. The fitted state is
+cached in memory. New observations advance it by one vectorized step per
+day instead of refitting, so a forecast is O(1) per request. Writes to days
+the model has already stepped past (another market's same-day upload, or a
+correction) cannot be applied that way and trigger a full refit instead.
+Updates are applied to a copy that then replaces the cached model, so
+readers never see a half-updated state.
+"""
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+import price_store
+
+# Weekly market-day cycle
+SEASON_LENGTH = 7
+
+# Days of history used for a full fit
+FIT_WINDOW_DAYS = 365
+
+# Series shorter than this keep using the rule-based forecast
+MIN_HISTORY_DAYS = 2 * SEASON_LENGTH
+
+# Candidate level smoothing factors; the best one is picked per series by one-step-ahead error
+ALPHAS = np.array([0.1, 0.3, 0.5, 0.8])
+BETA = 0.05
+GAMMA = 0.1
+
+
+def build_matrix(rows, start_day, n_days):
+    """Pivot (product, market, date, price) rows into a series x day array, NaN where missing"""
+    keys = {}
+    series = []
+    offsets = {}
+    for product, market, day, price in rows:
+        offset = offsets.get(day)
+        if offset is None:
+            offset = offsets[day] = (date.fromisoformat(day) - start_day).days
+        if not 0 <= offset < n_days:
+            continue
+        row = keys.get((product, market))
+        if row is None:
+            row = keys[(product, market)] = len(series)
+            series.append(np.full(n_days, np.nan))
+        series[row][offset] = price
+    if not series:
+        return [], np.empty((0, n_days))
+    return list(keys), np.vstack(series)
+
+
+def fill_gaps(values, fallback=None):
+    """Forward-fill missing days per series; leading gaps take the first observation (or fallback)"""
+    missing = np.isnan(values)
+    positions = np.where(missing, 0, np.arange(values.shape[1]))
+    np.maximum.accumulate(positions, axis=1, out=positions)
+    filled = np.take_along_axis(values, positions, axis=1)
+
+    if fallback is None:
+        first = np.argmax(~missing, axis=1)
+        fallback = values[np.arange(values.shape[0]), first]
+    return np.where(np.isnan(filled), fallback[:, None], filled)
+
+
+def decompose(values, season_length=SEASON_LENGTH):
+    """Initial level, trend and additive seasonal indices from whole cycles"""
+    n_series, n_days = values.shape
+    n_cycles = n_days // season_length
+    cycles = values[:, :n_cycles * season_length].reshape(n_series, n_cycles, season_length)
+    cycle_means = cycles.mean(axis=2)
+
+    level = cycle_means[:, 0]
+    if n_cycles > 1:
+        trend = (cycle_means[:, -1] - cycle_means[:, 0]) / ((n_cycles - 1) * season_length)
+    else:
+        trend = np.zeros(n_series)
+    season = (cycles - cycle_means[:, :, None]).mean(axis=1)
+    return level, trend, season
+
+
+class ForecastModel:
+    """Fitted Holt-Winters state for a set of series"""
+
+    def __init__(self, keys, start_day, level, trend, season, alpha, rmse, last_price, fitted_through):
+        self.keys = keys
+        self.index = {key: row for row, key in enumerate(keys)}
+        self.start_day = start_day
+        self.level = level
+        self.trend = trend
+        self.season = season
+        self.alpha = alpha
+        self.rmse = rmse
+        self.last_price = last_price
+        self.fitted_through = fitted_through
+
+    @classmethod
+    def fit(cls, keys, values, start_day):
+        """Fit every series and every candidate alpha in one pass over time"""
+        n_series, n_days = values.shape
+        level0, trend0, season0 = decompose(values)
+
+        n_alphas = len(ALPHAS)
+        alpha = ALPHAS[:, None]
+        level = np.broadcast_to(level0, (n_alphas, n_series)).copy()
+        trend = np.broadcast_to(trend0, (n_alphas, n_series)).copy()
+        season = np.broadcast_to(season0, (n_alphas, n_series, SEASON_LENGTH)).copy()
+        sse = np.zeros((n_alphas, n_series))
+
+        for t in range(n_days):
+            phase = t % SEASON_LENGTH
+            observed = values[:, t]
+            seasonal = season[:, :, phase]
+            error = observed - (level + trend + seasonal)
+            sse += error * error
+            new_level = alpha * (observed - seasonal) + (1 - alpha) * (level + trend)
+            trend = BETA * (new_level - level) + (1 - BETA) * trend
+            season[:, :, phase] = GAMMA * (observed - new_level) + (1 - GAMMA) * seasonal
+            level = new_level
+
+        best = sse.argmin(axis=0)
+        rows = np.arange(n_series)
+        return cls(
+            keys, start_day,
+            level=level[best, rows],
+            trend=trend[best, rows],
+            season=season[best, rows],
+            alpha=ALPHAS[best],
+            rmse=np.sqrt(sse[best, rows] / n_days),
+            last_price=values[:, -1].copy(),
+            fitted_through=start_day + timedelta(days=n_days - 1))
+
+    def copy(self):
+        """Model with its own state arrays, to update without disturbing readers of this one"""
+        return ForecastModel(self.keys, self.start_day, self.level.copy(), self.trend.copy(), self.season.copy(),
+                             self.alpha, self.rmse.copy(), self.last_price.copy(), self.fitted_through)
+
+    def step(self, observed):
+        """Advance every series by one day; observed holds today's price per series"""
+        phase = ((self.fitted_through + timedelta(days=1)) - self.start_day).days % SEASON_LENGTH
+        seasonal = self.season[:, phase]
+        error = observed - (self.level + self.trend + seasonal)
+        # Running one-step error, weighted towards recent days
+        self.rmse = np.sqrt(0.95 * self.rmse ** 2 + 0.05 * error ** 2)
+        new_level = self.alpha * (observed - seasonal) + (1 - self.alpha) * (self.level + self.trend)
+        self.trend = BETA * (new_level - self.level) + (1 - BETA) * self.trend
+        self.season[:, phase] = GAMMA * (observed - new_level) + (1 - GAMMA) * seasonal
+        self.level = new_level
+        self.last_price = observed
+        self.fitted_through += timedelta(days=1)
+
+    def update(self, rows):
+        """Apply observations dated after fitted_through
+
+        Returns False if they include series the model has never seen, in
+        which case a full refit is needed.
+        """
+        rows = list(rows)
+        if not rows:
+            return True
+        start = self.fitted_through + timedelta(days=1)
+        n_days = (max(date.fromisoformat(row[2]) for row in rows) - self.fitted_through).days
+        keys, values = build_matrix(rows, start, n_days)
+        if any(key not in self.index for key in keys):
+            return False
+
+        aligned = np.full((len(self.keys), n_days), np.nan)
+        aligned[[self.index[key] for key in keys]] = values
+        aligned = fill_gaps(aligned, self.last_price)
+        for t in range(n_days):
+            self.step(aligned[:, t])
+        return True
+
+    def forecast(self, key, horizon):
+        """Forecast horizon days after fitted_through, or None for unknown series"""
+        row = self.index.get(key)
+        if row is None:
+            return None
+        phase = ((self.fitted_through + timedelta(days=horizon)) - self.start_day).days % SEASON_LENGTH
+        return float(self.level[row] + horizon * self.trend[row] + self.season[row, phase])
+
+
+def fit_from_store():
+    """Fit a model over the most recent FIT_WINDOW_DAYS of the price store"""
+    latest = price_store.latest_date()
+    if latest is None:
+        return None
+    end_day = date.fromisoformat(latest)
+    start_day = end_day - timedelta(days=FIT_WINDOW_DAYS - 1)
+    keys, values = build_matrix(price_store.iter_observations(start=start_day.isoformat()), start_day, FIT_WINDOW_DAYS)
+
+    # Drop series without enough history, then trim leading days no series covers
+    enough = (~np.isnan(values)).sum(axis=1) >= MIN_HISTORY_DAYS
+    keys = [key for key, keep in zip(keys, enough) if keep]
+    values = values[enough]
+    if not keys:
+        return None
+    first_day = int(np.argmax((~np.isnan(values)).any(axis=0)))
+    values = fill_gaps(values[:, first_day:])
+    return ForecastModel.fit(keys, values, start_day + timedelta(days=first_day))
+
+
+_lock = threading.Lock()
+_model = None
+_model_version = None
+
+
+def _rewrites_fitted_days(model, since, version):
+    """Whether writes after data version since may have touched days the model has stepped past"""
+    if since is None or since[0] != version[0]:
+        return True
+    first_date = price_store.first_date_written_since(since[1])
+    return first_date is None or first_date <= model.fitted_through.isoformat()
+
+
+def get_model():
+    """Cached model, advanced incrementally whenever the price store changes
+
+    The returned model is never modified afterwards.
+    """
+    global _model, _model_version
+    version = price_store.data_version()
+    if version is None:
+        return None
+    if version == _model_version:
+        return _model
+
+    with _lock:
+        if version != _model_version:
+            model = _model
+            if model is not None and not _rewrites_fitted_days(model, _model_version, version):
+                model = model.copy()
+                # A write landing mid-update is logged after version, so the next change refits if it was read here
+                if not model.update(price_store.iter_observations(after=model.fitted_through.isoformat())):
+                    model = None
+            else:
+                model = None
+            if model is None:
+                model = fit_from_store()
+            _model = model
+            _model_version = version
+    return _model
+
+
+def forecast_table():
+    """{(product, market): (current, next_week, next_month, rmse)} for every fitted series"""
+    model = get_model()
+    if model is None:
+        return {}
+    return {key: get_forecast(*key) for key in model.keys}
+
+
+def get_forecast(product, market):
+    """(current, next_week, next_month, rmse) for a series, or None without enough history"""
+    model = get_model()
+    if model is None or (product, market) not in model.index:
+        return None
+    row = model.index[(product, market)]
+    return (
+        float(model.last_price[row]),
+        model.forecast((product, market), 7),
+        model.forecast((product, market), 30),
+        float(model.rmse[row])
+    )
@@ -0,0 +1,27 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('WEB_THREADS', '4'))
+worker_class = 'gthread'
+timeout = int(os.getenv('WEB_TIMEOUT', '60'))
+
+# Load the app (catalog, analysis table, models) once in the master before forking workers
+preload_app = True
+
+# Each worker writes its metrics here, so /metrics reports the whole server; set before the app is imported
+os.environ.setdefault('METRICS_MULTIPROCESS_DIR',
+                      os.path.join(tempfile.gettempdir(), f'marketx-metrics-main-{os.getuid()}'))
+
+
+def on_starting(server):
+    # Values of a previous run would otherwise be added to this one's
+    shutil.rmtree(os.environ['METRICS_MULTIPROCESS_DIR'], ignore_errors=True)
+
+
+def post_fork(server, worker):
+    from wsgi import reset_after_fork
+    reset_after_fork()
@@ -0,0 +1,38 @@
+"""gunicorn settings for a server that only carries Server-Sent Events streams.
+
+    gunicorn -c gunicorn.stream.conf.py wsgi:app
+
+Every open stream (/stream/prices, /alerts/stream) holds a thread until the
+browser leaves the page, but an idle stream thread only waits on a
+condition. This server runs the same app with many threads per worker, and
+the reverse proxy sends the stream paths to it, so open pages never take the
+threads of the main server that answers pages and /analyze.
+"""
+import os
+import shutil
+import tempfile
+
+bind = os.getenv('STREAM_BIND', '0.0.0.0:5001')
+workers = int(os.getenv('STREAM_WORKERS', '2'))
+threads = int(os.getenv('STREAM_THREADS', '256'))
+worker_class = 'gthread'
+timeout = int(os.getenv('WEB_TIMEOUT', '60'))
+
+# Leave a few threads for requests that are not streams, such as health checks
+os.environ.setdefault('MAX_STREAMS', str(max(1, threads - 8)))
+
+preload_app = True
+
+# Each worker writes its metrics here, so /metrics reports the whole server; set before the app is imported
+os.environ.setdefault('METRICS_MULTIPROCESS_DIR',
+                      os.path.join(tempfile.gettempdir(), f'marketx-metrics-stream-{os.getuid()}'))
+
+
+def on_starting(server):
+    # Values of a previous run would otherwise be added to this one's
+    shutil.rmtree(os.environ['METRICS_MULTIPROCESS_DIR'], ignore_errors=True)
+
+
+def post_fork(server, worker):
+    from wsgi import reset_after_fork
+    reset_after_fork()
@@ -0,0 +1,215 @@
+"""Per-user analysis history with running aggregates.
+
+Every /analyze answer for a catalog product and market is appended to an
+analyses log as one compact row: integer catalog ids, a unix timestamp, the
+price and score as integers and the recommendation code. The same
+transaction updates two aggregate tables with upserts, so reading a user's
+summary never scans their log:
+
+- user_series, one row per (user, product, market): query count, last
+  request (role, quantity, horizon, language) and last price, score and
+  recommendation, plus the change in price and score since the previous
+  query;
+- user_products, one row per (user, product): query count and last query
+  time, for the most-queried products.
+
+The last requests in user_series are also what warms a user's analysis
+cache when they log in.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from catalog import MARKETS, MARKETS_BY_ID, PRODUCTS, PRODUCTS_BY_ID, ROLES
+from role_rules import Recommendation
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'history.db')
+
+# Longest quantity text kept; quantities are free text typed by users
+MAX_QUANTITY_LENGTH = 32
+
+
+def normalize_quantity(quantity):
+    """Quantity text as history stores it and the analysis cache keys it"""
+    return str(quantity).strip().lower()[:MAX_QUANTITY_LENGTH]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    at INTEGER NOT NULL,
+    role_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    market_id INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    recommendation TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_user ON analyses (user_id, id);
+CREATE TABLE IF NOT EXISTS user_series (
+    user_id TEXT NOT NULL,
+    product_id INTEGER NOT NULL,
+    market_id INTEGER NOT NULL,
+    queries INTEGER NOT NULL,
+    first_at INTEGER NOT NULL,
+    last_at INTEGER NOT NULL,
+    role_id INTEGER NOT NULL,
+    quantity TEXT NOT NULL,
+    horizon INTEGER NOT NULL,
+    lang TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    price_change INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    score_change INTEGER NOT NULL,
+    recommendation TEXT NOT NULL,
+    PRIMARY KEY (user_id, product_id, market_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS user_series_recent ON user_series (user_id, last_at);
+CREATE TABLE IF NOT EXISTS user_products (
+    user_id TEXT NOT NULL,
+    product_id INTEGER NOT NULL,
+    queries INTEGER NOT NULL,
+    last_at INTEGER NOT NULL,
+    PRIMARY KEY (user_id, product_id)
+) WITHOUT ROWID;
+"""
+
+INSERT_ANALYSIS = """
+INSERT INTO analyses (user_id, at, role_id, product_id, market_id, price, score, recommendation)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Right-hand sides of DO UPDATE see the old row, so the changes are computed before it is overwritten
+UPSERT_SERIES = """
+INSERT INTO user_series (user_id, product_id, market_id, queries, first_at, last_at, role_id, quantity, horizon,
+                         lang, price, price_change, score, score_change, recommendation)
+VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?, 0, ?, 0, ?)
+ON CONFLICT (user_id, product_id, market_id) DO UPDATE SET
+    queries = queries + 1,
+    last_at = excluded.last_at,
+    role_id = excluded.role_id,
+    quantity = excluded.quantity,
+    horizon = excluded.horizon,
+    lang = excluded.lang,
+    price_change = excluded.price - price,
+    price = excluded.price,
+    score_change = excluded.score - score,
+    score = excluded.score,
+    recommendation = excluded.recommendation
+"""
+
+UPSERT_PRODUCT = """
+INSERT INTO user_products (user_id, product_id, queries, last_at) VALUES (?, ?, 1, ?)
+ON CONFLICT (user_id, product_id) DO UPDATE SET queries = queries + 1, last_at = excluded.last_at
+"""
+
+SELECT_RECENT = """
+SELECT at, role_id, product_id, market_id, price, score, recommendation
+FROM analyses WHERE user_id = ? ORDER BY id DESC LIMIT ?
+"""
+
+SELECT_SERIES = """
+SELECT product_id, market_id, queries, first_at, last_at, role_id, quantity, horizon, lang,
+       price, price_change, score, score_change, recommendation
+FROM user_series WHERE user_id = ? ORDER BY last_at DESC LIMIT ?
+"""
+
+SELECT_PRODUCTS = """
+SELECT product_id, queries, last_at FROM user_products WHERE user_id = ?
+ORDER BY queries DESC, last_at DESC LIMIT ?
+"""
+
+
+class HistoryStore:
+    """Append-only analysis log per user, with aggregates updated on write"""
+
+    def __init__(self, path=None, clock=time.time):
+        self.path = path or os.getenv('HISTORY_DB_PATH', DEFAULT_DB_PATH)
+        self.clock = clock
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def reset_connections(self):
+        """Forget connections opened before a fork; each worker opens its own"""
+        self._local = threading.local()
+
+    def record(self, user_id, key, quantity, horizon, lang, result):
+        """Log an analysis for a normalized (role, product, market) key; False if off-catalog"""
+        role, product, market = key
+        product_record = PRODUCTS.get(product)
+        market_record = MARKETS.get(market)
+        if product_record is None or market_record is None:
+            return False
+
+        at = int(self.clock())
+        insights = result['detailed_insights']
+        price = int(insights['price_forecast']['current_price'])
+        score = int(insights['opportunity_score'])
+        code = result['recommendation_code']
+        quantity = normalize_quantity(quantity)
+        role_id = ROLES.index(role)
+
+        conn = self._conn()
+        with conn:
+            conn.execute(INSERT_ANALYSIS, (user_id, at, role_id, product_record.id, market_record.id,
+                                           price, score, code))
+            conn.execute(UPSERT_SERIES, (user_id, product_record.id, market_record.id, at, at, role_id,
+                                         quantity, horizon, lang, price, score, code))
+            conn.execute(UPSERT_PRODUCT, (user_id, product_record.id, at))
+        return True
+
+    def recent(self, user_id, limit=20):
+        """Latest analyses, newest first"""
+        return [{
+            'at': row['at'],
+            'role': ROLES[row['role_id']],
+            'product': PRODUCTS_BY_ID[row['product_id']].key,
+            'market': MARKETS_BY_ID[row['market_id']].key,
+            'product_name': PRODUCTS_BY_ID[row['product_id']].name,
+            'market_name': MARKETS_BY_ID[row['market_id']].name,
+            'price': row['price'],
+            'score': row['score'],
+            'recommendation': Recommendation[row['recommendation']].value,
+        } for row in self._conn().execute(SELECT_RECENT, (user_id, limit))]
+
+    def series(self, user_id, limit=20):
+        """Per (product, market) aggregates, most recently queried first"""
+        return [{
+            'product': PRODUCTS_BY_ID[row['product_id']].key,
+            'market': MARKETS_BY_ID[row['market_id']].key,
+            'product_name': PRODUCTS_BY_ID[row['product_id']].name,
+            'market_name': MARKETS_BY_ID[row['market_id']].name,
+            'queries': row['queries'],
+            'first_at': row['first_at'],
+            'last_at': row['last_at'],
+            'role': ROLES[row['role_id']],
+            'quantity': row['quantity'],
+            'horizon': row['horizon'],
+            'lang': row['lang'],
+            'price': row['price'],
+            'price_change': row['price_change'],
+            'score': row['score'],
+            'score_change': row['score_change'],
+            'recommendation': Recommendation[row['recommendation']].value,
+        } for row in self._conn().execute(SELECT_SERIES, (user_id, limit))]
+
+    def top_products(self, user_id, limit=5):
+        """Most-queried products"""
+        return [{
+            'product': PRODUCTS_BY_ID[row['product_id']].key,
+            'product_name': PRODUCTS_BY_ID[row['product_id']].name,
+            'queries': row['queries'],
+            'last_at': row['last_at'],
+        } for row in self._conn().execute(SELECT_PRODUCTS, (user_id, limit))]
@@ -0,0 +1,186 @@
+"""Immutable, versioned snapshots of precomputed per-(product, market) insights.
+
+precompute.py writes one snapshot per price data version: a JSON file named
+after the version, written to a temporary name and renamed into place, then
+recorded in the snapshots table. A published file is never modified; older
+ones are deleted once SNAPSHOT_KEEP newer ones exist.
+
+SnapshotReader is what request handlers use. It checks for a newer snapshot
+at most every RELOAD_INTERVAL seconds and swaps in the loaded snapshot with a
+single assignment. Lookups only read that reference, so they never take a
+lock or wait for a reload. A snapshot is only used while it matches the
+current price data version. Until the worker publishes one for newer data,
+lookups return None and callers compute inline. Results derived from
+lookups are cached per price data version, so a stale snapshot must never
+be served under a newer version.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from types import MappingProxyType
+
+import price_store
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'precompute.db')
+
+# Published snapshots kept on disk
+SNAPSHOT_KEEP = 3
+
+# Seconds between checks for a newer snapshot
+RELOAD_INTERVAL = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    data_version INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    cells INTEGER NOT NULL,
+    published_at REAL NOT NULL
+);
+"""
+
+
+def get_db_path():
+    return os.getenv('PRECOMPUTE_DB_PATH', DEFAULT_DB_PATH)
+
+
+def snapshot_dir(path=None):
+    """Directory holding snapshot files, next to the database"""
+    return os.path.join(os.path.dirname(path or get_db_path()) or '.', 'snapshots')
+
+
+class Cell:
+    """Precomputed observed prices and insights for one (product, market); hashed by identity"""
+
+    __slots__ = ('observed', 'insights')
+
+    def __init__(self, observed, insights):
+        self.observed = observed
+        self.insights = insights
+
+
+class Snapshot:
+    """One published snapshot: cells keyed by (product, market)"""
+
+    __slots__ = ('data_version', 'published_at', 'cells')
+
+    def __init__(self, data_version, published_at, cells):
+        self.data_version = data_version
+        self.published_at = published_at
+        self.cells = cells
+
+
+def encode_cell(product, market, observed, insights):
+    """JSON-ready row for a cell"""
+    return [product, market, list(observed), insights]
+
+
+def _decode_cell(row):
+    product, market, observed, insights = row
+    national_min, national_avg, national_max, market_avg, fitted = observed
+    observed = (national_min, national_avg, national_max, market_avg, tuple(fitted) if fitted is not None else None)
+    return (product, market), Cell(observed, MappingProxyType(insights))
+
+
+def publish(data_version, rows, path=None, clock=time.time):
+    """Write a snapshot file for a price data version and record it; returns the file name"""
+    path = path or get_db_path()
+    directory = snapshot_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    name = f'insights-{data_version}.json'
+    temporary = os.path.join(directory, f'.{name}.{os.getpid()}')
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump({'data_version': data_version, 'cells': rows}, f, separators=(',', ':'))
+    os.replace(temporary, os.path.join(directory, name))
+
+    conn = sqlite3.connect(path, timeout=10)
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO snapshots (data_version, file, cells, published_at) VALUES (?, ?, ?, ?)',
+                         (data_version, name, len(rows), clock()))
+            expired = conn.execute('SELECT data_version, file FROM snapshots ORDER BY published_at DESC LIMIT -1 OFFSET ?',
+                                   (SNAPSHOT_KEEP,)).fetchall()
+            conn.executemany('DELETE FROM snapshots WHERE data_version = ?', [(version,) for version, _ in expired])
+    finally:
+        conn.close()
+    # Readers may still be loading an expired file; a missing one just means they keep their current snapshot
+    for _, file in expired:
+        try:
+            os.remove(os.path.join(directory, file))
+        except OSError:
+            pass
+    return name
+
+
+def latest(path=None):
+    """(data_version, file, cells, published_at) of the newest snapshot, or None before the first publish"""
+    path = path or get_db_path()
+    try:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=10)
+    except sqlite3.OperationalError:
+        return None
+    try:
+        return conn.execute(
+            'SELECT data_version, file, cells, published_at FROM snapshots ORDER BY published_at DESC LIMIT 1').fetchone()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+def load(path, row):
+    """Snapshot for a snapshots table row"""
+    data_version, file, _, published_at = row
+    with open(os.path.join(snapshot_dir(path), file), encoding='utf-8') as f:
+        data = json.load(f)
+    return Snapshot(data_version, published_at, MappingProxyType(dict(_decode_cell(cell) for cell in data['cells'])))
+
+
+class SnapshotReader:
+    """Lock-free access to the newest published snapshot"""
+
+    def __init__(self, path=None, reload_interval=RELOAD_INTERVAL, clock=time.monotonic):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.clock = clock
+        self._snapshot = None
+        self._checked_at = None
+        self._reloading = threading.Lock()
+
+    def _reload(self):
+        path = self.path or get_db_path()
+        row = latest(path)
+        if row is None or (self._snapshot is not None and row[0] == self._snapshot.data_version):
+            return
+        try:
+            snapshot = load(path, row)
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not load insight snapshot {row[1]}: {e}")
+            return
+        self._snapshot = snapshot
+
+    def current(self):
+        """The newest snapshot loaded so far, or None; one caller at a time checks for a newer one"""
+        now = self.clock()
+        if self._checked_at is None or now - self._checked_at >= self.reload_interval:
+            # Other callers keep reading the current snapshot instead of waiting
+            if self._reloading.acquire(blocking=False):
+                try:
+                    self._checked_at = now
+                    self._reload()
+                finally:
+                    self._reloading.release()
+        return self._snapshot
+
+    def lookup(self, product, market):
+        """Cell for a (product, market) from a snapshot of the current price data, else None"""
+        snapshot = self.current()
+        if snapshot is None:
+            return None
+        version = price_store.data_version()
+        if version is None or version[1] != snapshot.data_version:
+            return None
+        return snapshot.cells.get((product, market))
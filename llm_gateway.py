@@ -0,0 +1,199 @@
+"""Shared gateway for LLM calls from Flask request handlers.
+
+Calls run on a bounded thread pool so a slow upstream never blocks more
+than a fixed number of threads. Every call has a deadline, and identical
+prompts that are already in flight share a single upstream call. Callers
+get LLMUnavailable when the deadline passes, the queue is full or the
+backend fails, and should fall back to the rule-based analysis.
+
+The backend is pluggable. GeminiBackend wraps a google.generativeai model,
+loaded by llm_model in the background unless one is given; calls made
+before it is ready raise LLMUnavailable rather than wait. FakeBackend
+answers locally with a configurable latency, so load tests can run offline
+(LLM_BACKEND=fake). RecordedBackend replays replies saved in a JSON file
+(LLM_BACKEND=recorded, LLM_RECORDINGS=path), and with LLM_RECORD=1 it saves
+real Gemini replies to that file for later replay.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import llm_model
+from metrics import LLM_LATENCY, LLM_FAILURES, LLM_COALESCED
+
+DEFAULT_TIMEOUT = float(os.getenv('LLM_TIMEOUT_SECONDS', '15'))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '4'))
+
+# Calls allowed to wait for a worker, per worker, before new prompts are rejected
+QUEUE_FACTOR = 4
+
+
+class LLMUnavailable(Exception):
+    """The LLM could not answer in time; use a fallback"""
+
+
+class LLMTimeout(LLMUnavailable):
+    pass
+
+
+class LLMOverloaded(LLMUnavailable):
+    pass
+
+
+class LLMResponse:
+    """Minimal stand-in for a generate_content() response"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class GeminiBackend:
+    """Backend calling a google.generativeai GenerativeModel, the shared lazy one by default"""
+
+    def __init__(self, model=None):
+        self.model = model
+
+    def generate(self, prompt):
+        if self.model is None and not llm_model.loaded():
+            # Calls never wait for the SDK to load; until it has, callers use the rule-based answer
+            llm_model.warm_up()
+            raise LLMUnavailable('Gemini model is still loading')
+        model = self.model or llm_model.get_model()
+        if model is None:
+            raise LLMUnavailable('No Gemini model could be initialized')
+        return model.generate_content(prompt).text
+
+
+class FakeBackend:
+    """Offline backend for tests and load tests
+
+    responder maps a prompt to reply text; by default the last line of the
+    prompt is echoed back.
+    """
+
+    def __init__(self, latency=0.0, responder=None):
+        self.latency = latency
+        self.responder = responder or (lambda prompt: prompt.rstrip().rsplit('\n', 1)[-1].strip())
+        self.calls = 0
+
+    def generate(self, prompt):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.responder(prompt)
+
+
+class RecordedBackend:
+    """Replays replies recorded in a JSON file of {prompt sha256: {"prompt": ..., "reply": ...}}
+
+    With a backend, prompts missing from the file are forwarded to it and
+    the reply is added to the file; without one they raise KeyError.
+    """
+
+    def __init__(self, path, backend=None):
+        self.path = path
+        self.backend = backend
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.recordings = json.load(f)
+        except FileNotFoundError:
+            self.recordings = {}
+
+    @staticmethod
+    def key(prompt):
+        return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+    def generate(self, prompt):
+        recording = self.recordings.get(self.key(prompt))
+        if recording is not None:
+            return recording['reply']
+        if self.backend is None:
+            raise KeyError('No recorded reply for prompt')
+
+        reply = self.backend.generate(prompt)
+        with self._lock:
+            self.recordings[self.key(prompt)] = {'prompt': prompt, 'reply': reply}
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.recordings, f, ensure_ascii=False, indent=2, sort_keys=True)
+        return reply
+
+
+class LLMGateway:
+    """Deadline-bound, concurrency-limited, coalescing LLM client"""
+
+    def __init__(self, backend, max_concurrency=DEFAULT_MAX_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+        self.backend = backend
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm')
+        self._slots = threading.BoundedSemaphore(max_concurrency * QUEUE_FACTOR)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _call(self, prompt):
+        start = time.perf_counter()
+        try:
+            text = self.backend.generate(prompt)
+        except Exception:
+            LLM_LATENCY.observe('error', value=time.perf_counter() - start)
+            raise
+        LLM_LATENCY.observe('ok', value=time.perf_counter() - start)
+        return text
+
+    def _release(self, prompt, future):
+        with self._lock:
+            if self._inflight.get(prompt) is future:
+                del self._inflight[prompt]
+        self._slots.release()
+
+    def submit(self, prompt):
+        """Future for a prompt, shared with any identical call already in flight"""
+        with self._lock:
+            future = self._inflight.get(prompt)
+            if future is not None:
+                LLM_COALESCED.inc()
+                return future
+            if not self._slots.acquire(blocking=False):
+                LLM_FAILURES.inc('overloaded')
+                raise LLMOverloaded('Too many LLM calls in flight')
+            future = self._executor.submit(self._call, prompt)
+            self._inflight[prompt] = future
+        future.add_done_callback(lambda done: self._release(prompt, done))
+        return future
+
+    def generate(self, prompt, timeout=None):
+        """Reply text, or LLMUnavailable once the deadline passes or the backend fails"""
+        future = self.submit(prompt)
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            LLM_FAILURES.inc('timeout')
+            raise LLMTimeout(f'No LLM reply within {self.timeout if timeout is None else timeout}s')
+        except Exception as e:
+            LLM_FAILURES.inc('error')
+            raise LLMUnavailable(str(e)) from e
+
+    def generate_content(self, prompt):
+        """Drop-in replacement for GenerativeModel.generate_content"""
+        return LLMResponse(self.generate(prompt))
+
+
+def create_gateway(model=None):
+    """Gateway for the configured backend, or None when no LLM is configured
+
+    Without a model, Gemini is only imported and loaded on the first call
+    (or by llm_model.warm_up()).
+    """
+    if os.getenv('LLM_BACKEND') == 'fake':
+        return LLMGateway(FakeBackend(latency=float(os.getenv('LLM_FAKE_LATENCY', '0.2'))))
+    recordings = os.getenv('LLM_RECORDINGS', 'llm_recordings.json')
+    if os.getenv('LLM_BACKEND') == 'recorded':
+        return LLMGateway(RecordedBackend(recordings))
+    if model is None and not llm_model.enabled():
+        return None
+    if os.getenv('LLM_RECORD') == '1':
+        return LLMGateway(RecordedBackend(recordings, GeminiBackend(model)))
+    return LLMGateway(GeminiBackend(model))
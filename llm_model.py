@@ -0,0 +1,83 @@
+"""Lazy, shared Gemini model initialization.
+
+Importing google.generativeai takes most of the app's import time, so
+nothing here touches the SDK until a model is first needed. get_model()
+imports and configures the SDK, then picks the first model name that can be
+constructed, exactly once per process; concurrent callers wait for the same
+attempt. warm_up() runs that in a background thread, so a freshly started
+worker can serve rule-based requests while the SDK loads.
+"""
+import os
+import threading
+
+import metrics
+
+# Tried in order until one can be constructed
+MODEL_NAMES = ('gemini-pro-latest', 'gemini-pro', 'text-bison-001')
+
+_lock = threading.Lock()
+_warm_lock = threading.Lock()
+_loaded = False
+_model = None
+_warming_pid = None
+
+
+def enabled():
+    """Whether Gemini is configured at all; without an API key the SDK is never imported"""
+    return bool(os.getenv('GEMINI_API_KEY'))
+
+
+def load_model(names=MODEL_NAMES):
+    """Import and configure the SDK and construct the first available model, or None"""
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        print("Warning: GEMINI_API_KEY not found in environment variables")
+        return None
+    try:
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+    except Exception as e:
+        print(f"Warning: Gemini API not configured - {e}")
+        return None
+
+    for name in names:
+        try:
+            model = genai.GenerativeModel(name)
+        except Exception:
+            metrics.MODEL_FALLBACKS.inc(name)
+            continue
+        print(f"Using model: {name}")
+        metrics.MODEL_ACTIVE.set(model.model_name, value=1)
+        return model
+    print("Could not initialize any Gemini model")
+    return None
+
+
+def get_model():
+    """The process-wide model, loaded on first use; None if Gemini is unavailable"""
+    global _loaded, _model
+    if _loaded:
+        return _model
+    with _lock:
+        if not _loaded:
+            _model = load_model()
+            _loaded = True
+    return _model
+
+
+def loaded():
+    """Whether get_model() has finished, without triggering a load"""
+    return _loaded
+
+
+def warm_up():
+    """Load the model in a background thread if Gemini is configured; one thread per process"""
+    global _warming_pid
+    if not enabled() or _loaded:
+        return
+    with _warm_lock:
+        # A forked worker must start its own thread; the parent's did not survive the fork
+        if _loaded or _warming_pid == os.getpid():
+            return
+        _warming_pid = os.getpid()
+    threading.Thread(target=get_model, name='llm-warm-up', daemon=True).start()
@@ -0,0 +1,464 @@
+from functools import lru_cache
+
+from catalog import PRODUCTS, MARKETS, ROLES, get_product, get_market
+from market_ranking import best_market, best_market_price, role_side, transport_cost
+from routing import distance, route, quantity_bucket, quantity_error
+from price_store import data_version, get_price_stats
+from forecasting import get_forecast
+from scenarios import DEFAULT_HORIZON_DAYS, simulate_quantity
+from role_rules import Recommendation, recommend, render
+from insight_snapshots import SnapshotReader
+
+
+def normalize_key(user_role, product, market):
+    """Normalize request inputs into a (role, product, market) lookup key"""
+    role = (user_role or '').strip().lower()
+    if role not in ROLES:
+        role = 'farmer'
+    return role, (product or '').strip().lower(), (market or '').strip().lower()
+
+
+def build_role_recommendation(user_role, product, market, multiplier, lang='en'):
+    """Build recommendation and reasoning for a single role"""
+    code = recommend(user_role, multiplier)
+    recommendation, reasoning = render(user_role, code, product, market, lang)
+    return {'code': code, 'recommendation': recommendation, 'reasoning': reasoning}
+
+
+def get_observed_prices(product, market, forecasts=None):
+    """Recent observed (national min, national avg, national max, market avg, forecast), or None without data
+
+    forecasts, from forecasting.forecast_table, replaces the forecasting model.
+    """
+    national = get_price_stats(product)
+    if national is None:
+        return None
+    local = get_price_stats(product, market)
+    market_avg = local['avg'] if local else national['avg']
+    fitted = forecasts.get((product, market)) if forecasts is not None else get_forecast(product, market)
+    return national['min'], national['avg'], national['max'], market_avg, fitted
+
+
+def apply_observed(product_info, multiplier, observed):
+    """(product_info, multiplier, fitted) with observed prices replacing the catalog range and multiplier"""
+    national_min, national_avg, national_max, market_avg, fitted = observed
+    product_info = product_info.replace(min=national_min, avg=national_avg, max=national_max)
+    if national_avg:
+        multiplier = round(market_avg / national_avg, 2)
+    return product_info, multiplier, fitted
+
+
+def compute_insights(product, market, observed):
+    """Forecast, risk and opportunity score for observed prices; what the precompute worker publishes"""
+    market_info = get_market(market)
+    product_info, multiplier, fitted = apply_observed(get_product(product), market_info.multiplier, observed)
+    return {
+        'price_forecast': generate_price_forecast(product, market, multiplier, product_info, fitted),
+        'risk_assessment': generate_risk_assessment(multiplier, product_info, market_info),
+        'opportunity_score': calculate_opportunity_score(multiplier, product_info, market_info),
+    }
+
+
+def build_analysis(user_role, product, market, observed=None, insights=None):
+    """Build the quantity-independent analysis for a normalized key
+
+    observed replaces the catalog price range and market multiplier with
+    recent observations from the price store. insights, from
+    compute_insights, saves recomputing the forecast, risk and score.
+    """
+    product_info = get_product(product)
+    market_info = get_market(market)
+    multiplier = market_info.multiplier
+    fitted = None
+
+    if observed is not None:
+        product_info, multiplier, fitted = apply_observed(product_info, multiplier, observed)
+    if insights is None:
+        insights = {
+            'price_forecast': generate_price_forecast(product, market, multiplier, product_info, fitted),
+            'risk_assessment': generate_risk_assessment(multiplier, product_info, market_info),
+            'opportunity_score': calculate_opportunity_score(multiplier, product_info, market_info),
+        }
+
+    base_price = product_info.avg
+
+    # Apply market multiplier
+    estimated_price = int(base_price * multiplier)
+
+    # Enhanced trend analysis based on market and product
+    if multiplier >= 1.15:
+        trend = 'Rising Rapidly'
+        confidence = 'High'
+    elif multiplier >= 1.05:
+        trend = 'Rising'
+        confidence = 'High'
+    elif multiplier <= 0.85:
+        trend = 'Falling'
+        confidence = 'Medium'
+    elif multiplier <= 0.95:
+        trend = 'Stable to Falling'
+        confidence = 'Medium'
+    else:
+        trend = 'Stable'
+        confidence = 'High'
+
+    role_info = build_role_recommendation(user_role, product, market, multiplier)
+
+    return {
+        'recommendation': role_info['recommendation'],
+        'recommendation_code': role_info['code'].name,
+        'best_market': get_market(best_market(product, user_role)).name,
+        'trend': trend,
+        'reasoning': role_info['reasoning'],
+        'confidence': confidence,
+        'estimated_price': f'{estimated_price} ETB/kg' if product_info.unit == 'kg' else f'{estimated_price} ETB per animal',
+        'detailed_insights': {
+            'price_forecast': insights['price_forecast'],
+            'market_analysis': generate_market_analysis(market, market_info, multiplier),
+            'risk_assessment': insights['risk_assessment'],
+            'opportunity_score': insights['opportunity_score'],
+            'seasonal_impact': analyze_seasonal_impact(product, product_info),
+            'competitor_analysis': generate_competitor_analysis(market, market_info, multiplier),
+            'economic_indicators': generate_economic_indicators(multiplier, product_info),
+            'action_timeline': generate_action_timeline(role_info['code'], multiplier)
+        }
+    }
+
+
+def build_analysis_table():
+    """Precompute analyses for every known role, product and market"""
+    return {
+        (role, product, market): build_analysis(role, product, market)
+        for role in ROLES
+        for product in PRODUCTS
+        for market in MARKETS
+    }
+
+
+@lru_cache(maxsize=1024)
+def _build_uncatalogued_analysis(user_role, product, market):
+    return build_analysis(user_role, product, market)
+
+
+@lru_cache(maxsize=4096)
+def _build_observed_analysis(user_role, product, market, observed):
+    return build_analysis(user_role, product, market, observed)
+
+
+@lru_cache(maxsize=4096)
+def _build_precomputed_analysis(user_role, product, market, cell):
+    return build_analysis(user_role, product, market, cell.observed, cell.insights)
+
+
+def lookup_analysis(user_role, product, market):
+    """Get the shared quantity-independent analysis for raw request inputs
+
+    The returned dict is shared between requests and must not be mutated.
+    """
+    key = normalize_key(user_role, product, market)
+    # Published by the precompute worker, so the request skips price statistics and forecasting
+    cell = precomputed.lookup(key[1], key[2])
+    if cell is not None:
+        return _build_precomputed_analysis(*key, cell)
+
+    observed = get_observed_prices(key[1], key[2])
+    if observed is not None:
+        return _build_observed_analysis(*key, observed)
+
+    analysis = ANALYSIS_TABLE.get(key)
+    if analysis is None:
+        analysis = _build_uncatalogued_analysis(*key)
+    return analysis
+
+
+def route_analysis(analysis, user_role, product, market, quantity):
+    """Copy of a shared analysis whose best market accounts for transport from market for this quantity"""
+    result = dict(analysis)
+    bucket = quantity_bucket(product, quantity)
+    best = best_market_price(product, user_role, market, bucket)
+    if best is None:
+        return result
+
+    destination, net_price = best
+    # Sellers ship from their market to the destination; buyers ship goods back to theirs
+    origin, target = (market, destination) if role_side(user_role) == 'sell' else (destination, market)
+    path = route(origin, target)
+    result['best_market'] = get_market(destination).name
+    result['transport'] = {
+        'from': get_market(origin).name,
+        'to': get_market(target).name,
+        'distance_km': distance(origin, target),
+        'route': [get_market(stop).name for stop in path] if path else None,
+        'cost_per_unit': round(transport_cost(product, origin, target, bucket), 2) if path else None,
+        'net_price': net_price,
+        'unit': get_product(product).unit
+    }
+    return result
+
+
+def fitted_forecast(product, market):
+    """(current, next_week, next_month, rmse) from a current snapshot cell, else from the forecasting model"""
+    cell = precomputed.lookup(product, market)
+    if cell is not None:
+        return cell.observed[4]
+    return get_forecast(product, market)
+
+
+def quantity_scenarios(analysis, user_role, product, market, quantity, horizon=DEFAULT_HORIZON_DAYS):
+    """Monte Carlo outcomes of trading this quantity now or later in market, or None without a quantity"""
+    forecast = analysis['detailed_insights']['price_forecast']
+    fitted = fitted_forecast(product, market)
+    return simulate_quantity(product, market, role_side(user_role), quantity, forecast['current_price'],
+                             forecast['next_month'], fitted[3] if fitted else None, horizon, data_version())
+
+
+def generate_smart_fallback(user_role, product, market, quantity, horizon=DEFAULT_HORIZON_DAYS, lang='en'):
+    """Generate intelligent market analysis without AI
+
+    lang other than 'en' renders the recommendation and reasoning from the
+    localized rule tables.
+    """
+    key = normalize_key(user_role, product, market)
+    analysis = lookup_analysis(*key)
+    result = route_analysis(analysis, *key, quantity)
+    result['scenarios'] = quantity_scenarios(analysis, *key, quantity, horizon)
+    if lang != 'en':
+        result['recommendation'], result['reasoning'] = render(
+            key[0], Recommendation[analysis['recommendation_code']], key[1], key[2], lang)
+    return result
+
+
+def analyze_batch(items, default_role='farmer'):
+    """Analyze many product/market items, yielding one entry per item in order
+
+    Items sharing a normalized (role, product, market) key share one lookup.
+    """
+    analyses = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            yield {'index': index, 'error': 'Item must be an object'}
+            continue
+
+        user_role = item.get('role') or default_role
+        product = item.get('product', '')
+        market = item.get('market', '')
+        quantity = item.get('quantity', '')
+
+        if not all([user_role, product, market]):
+            yield {'index': index, 'error': 'Missing required fields'}
+            continue
+        if not all(isinstance(value, str) for value in (user_role, product, market)):
+            yield {'index': index, 'error': 'role, product and market must be strings'}
+            continue
+        error = quantity_error(quantity)
+        if error:
+            yield {'index': index, 'error': error}
+            continue
+
+        key = normalize_key(user_role, product, market)
+        if key not in analyses:
+            analyses[key] = lookup_analysis(*key)
+
+        yield {
+            'index': index,
+            'role': key[0],
+            'product': key[1],
+            'market': key[2],
+            'quantity': quantity,
+            'analysis': route_analysis(analyses[key], *key, quantity)
+        }
+
+
+def generate_price_forecast(product, market, multiplier, product_info, fitted=None):
+    """Generate detailed price forecast
+
+    fitted is a (current, next_week, next_month, rmse) tuple from the
+    forecasting model; without it the forecast follows the market multiplier.
+    """
+    if fitted is not None:
+        current, next_week, next_month, rmse = fitted
+        change = next_month / current - 1 if current else 0
+        relative_error = rmse / current if current else 0
+        return {
+            'current_price': int(current),
+            'next_week': int(next_week),
+            'next_month': int(next_month),
+            'trend': "Strong upward trajectory expected" if change >= 0.08 else "Moderate growth projected" if change >= 0.02 else "Declining trend anticipated" if change <= -0.05 else "Stable prices expected",
+            'volatility': 'High' if relative_error >= 0.08 else 'Medium' if relative_error >= 0.04 else 'Low'
+        }
+
+    base_price = product_info.avg
+
+    # Calculate 30-day forecast
+    if multiplier >= 1.15:
+        forecast_trend = "Strong upward trajectory expected"
+        next_week = int(base_price * multiplier * 1.05)
+        next_month = int(base_price * multiplier * 1.12)
+    elif multiplier >= 1.05:
+        forecast_trend = "Moderate growth projected"
+        next_week = int(base_price * multiplier * 1.02)
+        next_month = int(base_price * multiplier * 1.06)
+    elif multiplier <= 0.85:
+        forecast_trend = "Declining trend anticipated"
+        next_week = int(base_price * multiplier * 0.95)
+        next_month = int(base_price * multiplier * 0.88)
+    else:
+        forecast_trend = "Stable prices expected"
+        next_week = int(base_price * multiplier)
+        next_month = int(base_price * multiplier)
+
+    return {
+        'current_price': int(base_price * multiplier),
+        'next_week': next_week,
+        'next_month': next_month,
+        'trend': forecast_trend,
+        'volatility': 'High' if multiplier >= 1.15 or multiplier <= 0.85 else 'Medium' if multiplier >= 1.1 or multiplier <= 0.9 else 'Low'
+    }
+
+
+def generate_market_analysis(market, market_info, multiplier):
+    """Generate detailed market analysis"""
+    return {
+        'market_strength': 'Strong' if multiplier >= 1.1 else 'Moderate' if multiplier >= 0.95 else 'Weak',
+        'buyer_behavior': 'Aggressive purchasing' if multiplier >= 1.1 else 'Selective buying' if multiplier >= 0.95 else 'Cautious approach',
+        'supply_level': 'Limited supply' if multiplier >= 1.1 else 'Adequate supply' if multiplier >= 0.95 else 'Excess supply',
+        'market_competition': 'High competition' if multiplier >= 1.1 else 'Moderate competition' if multiplier >= 0.95 else 'Low competition',
+        'infrastructure_quality': market_info.infrastructure,
+        'market_reach': market_info.characteristics
+    }
+
+
+def generate_risk_assessment(multiplier, product_info, market_info):
+    """Generate comprehensive risk assessment"""
+    risk_factors = []
+    risk_level = 'Low'
+
+    if multiplier >= 1.15:
+        risk_factors.append("Price correction risk due to rapid increase")
+        risk_level = 'Medium'
+    elif multiplier <= 0.85:
+        risk_factors.append("Market oversupply risk")
+        risk_level = 'High'
+
+    if product_info.perishability == 'highly perishable':
+        risk_factors.append("High perishability risk")
+        risk_level = 'High' if risk_level != 'High' else 'Very High'
+
+    if multiplier < 1.0:
+        risk_factors.append("Limited market access")
+
+    return {
+        'overall_risk': risk_level,
+        'risk_factors': risk_factors,
+        'mitigation_strategies': [
+            "Diversify market outlets",
+            "Monitor price trends daily",
+            "Consider storage options",
+            "Build buyer relationships"
+        ],
+        'market_stability': 'Stable' if 0.9 <= multiplier <= 1.1 else 'Unstable'
+    }
+
+
+def calculate_opportunity_score(multiplier, product_info, market_info):
+    """Calculate market opportunity score (0-100)"""
+    base_score = 50
+
+    # Price momentum score
+    if multiplier >= 1.15:
+        price_score = 25
+    elif multiplier >= 1.05:
+        price_score = 15
+    elif multiplier <= 0.85:
+        price_score = -10
+    else:
+        price_score = 0
+
+    # Market quality score
+    market_score = 10 if multiplier >= 1.1 else 5 if multiplier >= 0.95 else -5
+
+    # Product demand score
+    demand_score = 10 if product_info.demand == 'high demand' else 5 if product_info.demand == 'stable demand' else 0
+
+    total_score = base_score + price_score + market_score + demand_score
+    return max(0, min(100, total_score))
+
+
+def analyze_seasonal_impact(product, product_info):
+    """Analyze seasonal impact on product"""
+    seasonal_factors = product_info.seasonality
+
+    return {
+        'current_season': 'Peak season' if 'peak' in seasonal_factors.lower() else 'Growing season' if 'season' in seasonal_factors.lower() else 'Off-season',
+        'seasonal_trend': seasonal_factors,
+        'best_timing': product_info.seasonality,
+        'storage_impact': product_info.storage
+    }
+
+
+def generate_competitor_analysis(market, market_info, multiplier):
+    """Generate competitor analysis"""
+    competition_level = market_info.competition
+
+    return {
+        'competition_intensity': competition_level,
+        'market_saturation': 'High' if 'high' in competition_level.lower() else 'Medium' if 'moderate' in competition_level.lower() else 'Low',
+        'competitive_advantage': [
+            "Quality differentiation",
+            "Supply reliability",
+            "Price competitiveness",
+            "Market relationships"
+        ],
+        'barriers_to_entry': 'Low' if multiplier < 1.0 else 'Medium' if multiplier < 1.1 else 'High'
+    }
+
+
+def generate_economic_indicators(multiplier, product_info):
+    """Generate economic indicators"""
+    return {
+        'market_health': 'Excellent' if multiplier >= 1.15 else 'Good' if multiplier >= 1.05 else 'Fair' if multiplier >= 0.95 else 'Poor',
+        'inflation_pressure': 'High' if multiplier >= 1.1 else 'Moderate' if multiplier >= 0.95 else 'Low',
+        'demand_growth': 'Strong' if multiplier >= 1.1 else 'Moderate' if multiplier >= 0.95 else 'Weak',
+        'market_efficiency': 85 if multiplier >= 0.95 else 70,
+        'price_elasticity': 'Inelastic' if product_info.category == 'cereal' else 'Elastic'
+    }
+
+
+ACTION_TIMELINES = {
+    'immediate': {
+        'urgent_actions': ['Execute sale today', 'Contact buyers', 'Finalize logistics'],
+        'short_term': ['Monitor market reaction', 'Plan next transaction'],
+        'medium_term': ['Evaluate performance', 'Adjust strategy'],
+        'optimal_window': '24-48 hours'
+    },
+    'this_week': {
+        'urgent_actions': ['Prepare for sale', 'Identify buyers', 'Quality check'],
+        'short_term': ['Execute within 3-5 days', 'Monitor price changes'],
+        'medium_term': ['Plan next cycle', 'Build relationships'],
+        'optimal_window': '3-7 days'
+    },
+    'wait': {
+        'urgent_actions': ['Monitor market trends', 'Prepare storage', 'Research alternatives'],
+        'short_term': ['Weekly price review', 'Market research'],
+        'medium_term': ['Strategic planning', 'Market expansion'],
+        'optimal_window': '2-4 weeks'
+    },
+    'long_term': {
+        'urgent_actions': ['Market analysis', 'Risk assessment', 'Strategic planning'],
+        'short_term': ['Trend monitoring', 'Opportunity identification'],
+        'medium_term': ['Long-term positioning', 'Market development'],
+        'optimal_window': '4-8 weeks'
+    }
+}
+
+
+def generate_action_timeline(recommendation, multiplier):
+    """Generate detailed action timeline for a Recommendation"""
+    return ACTION_TIMELINES[recommendation.timeline]
+
+
+# Precomputed once at startup; analyses only depend on (role, product, market)
+ANALYSIS_TABLE = build_analysis_table()
+
+# Forecasts, risk and scores published by precompute.py, when a worker is running
+precomputed = SnapshotReader()
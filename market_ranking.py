@@ -0,0 +1,210 @@
+import threading
+
+import routing
+from catalog import PRODUCTS, MARKETS
+from price_store import data_version, get_price_stats
+from routing import BUCKET_FACTORS, DEFAULT_BUCKET
+
+# Roles that sell produce and want the highest net price
+SELLING_ROLES = frozenset(['farmer', 'cooperative', 'government'])
+
+INF = float('inf')
+
+_lock = threading.Lock()
+
+
+def market_price(product, market):
+    """Price of a product in a market: the recent observed average, as /analyze uses it, else the catalog estimate"""
+    local = get_price_stats(product, market)
+    if local is not None:
+        return local['avg']
+    # Markets without observations of a product that others have observed are priced at the national average
+    national = get_price_stats(product)
+    if national is not None:
+        return national['avg']
+    return PRODUCTS[product].avg * MARKETS[market].multiplier
+
+
+def transport_cost(product, origin, destination, bucket=DEFAULT_BUCKET):
+    """Per-unit cost of moving a product from origin to destination by road; INF if unreachable"""
+    cost = routing.freight_cost(product, origin, destination, bucket)
+    return INF if cost is None else cost
+
+
+def role_side(user_role):
+    """Whether a role is ranking markets to 'sell' into or 'buy' from"""
+    return 'sell' if user_role in SELLING_ROLES else 'buy'
+
+
+def build_transport_table():
+    """Road transport cost per (product, origin, destination, quantity bucket), both ways; origin None costs nothing
+
+    Prices change far more often than roads, so the ranking tables are rebuilt from this table.
+    """
+    table = {}
+    for product in PRODUCTS:
+        for bucket in range(len(BUCKET_FACTORS)):
+            for origin in [None] + list(MARKETS):
+                for market in MARKETS:
+                    table[(product, origin, market, bucket)] = transport_cost(product, origin, market, bucket)
+                    table[(product, market, origin, bucket)] = transport_cost(product, market, origin, bucket)
+    return table
+
+
+def build_price_table():
+    """Current market price of every product in every market"""
+    return {product: {market: market_price(product, market) for market in MARKETS} for product in PRODUCTS}
+
+
+def build_rank_index(transport, price_table):
+    """Precompute net prices per (product, origin, quantity bucket), sorted best-first for selling
+
+    origin None means transport is ignored. Buying order is the same list
+    ranked by landed cost, which is stored separately.
+    """
+    origins = [None] + list(MARKETS)
+    sell_index = {}
+    buy_index = {}
+    for product, prices in price_table.items():
+        for origin in origins:
+            for bucket in range(len(BUCKET_FACTORS)):
+                sell = []
+                buy = []
+                for market, price in prices.items():
+                    # Selling: ship from origin to market; buying: ship from market back to origin
+                    outbound = transport[(product, origin, market, bucket)]
+                    inbound = transport[(product, market, origin, bucket)]
+                    if outbound != INF:
+                        sell.append((market, round(price - outbound, 2)))
+                    if inbound != INF:
+                        buy.append((market, round(price + inbound, 2)))
+                sell.sort(key=lambda entry: entry[1], reverse=True)
+                buy.sort(key=lambda entry: entry[1])
+                sell_index[(product, origin, bucket)] = tuple(sell)
+                buy_index[(product, origin, bucket)] = tuple(buy)
+    return sell_index, buy_index
+
+
+def build_spread_matrix(transport, price_table):
+    """Precompute per-product spreads between every pair of markets
+
+    spreads[product][(buy_market, sell_market)] is the per-unit profit of buying
+    in one market and selling in another after transport. Pairs are also kept
+    sorted by spread so arbitrage queries are a slice.
+    """
+    spreads = {}
+    ranked_pairs = {}
+    for product, prices in price_table.items():
+        matrix = {}
+        for buy_market in MARKETS:
+            for sell_market in MARKETS:
+                cost = transport[(product, buy_market, sell_market, DEFAULT_BUCKET)]
+                if buy_market == sell_market or cost == INF:
+                    continue
+                matrix[(buy_market, sell_market)] = round(prices[sell_market] - prices[buy_market] - cost, 2)
+        spreads[product] = matrix
+        ranked_pairs[product] = tuple(sorted(matrix.items(), key=lambda entry: entry[1], reverse=True))
+    return spreads, ranked_pairs
+
+
+def _build(full):
+    global SELL_INDEX, BUY_INDEX, SPREADS, RANKED_PAIRS, PRICES, _built_version
+    # Read first, so a write landing during the build causes another one
+    version = data_version()
+    prices = build_price_table()
+    if full:
+        sell_index, buy_index, spreads, ranked_pairs = {}, {}, {}, {}
+        changed = prices
+    else:
+        # Most writes touch a few products; the others keep their tables
+        sell_index, buy_index = dict(SELL_INDEX), dict(BUY_INDEX)
+        spreads, ranked_pairs = dict(SPREADS), dict(RANKED_PAIRS)
+        changed = {product: row for product, row in prices.items() if row != PRICES[product]}
+    sell, buy = build_rank_index(TRANSPORT, changed)
+    sell_index.update(sell)
+    buy_index.update(buy)
+    matrix, pairs = build_spread_matrix(TRANSPORT, changed)
+    spreads.update(matrix)
+    ranked_pairs.update(pairs)
+    SELL_INDEX, BUY_INDEX, SPREADS, RANKED_PAIRS, PRICES = sell_index, buy_index, spreads, ranked_pairs, prices
+    _built_version = version
+
+
+def rebuild():
+    """Recompute all ranking tables from current prices and road distances"""
+    global TRANSPORT
+    with _lock:
+        TRANSPORT = build_transport_table()
+        _build(full=True)
+
+
+def refresh():
+    """Rebuild the ranking tables if the price data changed since they were built"""
+    if data_version() == _built_version:
+        return
+    with _lock:
+        if data_version() != _built_version:
+            _build(full=False)
+
+
+def rank_markets(product, user_role='farmer', n=5, origin=None, side=None, bucket=DEFAULT_BUCKET):
+    """Top-n markets for a product, best first
+
+    Returns None for unknown products or origins.
+    """
+    refresh()
+    side = side or role_side(user_role)
+    index = SELL_INDEX if side == 'sell' else BUY_INDEX
+    ranked = index.get((product, origin or None, bucket))
+    if ranked is None:
+        return None
+    return [
+        {'market': market, 'net_price': price}
+        for market, price in ranked[:max(0, n)]
+    ]
+
+
+def best_market_price(product, user_role='farmer', origin=None, bucket=DEFAULT_BUCKET):
+    """(best market, net price after transport) for a role, or None for products outside the catalog
+
+    Origins outside the catalog are ranked without transport.
+    """
+    refresh()
+    index = SELL_INDEX if role_side(user_role) == 'sell' else BUY_INDEX
+    ranked = index.get((product, origin or None, bucket)) or index.get((product, None, bucket))
+    return ranked[0] if ranked else None
+
+
+def best_market(product, user_role='farmer', origin=None, bucket=DEFAULT_BUCKET):
+    """Best market for a role
+
+    Products outside the catalog are ranked by market multiplier alone.
+    """
+    best = best_market_price(product, user_role, origin, bucket)
+    if best is not None:
+        return best[0]
+    side = role_side(user_role)
+    pick = max if side == 'sell' else min
+    return pick(MARKETS, key=lambda k: MARKETS[k].multiplier)
+
+
+def find_arbitrage(product, n=5):
+    """Top-n profitable buy/sell market pairs for a product
+
+    Returns None for unknown products.
+    """
+    refresh()
+    ranked = RANKED_PAIRS.get(product)
+    if ranked is None:
+        return None
+    opportunities = []
+    for (buy_market, sell_market), spread in ranked[:max(0, n)]:
+        if spread <= 0:
+            break
+        opportunities.append({'buy_market': buy_market, 'sell_market': sell_market, 'spread': spread})
+    return opportunities
+
+
+_built_version = None
+rebuild()
+routing.add_listener(rebuild)
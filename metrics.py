@@ -0,0 +1,427 @@
+"""Request instrumentation exposed in Prometheus text format at /metrics.
+
+init_app(app) records per-route latency histograms, in-flight requests,
+responses by status class and /analyze payload sizes. Other modules record
+into the shared REGISTRY. The gateway records Gemini call latency and
+failures, and llm_model records model fallback events.
+
+The registry lives in each process. Under a multi-worker server, set
+METRICS_MULTIPROCESS_DIR (gunicorn.conf.py does) and every worker writes its
+values to a file there every METRICS_FLUSH_INTERVAL seconds. /metrics then
+reports counters and histograms summed over every worker that has run, and
+gauges over the workers still alive, whichever worker serves the scrape.
+
+Set METRICS_PROFILE_ROUTES to a comma-separated list of URL rules (for
+example "/analyze,/dashboard") to sample stacks of threads serving those
+routes. Collapsed stacks are served at /metrics/profile, ready for a
+flamegraph tool.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, g, request
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+
+# Directory shared by the worker processes of one server, or empty for single-process metrics
+MULTIPROCESS_DIR = os.getenv('METRICS_MULTIPROCESS_DIR', '')
+
+# Seconds between writes of a worker's values to MULTIPROCESS_DIR
+FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _Metric:
+    kind = None
+    # How values from several processes combine: 'sum', 'max', or 'local' to only report this process
+    aggregate = 'sum'
+    # Whether values from processes that have exited still count
+    keep_exited = True
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values = defaultdict(float)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0.0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def render(self, snapshots=None):
+        """Text lines for this process's values, or for values combined from several process snapshots"""
+        if snapshots is None:
+            with self._lock:
+                items = sorted(self._values.items())
+        else:
+            merged = {}
+            for snapshot in snapshots:
+                for key, value in snapshot:
+                    key = tuple(key)
+                    if key not in merged:
+                        merged[key] = value
+                    elif self.aggregate == 'max':
+                        merged[key] = max(merged[key], value)
+                    else:
+                        merged[key] += value
+            items = sorted(merged.items())
+        return self.header() + [f'{self.name}{_label_text(self.labels, key)} {value}' for key, value in items]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+    keep_exited = False
+
+    def __init__(self, name, documentation, labels=(), aggregate='sum'):
+        super().__init__(name, documentation, labels)
+        self.aggregate = aggregate
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, *label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), list(series[0]), series[1], series[2]] for key, series in self._series.items()]
+
+    def render(self, snapshots=None):
+        """Text lines for this process's values, or for values combined from several process snapshots"""
+        lines = self.header()
+        if snapshots is None:
+            snapshots = [self.snapshot()]
+        merged = {}
+        for snapshot in snapshots:
+            for key, counts, total, count in snapshot:
+                key = tuple(key)
+                series = merged.get(key)
+                if series is None:
+                    merged[key] = [list(counts), total, count]
+                else:
+                    series[0] = [a + b for a, b in zip(series[0], counts)]
+                    series[1] += total
+                    series[2] += count
+        for key, (counts, total, count) in sorted(merged.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _label_text(self.labels + ('le',), key + (bound,))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            lines.append(f'{self.name}_bucket{_label_text(self.labels + ("le",), key + ("+Inf",))} {count}')
+            lines.append(f'{self.name}_sum{_label_text(self.labels, key)} {total}')
+            lines.append(f'{self.name}_count{_label_text(self.labels, key)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self, directory=MULTIPROCESS_DIR, flush_interval=FLUSH_INTERVAL):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._flushing_pid = None
+
+    def add_collector(self, callback):
+        """Call callback() before each render, to set gauges whose values live outside this process"""
+        self._collectors.append(callback)
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._get_or_create(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=(), aggregate='sum'):
+        return self._get_or_create(Gauge, name, documentation, labels, aggregate)
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labels, buckets)
+
+    def clear(self):
+        """Drop every value, such as those a forked worker inherited from its parent"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+    def write(self):
+        """Write this process's values to <directory>/<pid>.json"""
+        with self._lock:
+            metrics = [metric for metric in self._metrics.values() if metric.aggregate != 'local']
+        snapshot = {metric.name: metric.snapshot() for metric in metrics}
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+
+    def _flush(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Warning: could not write metrics: {e}")
+
+    def start_flushing(self):
+        """Write this process's values periodically; call once per process, after any fork"""
+        if not self.directory or self._flushing_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flushing_pid == os.getpid():
+                return
+            self._flushing_pid = os.getpid()
+        threading.Thread(target=self._flush, name='metrics-flush', daemon=True).start()
+
+    def _read_snapshots(self):
+        """[(pid, snapshot)] written by every process, this one included"""
+        self.write()
+        snapshots = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    snapshots.append((int(filename[:-5]), json.load(f)))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self):
+        for callback in self._collectors:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Warning: metrics collector failed: {e}")
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshots = self._read_snapshots() if self.directory else None
+        if snapshots is not None:
+            alive = {pid: _alive(pid) for pid, _ in snapshots}
+        lines = []
+        for metric in metrics:
+            if snapshots is None or metric.aggregate == 'local':
+                lines.extend(metric.render())
+            else:
+                lines.extend(metric.render([snapshot.get(metric.name, []) for pid, snapshot in snapshots
+                                            if metric.keep_exited or alive[pid]]))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    'marketx_request_duration_seconds', 'Request latency by route', ('method', 'route'))
+REQUESTS = REGISTRY.counter(
+    'marketx_requests_total', 'Responses by route and status class', ('method', 'route', 'status'))
+IN_FLIGHT = REGISTRY.gauge('marketx_requests_in_flight', 'Requests currently being handled')
+ERRORS = REGISTRY.counter(
+    'marketx_request_errors_total', 'Responses with a 5xx status or an unhandled exception', ('route',))
+ANALYZE_PAYLOAD = REGISTRY.histogram(
+    'marketx_analyze_response_bytes', 'JSON payload size of analysis responses', ('route',), SIZE_BUCKETS)
+LLM_LATENCY = REGISTRY.histogram('marketx_llm_call_duration_seconds', 'Upstream LLM call latency', ('outcome',))
+LLM_FAILURES = REGISTRY.counter('marketx_llm_failures_total', 'LLM calls that could not be answered', ('reason',))
+LLM_COALESCED = REGISTRY.counter('marketx_llm_coalesced_total', 'Prompts served by an identical in-flight call')
+MODEL_FALLBACKS = REGISTRY.counter(
+    'marketx_model_fallback_total', 'Gemini models that failed to initialize, moving down the fallback chain',
+    ('model',))
+ANALYSIS_FALLBACKS = REGISTRY.counter(
+    'marketx_analysis_fallback_total', 'Analyses answered by the rule-based engine instead of Gemini', ('reason',))
+MODEL_ACTIVE = REGISTRY.gauge(
+    'marketx_model_active', 'Gemini model in use (1) after the fallback chain', ('model',), aggregate='max')
+USER_CACHE = REGISTRY.counter('marketx_user_cache_total', 'User lookups by cache result', ('result',))
+# Set from shared state by a collector at each scrape, so the scraping process's values are the whole story
+PRECOMPUTE_JOBS = REGISTRY.gauge(
+    'marketx_precompute_jobs', 'Precompute jobs of the newest price data version by status', ('status',),
+    aggregate='local')
+PRECOMPUTE_SNAPSHOT_VERSION = REGISTRY.gauge(
+    'marketx_precompute_snapshot_version', 'Price data version of the newest published insight snapshot',
+    aggregate='local')
+PRECOMPUTE_SNAPSHOT_AGE = REGISTRY.gauge(
+    'marketx_precompute_snapshot_age_seconds', 'Seconds since the newest insight snapshot was published',
+    aggregate='local')
+STREAM_CLIENTS = REGISTRY.gauge('marketx_stream_clients', 'Connected Server-Sent Events clients', ('stream',))
+STREAM_REJECTED = REGISTRY.counter(
+    'marketx_stream_rejected_total', 'Streams refused because the process had no free stream slot', ('stream',))
+STREAM_OVERFLOWS = REGISTRY.counter(
+    'marketx_stream_overflow_total', 'Stream clients that fell behind and were sent a snapshot instead')
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads currently serving selected routes"""
+
+    def __init__(self, routes, interval=0.005, max_stacks=5000):
+        self.routes = frozenset(routes)
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.counts = defaultdict(int)
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def enter(self, route):
+        if route not in self.routes:
+            return
+        with self._lock:
+            self._active[threading.get_ident()] = route
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='metrics-profiler', daemon=True)
+                self._thread.start()
+
+    def exit(self):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, route in active.items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                key = route + ';' + ';'.join(reversed(stack))
+                with self._lock:
+                    if key in self.counts or len(self.counts) < self.max_stacks:
+                        self.counts[key] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return ''.join(f'{stack} {count}\n' for stack, count in items)
+
+
+def _route_label():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def init_app(app, analyze_routes=('/analyze', '/analyze/batch')):
+    """Install request instrumentation and the /metrics endpoints on a Flask app"""
+    profile_routes = [route.strip() for route in os.getenv('METRICS_PROFILE_ROUTES', '').split(',') if route.strip()]
+    profiler = SamplingProfiler(profile_routes) if profile_routes else None
+
+    @app.before_request
+    def _start_timer():
+        REGISTRY.start_flushing()
+        g._metrics_start = time.perf_counter()
+        IN_FLIGHT.inc()
+        if profiler is not None:
+            profiler.enter(_route_label())
+
+    @app.after_request
+    def _record(response):
+        route = _route_label()
+        REQUEST_LATENCY.observe(request.method, route, value=time.perf_counter() - g._metrics_start)
+        REQUESTS.inc(request.method, route, f'{response.status_code // 100}xx')
+        if response.status_code >= 500:
+            ERRORS.inc(route)
+        if route in analyze_routes and response.content_length is not None:
+            ANALYZE_PAYLOAD.observe(route, value=response.content_length)
+        g._metrics_recorded = True
+        return response
+
+    @app.teardown_request
+    def _finish(error):
+        if '_metrics_start' not in g:
+            return
+        if error is not None and '_metrics_recorded' not in g:
+            ERRORS.inc(_route_label())
+        IN_FLIGHT.dec()
+        if profiler is not None:
+            profiler.exit()
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus metrics"""
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/metrics/profile')
+    def metrics_profile():
+        """Collapsed stack samples from the sampling profiler"""
+        if profiler is None:
+            return Response('Profiler disabled; set METRICS_PROFILE_ROUTES\n', status=404, mimetype='text/plain')
+        return Response(profiler.render(), mimetype='text/plain')
+
+    return profiler
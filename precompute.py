@@ -0,0 +1,285 @@
+"""Background worker that precomputes forecasts, risk and opportunity scores.
+
+    python precompute.py worker [--processes N] [--interval 60]
+    python precompute.py once [--processes N]
+    python precompute.py status
+
+Whenever the price data version changes, the worker fits the price
+forecasting model once, splits the catalog's products into partitions and
+queues one job per partition in a SQLite job queue (data/precompute.db, or
+PRECOMPUTE_DB_PATH). A pool of processes claims jobs until the queue is
+empty; each is handed the fitted forecasts rather than fitting the model
+again. For every market of its products, a job reads the observed prices
+and computes the price forecast, risk assessment and opportunity score. When every job of a version is done, the
+results are merged and published as an immutable snapshot (see
+insight_snapshots.py), which request handlers then read instead of computing
+inline.
+
+A job whose price data changed while it ran is failed rather than published,
+and the next round computes the new version. Jobs left running by a crashed
+process are queued again after JOB_TIMEOUT seconds. Progress per status is
+kept in the job table: `status` prints it, and the app exports it on
+/metrics.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+
+import forecasting
+import insight_snapshots
+import metrics
+import price_store
+from catalog import MARKETS, PRODUCTS
+from insight_snapshots import encode_cell, get_db_path
+from market_analysis import compute_insights, get_observed_prices
+
+# Jobs queued per worker process, so processes that finish early take more of the work
+PARTITIONS_PER_PROCESS = 2
+
+# Seconds after which a running job is assumed lost and queued again
+JOB_TIMEOUT = 600
+
+DEFAULT_INTERVAL = float(os.getenv('PRECOMPUTE_INTERVAL', '60'))
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    data_version INTEGER NOT NULL,
+    partition INTEGER NOT NULL,
+    partitions INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_at REAL,
+    finished_at REAL,
+    cells INTEGER,
+    result TEXT,
+    error TEXT,
+    UNIQUE (data_version, partition)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+class JobQueue:
+    """Partition jobs in SQLite, shared by the coordinator and its pool processes"""
+
+    def __init__(self, path=None):
+        self.path = path or get_db_path()
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, data_version, partitions):
+        """Queue one job per partition for a data version; failed jobs of that version are queued again"""
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO jobs (data_version, partition, partitions) VALUES (?, ?, ?)',
+                [(data_version, partition, partitions) for partition in range(partitions)])
+            conn.execute("UPDATE jobs SET status = 'queued', error = NULL WHERE data_version = ? AND status = 'failed'",
+                         (data_version,))
+
+    def claim(self, now=None):
+        """Next queued job as a dict, marked running; None when the queue is empty"""
+        now = time.time() if now is None else now
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running' AND claimed_at < ?",
+                         (now - JOB_TIMEOUT,))
+            row = conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, claimed_at = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1) "
+                "RETURNING id, data_version, partition, partitions", (now,)).fetchone()
+        return dict(row) if row else None
+
+    def complete(self, job_id, rows):
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE jobs SET status = 'done', finished_at = ?, cells = ?, result = ? WHERE id = ?",
+                         (time.time(), len(rows), json.dumps(rows, separators=(',', ':')), job_id))
+
+    def fail(self, job_id, error):
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+                         (time.time(), error, job_id))
+
+    def progress(self, data_version=None):
+        """{'data_version', status: count...} for a version, by default the newest queued one"""
+        conn = self._conn()
+        if data_version is None:
+            row = conn.execute('SELECT MAX(data_version) FROM jobs').fetchone()
+            data_version = row[0]
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts.update(conn.execute('SELECT status, COUNT(*) FROM jobs WHERE data_version = ? GROUP BY status',
+                                   (data_version,)).fetchall())
+        return {'data_version': data_version, **counts}
+
+    def results(self, data_version):
+        """Cell rows of every finished job of a version"""
+        rows = []
+        for (result,) in self._conn().execute(
+                "SELECT result FROM jobs WHERE data_version = ? AND status = 'done' ORDER BY partition",
+                (data_version,)):
+            rows.extend(json.loads(result))
+        return rows
+
+    def prune(self, data_version):
+        """Drop jobs of other versions once a version is published"""
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM jobs WHERE data_version != ?', (data_version,))
+
+
+def partition_products(partition, partitions):
+    """Products of one partition; products are dealt out in turn so partitions stay balanced"""
+    return list(PRODUCTS)[partition::partitions]
+
+
+def compute_partition(partition, partitions, forecasts):
+    """Encoded cells for every market of a partition's products that has observed prices"""
+    rows = []
+    for product in partition_products(partition, partitions):
+        for market in MARKETS:
+            observed = get_observed_prices(product, market, forecasts)
+            if observed is not None:
+                rows.append(encode_cell(product, market, observed, compute_insights(product, market, observed)))
+    return rows
+
+
+def work(path, data_version, forecasts):
+    """Pool process body: run queued jobs until none are left; returns how many were done
+
+    forecasts is the forecast table the coordinator fitted for data_version.
+    """
+    queue = JobQueue(path)
+    done = 0
+    while True:
+        job = queue.claim()
+        if job is None:
+            return done
+        if job['data_version'] != data_version:
+            queue.fail(job['id'], 'no forecasts for this data version')
+            continue
+        try:
+            rows = compute_partition(job['partition'], job['partitions'], forecasts)
+            # Cells from two price data versions must not end up in one snapshot
+            if price_store.data_version()[1] != job['data_version']:
+                queue.fail(job['id'], 'price data changed while computing')
+                continue
+            queue.complete(job['id'], rows)
+            done += 1
+        except Exception as e:
+            queue.fail(job['id'], f'{type(e).__name__}: {e}')
+
+
+def run_once(executor, queue, processes):
+    """Compute and publish a snapshot for the current price data if it has none; returns its data version or None"""
+    version = price_store.data_version()
+    if version is None:
+        return None
+    data_version = version[1]
+    published = insight_snapshots.latest(queue.path)
+    if published is not None and published[0] == data_version:
+        return None
+
+    started = time.perf_counter()
+    # Fitted here once; the jobs only look up their series
+    forecasts = forecasting.forecast_table()
+    if price_store.data_version()[1] != data_version:
+        return None
+    partitions = min(len(PRODUCTS), processes * PARTITIONS_PER_PROCESS)
+    queue.enqueue(data_version, partitions)
+    futures = [executor.submit(work, queue.path, data_version, forecasts) for _ in range(processes)]
+    pending = futures
+    while pending:
+        _, pending = wait(pending, timeout=1.0, return_when=FIRST_EXCEPTION)
+        progress = queue.progress(data_version)
+        print(f"data version {data_version}: {progress['done']}/{partitions} partitions done, "
+              f"{progress['running']} running, {progress['failed']} failed")
+    for future in futures:
+        future.result()
+
+    progress = queue.progress(data_version)
+    if progress['done'] != partitions:
+        print(f"Warning: data version {data_version} not published; {progress['failed']} partitions failed")
+        return None
+    rows = queue.results(data_version)
+    insight_snapshots.publish(data_version, rows, queue.path)
+    queue.prune(data_version)
+    print(f"Published data version {data_version}: {len(rows)} cells in {time.perf_counter() - started:.2f}s")
+    return data_version
+
+
+_metrics_queue = None
+
+
+def collect_metrics(path=None):
+    """Set the precompute gauges from the job table and the newest snapshot"""
+    global _metrics_queue
+    path = path or get_db_path()
+    if not os.path.exists(path):
+        return
+    # One queue per process, so scrapes reuse its connections
+    if _metrics_queue is None or _metrics_queue.path != path:
+        _metrics_queue = JobQueue(path)
+    progress = _metrics_queue.progress()
+    for status in JOB_STATUSES:
+        metrics.PRECOMPUTE_JOBS.set(status, value=progress[status])
+    published = insight_snapshots.latest(path)
+    if published is not None:
+        metrics.PRECOMPUTE_SNAPSHOT_VERSION.set(value=published[0])
+        metrics.PRECOMPUTE_SNAPSHOT_AGE.set(value=round(time.time() - published[3], 1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Market X precompute worker')
+    commands = parser.add_subparsers(dest='command', required=True)
+    worker = commands.add_parser('worker', help='recompute whenever the price data changes')
+    worker.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    worker.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help='seconds between price data version checks')
+    once = commands.add_parser('once', help='compute and publish the current version, then exit')
+    once.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    commands.add_parser('status', help='show job progress and the newest snapshot')
+    args = parser.parse_args(argv)
+
+    queue = JobQueue()
+    if args.command == 'status':
+        print(json.dumps({'jobs': queue.progress(), 'snapshot': insight_snapshots.latest(queue.path)}))
+        return 0
+
+    # Spawned processes open their own SQLite connections and forecasting models
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=args.processes, mp_context=context) as executor:
+        if args.command == 'once':
+            run_once(executor, queue, args.processes)
+            return 0
+        while True:
+            try:
+                run_once(executor, queue, args.processes)
+            except Exception as e:
+                print(f"Warning: precompute round failed: {e}")
+            time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
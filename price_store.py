@@ -0,0 +1,324 @@
+"""Persistent store of daily market price observations.
+
+Observations are kept in SQLite, clustered by (product, market, date) so
+per-series range scans are index-only. Every write bumps a version counter,
+and reads go through an in-memory LRU cache keyed by that version, so
+repeated /analyze requests only do a single primary-key lookup until new
+data is ingested by any process. A short log records the earliest date each
+version wrote, so readers that advance state day by day (the forecasting
+model) can tell whether a write went back to days they have already passed.
+
+Bulk ingest from the command line:
+
+    python price_store.py ingest observations.csv [more.csv ...]
+    python price_store.py stats teff jimma
+"""
+import argparse
+import csv
+import math
+import os
+import sqlite3
+import sys
+import threading
+from datetime import date, timedelta
+from functools import lru_cache
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'prices.db')
+
+# Rows written per executemany call during ingest
+INGEST_BATCH_SIZE = 10000
+
+# Days of history used for min/avg/max
+DEFAULT_WINDOW_DAYS = 30
+
+# Versions kept in the write log; readers further behind treat every day as rewritten
+WRITE_LOG_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    product TEXT NOT NULL,
+    market TEXT NOT NULL,
+    date TEXT NOT NULL,
+    price REAL NOT NULL,
+    PRIMARY KEY (product, market, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS observations_product_date ON observations (product, date);
+CREATE INDEX IF NOT EXISTS observations_date ON observations (date);
+CREATE TABLE IF NOT EXISTS writes (
+    version INTEGER PRIMARY KEY,
+    first_date TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta VALUES ('version', 0);
+"""
+
+_local = threading.local()
+
+# Callbacks receiving the set of (product, market) series each add_observations call wrote
+_listeners = []
+
+
+def get_db_path():
+    """Path of the observation database"""
+    return os.getenv('PRICE_DB_PATH', DEFAULT_DB_PATH)
+
+
+def connect(path=None, create=False):
+    """Open a connection to the store, or None if it does not exist yet"""
+    path = path or get_db_path()
+    if not create and not os.path.exists(path):
+        return None
+    if create:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _reader():
+    """Per-thread read connection, opened once the database exists"""
+    path = get_db_path()
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != path:
+        conn = connect(path)
+        _local.conn = conn
+        _local.path = path
+    return conn
+
+
+def reset_connections():
+    """Forget connections opened before a fork; each worker opens its own"""
+    global _local
+    _local = threading.local()
+
+
+def data_version():
+    """Version token that changes whenever any process writes observations"""
+    conn = _reader()
+    if conn is None:
+        return None
+    return get_db_path(), conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+
+def add_listener(callback):
+    """Call callback(series) after observations are written in this process"""
+    _listeners.append(callback)
+
+
+def _notify(series):
+    for callback in _listeners:
+        try:
+            callback(series)
+        except Exception as e:
+            print(f"Warning: observation listener failed: {e}")
+
+
+def _parse_row(row):
+    product = (row.get('product') or '').strip().lower()
+    market = (row.get('market') or '').strip().lower()
+    day = date.fromisoformat((row.get('date') or '').strip()).isoformat()
+    price = float(row.get('price'))
+    # float() accepts 'nan' and 'inf', which would break the NOT NULL column and every analysis
+    if not product or not market or not math.isfinite(price) or price < 0:
+        raise ValueError('invalid observation')
+    return product, market, day, price
+
+
+def _write_batch(conn, batch):
+    conn.executemany('INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?)', batch)
+    version = conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version' RETURNING value").fetchone()[0]
+    conn.execute('INSERT INTO writes VALUES (?, ?)', (version, min(row[2] for row in batch)))
+    conn.execute('DELETE FROM writes WHERE version <= ?', (version - WRITE_LOG_SIZE,))
+    conn.commit()
+
+
+def add_observations(rows, conn=None):
+    """Insert or replace observations from an iterable of dicts
+
+    Rows are consumed lazily and written in batches, so arbitrarily large
+    iterables never sit in memory. Listeners registered with add_listener
+    are then told which series were written. Returns (inserted, skipped) counts.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = connect(create=True)
+
+    inserted = skipped = 0
+    batch = []
+    series = set()
+    try:
+        for row in rows:
+            try:
+                parsed = _parse_row(row)
+            except (TypeError, ValueError):
+                skipped += 1
+                continue
+            batch.append(parsed)
+            series.add(parsed[:2])
+            if len(batch) >= INGEST_BATCH_SIZE:
+                _write_batch(conn, batch)
+                inserted += len(batch)
+                batch = []
+        if batch:
+            _write_batch(conn, batch)
+            inserted += len(batch)
+    finally:
+        if own_conn:
+            conn.close()
+
+    if series:
+        _notify(series)
+    return inserted, skipped
+
+
+def ingest_csv(path, conn=None):
+    """Stream a CSV file with product, market, date and price columns into the store"""
+    with open(path, newline='', encoding='utf-8') as f:
+        return add_observations(csv.DictReader(f), conn)
+
+
+def _window_start(conn, product, market, window_days):
+    """First day of the window ending at the latest observation for a series"""
+    if market is None:
+        latest = conn.execute('SELECT MAX(date) FROM observations WHERE product = ?', (product,)).fetchone()[0]
+    else:
+        latest = conn.execute('SELECT MAX(date) FROM observations WHERE product = ? AND market = ?',
+                              (product, market)).fetchone()[0]
+    if latest is None:
+        return None, None
+    return (date.fromisoformat(latest) - timedelta(days=window_days - 1)).isoformat(), latest
+
+
+@lru_cache(maxsize=4096)
+def _cached_stats(product, market, window_days, version):
+    conn = _reader()
+    start, latest = _window_start(conn, product, market, window_days)
+    if start is None:
+        return None
+
+    if market is None:
+        row = conn.execute(
+            'SELECT MIN(price), AVG(price), MAX(price), COUNT(*) FROM observations '
+            'WHERE product = ? AND date >= ?', (product, start)).fetchone()
+        last = conn.execute(
+            'SELECT AVG(price) FROM observations WHERE product = ? AND date = ?', (product, latest)).fetchone()[0]
+    else:
+        row = conn.execute(
+            'SELECT MIN(price), AVG(price), MAX(price), COUNT(*) FROM observations '
+            'WHERE product = ? AND market = ? AND date >= ?', (product, market, start)).fetchone()
+        last = conn.execute(
+            'SELECT price FROM observations WHERE product = ? AND market = ? AND date = ?',
+            (product, market, latest)).fetchone()[0]
+
+    return {'min': row[0], 'avg': row[1], 'max': row[2], 'count': row[3], 'latest': last, 'as_of': latest}
+
+
+def get_price_stats(product, market=None, window_days=DEFAULT_WINDOW_DAYS):
+    """Min/avg/max/latest price over the most recent window, or None without data
+
+    market None aggregates across every market for the product.
+    """
+    version = data_version()
+    if version is None:
+        return None
+    return _cached_stats(product, market, window_days, version)
+
+
+@lru_cache(maxsize=1024)
+def _cached_recent(product, market, days, version):
+    conn = _reader()
+    start, _ = _window_start(conn, product, market, days)
+    if start is None:
+        return ()
+    return tuple(conn.execute(
+        'SELECT date, price FROM observations WHERE product = ? AND market = ? AND date >= ? ORDER BY date',
+        (product, market, start)).fetchall())
+
+
+def get_recent_prices(product, market, days=DEFAULT_WINDOW_DAYS):
+    """(date, price) pairs for the most recent days of a series, oldest first"""
+    version = data_version()
+    if version is None:
+        return ()
+    return _cached_recent(product, market, days, version)
+
+
+def latest_date():
+    """Most recent observation date across all series, or None"""
+    conn = _reader()
+    if conn is None:
+        return None
+    return conn.execute('SELECT MAX(date) FROM observations').fetchone()[0]
+
+
+def first_date_written_since(version):
+    """Earliest observation date written by versions after version, or None when the write log cannot tell"""
+    conn = _reader()
+    if conn is None:
+        return None
+    current = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+    writes, first_date = conn.execute('SELECT COUNT(*), MIN(first_date) FROM writes WHERE version > ?',
+                                      (version,)).fetchone()
+    # Versions pruned from the log, or written before it existed, could have touched any day
+    if writes == 0 or writes != current - version:
+        return None
+    return first_date
+
+
+def iter_observations(start=None, after=None):
+    """Stream (product, market, date, price) rows ordered by series and date
+
+    start includes that day, after excludes it.
+    """
+    conn = _reader()
+    if conn is None:
+        return iter(())
+    if after is not None:
+        return conn.execute('SELECT * FROM observations WHERE date > ? ORDER BY product, market, date', (after,))
+    if start is not None:
+        return conn.execute('SELECT * FROM observations WHERE date >= ? ORDER BY product, market, date', (start,))
+    return conn.execute('SELECT * FROM observations ORDER BY product, market, date')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Market X price observation store')
+    parser.add_argument('--db', help='database path (default: $PRICE_DB_PATH or data/prices.db)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest = commands.add_parser('ingest', help='bulk load CSV files (product,market,date,price)')
+    ingest.add_argument('files', nargs='+')
+
+    stats = commands.add_parser('stats', help='show recent price statistics')
+    stats.add_argument('product')
+    stats.add_argument('market', nargs='?')
+    stats.add_argument('--days', type=int, default=DEFAULT_WINDOW_DAYS)
+
+    args = parser.parse_args(argv)
+    if args.db:
+        os.environ['PRICE_DB_PATH'] = args.db
+
+    if args.command == 'ingest':
+        conn = connect(create=True)
+        try:
+            for path in args.files:
+                inserted, skipped = ingest_csv(path, conn)
+                print(f"{path}: {inserted} observations stored, {skipped} rows skipped")
+        finally:
+            conn.close()
+        return 0
+
+    result = get_price_stats(args.product.lower(), args.market.lower() if args.market else None, args.days)
+    if result is None:
+        print('No observations found')
+        return 1
+    print(result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
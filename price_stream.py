@@ -0,0 +1,193 @@
+"""Live price updates pushed to many clients from one publisher.
+
+A single background thread ticks every PRICE_STREAM_TICK seconds. When the
+price store's data version has changed, it recomputes a snapshot once for
+every (product, market) pair that any client subscribes to. It then sends
+each client only the changed pairs it asked for, so a tick costs the same
+whether one dashboard is connected or hundreds.
+
+Each client has a bounded queue. A client that falls behind is not allowed
+to grow memory: its backlog is dropped and it gets one full snapshot of its
+pairs instead. Sent deltas are kept in a ring buffer, so a browser that
+reconnects with Last-Event-ID gets the deltas it missed, or a fresh snapshot
+when they are no longer buffered. Event ids start from the publisher's
+start time, so ids from another worker or an earlier process never match
+the buffer and always lead to a snapshot.
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from catalog import get_product
+from market_analysis import lookup_analysis
+from metrics import STREAM_CLIENTS, STREAM_OVERFLOWS
+from price_store import data_version, get_price_stats
+
+TICK_SECONDS = float(os.getenv('PRICE_STREAM_TICK', '5'))
+
+# Deltas kept for clients reconnecting with Last-Event-ID
+REPLAY_EVENTS = 256
+
+# Undelivered deltas per client before it is switched to a snapshot
+MAX_PENDING = 32
+
+# Most product/market pairs one client may subscribe to
+MAX_PAIRS = 50
+
+# Sentinel returned by Subscriber.next when the client needs a full snapshot
+RESYNC = 'resync'
+
+
+def parse_pairs(value):
+    """[(product, market), ...] from "teff:jimma,coffee:addis-ababa"; raises ValueError"""
+    pairs = []
+    for item in (value or '').split(','):
+        product, _, market = item.strip().lower().partition(':')
+        if not product.strip() or not market.strip():
+            raise ValueError('pairs must look like product:market,product:market')
+        pair = (product.strip(), market.strip())
+        if pair not in pairs:
+            pairs.append(pair)
+    if len(pairs) > MAX_PAIRS:
+        raise ValueError(f'At most {MAX_PAIRS} pairs per stream')
+    return pairs
+
+
+def pair_snapshot(product, market):
+    """Role-independent live figures for one product in one market"""
+    analysis = lookup_analysis('farmer', product, market)
+    insights = analysis['detailed_insights']
+    stats = get_price_stats(product, market)
+    return {
+        'product': product,
+        'market': market,
+        'price': insights['price_forecast']['current_price'],
+        'unit': get_product(product).unit,
+        'next_week': insights['price_forecast']['next_week'],
+        'trend': analysis['trend'],
+        'opportunity_score': insights['opportunity_score'],
+        'observed': stats['latest'] if stats else None,
+        'as_of': stats['as_of'] if stats else None,
+    }
+
+
+class Subscriber:
+    """One connected client: its pairs and a bounded queue of pending deltas"""
+
+    __slots__ = ('pairs', 'queue', 'overflowed')
+
+    def __init__(self, pairs):
+        self.pairs = tuple(pairs)
+        self.queue = queue.Queue(maxsize=MAX_PENDING)
+        self.overflowed = False
+
+    def offer(self, event_id, changes):
+        try:
+            self.queue.put_nowait((event_id, changes))
+        except queue.Full:
+            if not self.overflowed:
+                STREAM_OVERFLOWS.inc()
+            self.overflowed = True
+
+    def next(self, timeout):
+        """(event id, changes), RESYNC after an overflow, or None when idle for timeout seconds"""
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return RESYNC
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class PricePublisher:
+    """Computes snapshots once per tick and fans deltas out to subscribers"""
+
+    def __init__(self, tick=TICK_SECONDS):
+        self.tick_seconds = tick
+        self._subscribers = set()
+        self._state = {}
+        self._version = None
+        self._events = deque(maxlen=REPLAY_EVENTS)
+        self.last_id = int(time.time()) * 1000000
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, pairs):
+        subscriber = Subscriber(pairs)
+        with self._lock:
+            for pair in subscriber.pairs:
+                if pair not in self._state:
+                    self._state[pair] = pair_snapshot(*pair)
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='price-stream', daemon=True)
+                self._thread.start()
+        STREAM_CLIENTS.inc('prices')
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+        STREAM_CLIENTS.dec('prices')
+
+    def snapshot(self, pairs):
+        """(last event id, current figures for pairs)"""
+        with self._lock:
+            return self.last_id, [self._state[pair] for pair in pairs if pair in self._state]
+
+    def replay(self, pairs, after):
+        """Deltas for pairs sent after the given id, or None if they are no longer buffered"""
+        with self._lock:
+            if after == self.last_id:
+                return []
+            if not self._events or not self._events[0][0] - 1 <= after < self.last_id:
+                return None
+            wanted = set(pairs)
+            replayed = []
+            for event_id, changes in self._events:
+                if event_id > after:
+                    matching = [snapshot for pair, snapshot in changes.items() if pair in wanted]
+                    if matching:
+                        replayed.append((event_id, matching))
+            return replayed
+
+    def tick(self):
+        """Recompute subscribed pairs if price data changed and publish the differences"""
+        version = data_version()
+        if version == self._version:
+            return
+        with self._lock:
+            pairs = {pair for subscriber in self._subscribers for pair in subscriber.pairs}
+        # Computed outside the lock so new subscribers are not held up
+        fresh = {pair: pair_snapshot(*pair) for pair in pairs}
+
+        with self._lock:
+            changes = {pair: snapshot for pair, snapshot in fresh.items() if self._state.get(pair) != snapshot}
+            # Forget pairs nobody subscribes to any more
+            subscribed = {pair for subscriber in self._subscribers for pair in subscriber.pairs}
+            self._state = {pair: snapshot for pair, snapshot in self._state.items() if pair in subscribed}
+            self._state.update((pair, snapshot) for pair, snapshot in fresh.items() if pair in subscribed)
+            self._version = version
+            if not changes:
+                return
+            self.last_id += 1
+            self._events.append((self.last_id, changes))
+            for subscriber in self._subscribers:
+                matching = [changes[pair] for pair in subscriber.pairs if pair in changes]
+                if matching:
+                    subscriber.offer(self.last_id, matching)
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick_seconds)
+            if not self._subscribers:
+                continue
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Warning: price stream tick failed: {e}")
@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request, session
+
+# Rendered pages kept per (route, role, lang)
+PAGE_CACHE_SIZE = 256
+
+# Serialized /analyze results kept per normalized request body
+ANALYSIS_CACHE_SIZE = 4096
+
+# Browsers may reuse a page for this long before revalidating with If-None-Match
+PAGE_MAX_AGE = 300
+
+# Smaller bodies gain too little from gzip to be worth the header overhead
+GZIP_MIN_SIZE = 1024
+
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used entry"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CachedBody:
+    """Encoded response body with its strong ETag and a lazily built gzip variant"""
+
+    __slots__ = ('body', 'etag', 'mimetype', '_gzipped')
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.mimetype = mimetype
+        self._gzipped = None
+
+    def gzipped(self):
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6, mtime=0)
+        return self._gzipped
+
+
+page_cache = LRUCache(PAGE_CACHE_SIZE)
+analysis_cache = LRUCache(ANALYSIS_CACHE_SIZE)
+
+
+def conditional_response(cached, cache_control):
+    """Response for a cached body, or 304 when the client already has it
+
+    Bodies over GZIP_MIN_SIZE are sent gzipped to clients that accept it,
+    compressed once per cached entry rather than once per request.
+    """
+    if len(cached.body) >= GZIP_MIN_SIZE and request.accept_encodings['gzip']:
+        response = current_app.response_class(cached.gzipped(), mimetype=cached.mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(cached.etag + '-gzip')
+    else:
+        response = current_app.response_class(cached.body, mimetype=cached.mimetype)
+        response.set_etag(cached.etag)
+    response.headers['Cache-Control'] = cache_control
+    response.vary.add('Cookie')
+    response.vary.add('Accept-Encoding')
+    return response.make_conditional(request)
+
+
+def cached_page(view):
+    """Cache a rendered template per (route, role, lang) and answer revalidations with 304
+
+    Only use on views whose output depends on nothing but the user's role and language.
+    """
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        key = (request.path, session.get('user_role', 'farmer'), session.get('language', 'en'))
+        cached = page_cache.get(key)
+        if cached is None:
+            rendered = view(*args, **kwargs)
+            if not isinstance(rendered, str):
+                return rendered
+            cached = CachedBody(rendered.encode('utf-8'), 'text/html')
+            page_cache.put(key, cached)
+        return conditional_response(cached, f'private, max-age={PAGE_MAX_AGE}')
+    return decorated_function
+
+
+def json_body(result):
+    """Serialize a result exactly as jsonify would"""
+    return CachedBody(current_app.json.dumps(result).encode('utf-8') + b'\n', 'application/json')
@@ -0,0 +1,227 @@
+"""Declarative per-role recommendation rules, compiled into band lookup tables.
+
+Each role lists rules as (comparison, threshold, recommendation, phrase),
+checked in order against the market multiplier; the last rule has no
+threshold and always matches. At import the rules are evaluated once for
+every multiplier band (hundredths, the precision multipliers are rounded
+to), so choosing a recommendation is a single tuple index.
+
+Texts are kept per language in the same tables: the recommendation
+wording, the phrase each rule contributes, and one reasoning template per
+role. Only the requested role and language are ever rendered, on demand.
+"""
+import operator
+from enum import Enum
+from functools import lru_cache
+
+LANGUAGES = ('en', 'am')
+
+# Multipliers are looked up in hundredths, clamped to 0.00-3.00
+BANDS_PER_UNIT = 100
+MAX_BAND = 300
+
+
+class Recommendation(Enum):
+    """What a role is advised to do; the value is the English wording"""
+
+    SELL_IMMEDIATELY = 'Sell Immediately'
+    SELL_THIS_WEEK = 'Sell This Week'
+    WAIT_WEEKS = 'Wait 2-3 Weeks'
+    HOLD = 'Hold for Better Prices'
+    BUY_BULK_DISCOUNT = 'Buy Now - Bulk Discount Available'
+    BUY_AND_HOLD = 'Buy and Hold for Price Increase'
+    WAIT_FOR_SUPPLY = 'Wait for Better Supply'
+    SEEK_ALTERNATIVE_MARKETS = 'Seek Alternative Markets'
+    BULK_PURCHASE = 'Bulk Purchase Now'
+    NEGOTIATE_DISCOUNT = 'Negotiate Volume Discount'
+    STANDARD_PURCHASE = 'Standard Purchase'
+    SEEK_ALTERNATIVES = 'Seek Alternatives or Reduce Usage'
+    BUY_GOOD_VALUE = 'Buy Now - Good Value'
+    WAIT_FOR_SALES = 'Wait for Sales or Alternatives'
+    CONSIDER_SUBSTITUTES = 'Consider Substitutes or Reduce Consumption'
+    GROUP_SALE_NOW = 'Organize Group Sale Immediately'
+    GROUP_SALE_THIS_WEEK = 'Coordinate Group Sale This Week'
+    POOL_RESOURCES = 'Pool Resources for Better Timing'
+    COLLECTIVE_BARGAINING = 'Collective Bargaining for Future Sale'
+    MONITOR_STABILITY = 'Monitor Market Stability'
+    INVESTIGATE_VOLATILITY = 'Investigate Price Volatility'
+    INTERVENE = 'Implement Market Intervention Measures'
+
+    @property
+    def timeline(self):
+        """Key of the action timeline for this recommendation"""
+        return TIMELINES.get(self, 'long_term')
+
+
+TIMELINES = {
+    Recommendation.SELL_IMMEDIATELY: 'immediate',
+    Recommendation.GROUP_SALE_NOW: 'immediate',
+    Recommendation.SELL_THIS_WEEK: 'this_week',
+    Recommendation.GROUP_SALE_THIS_WEEK: 'this_week',
+    Recommendation.WAIT_WEEKS: 'wait',
+    Recommendation.WAIT_FOR_SUPPLY: 'wait',
+    Recommendation.WAIT_FOR_SALES: 'wait',
+}
+
+RECOMMENDATION_TEXT = {
+    'am': {
+        Recommendation.SELL_IMMEDIATELY: 'ወዲያውኑ ይሽጡ',
+        Recommendation.SELL_THIS_WEEK: 'በዚህ ሳምንት ይሽጡ',
+        Recommendation.WAIT_WEEKS: '2-3 ሳምንት ይጠብቁ',
+        Recommendation.HOLD: 'የተሻለ ዋጋ እስኪገኝ ያቆዩ',
+        Recommendation.BUY_BULK_DISCOUNT: 'አሁን ይግዙ - የጅምላ ቅናሽ አለ',
+        Recommendation.BUY_AND_HOLD: 'ገዝተው ለዋጋ ጭማሪ ያቆዩ',
+        Recommendation.WAIT_FOR_SUPPLY: 'የተሻለ አቅርቦት ይጠብቁ',
+        Recommendation.SEEK_ALTERNATIVE_MARKETS: 'ሌሎች ገበያዎችን ይፈልጉ',
+        Recommendation.BULK_PURCHASE: 'አሁን በጅምላ ይግዙ',
+        Recommendation.NEGOTIATE_DISCOUNT: 'የብዛት ቅናሽ ይደራደሩ',
+        Recommendation.STANDARD_PURCHASE: 'መደበኛ ግዢ',
+        Recommendation.SEEK_ALTERNATIVES: 'አማራጮችን ይፈልጉ ወይም አጠቃቀምን ይቀንሱ',
+        Recommendation.BUY_GOOD_VALUE: 'አሁን ይግዙ - ጥሩ ዋጋ',
+        Recommendation.WAIT_FOR_SALES: 'ቅናሽ ወይም አማራጭ ይጠብቁ',
+        Recommendation.CONSIDER_SUBSTITUTES: 'ተተኪዎችን ያስቡ ወይም ፍጆታን ይቀንሱ',
+        Recommendation.GROUP_SALE_NOW: 'ወዲያውኑ የጋራ ሽያጭ ያደራጁ',
+        Recommendation.GROUP_SALE_THIS_WEEK: 'በዚህ ሳምንት የጋራ ሽያጭ ያስተባብሩ',
+        Recommendation.POOL_RESOURCES: 'ለተሻለ ጊዜ ሀብትን ያሰባስቡ',
+        Recommendation.COLLECTIVE_BARGAINING: 'ለወደፊት ሽያጭ በጋራ ይደራደሩ',
+        Recommendation.MONITOR_STABILITY: 'የገበያ መረጋጋትን ይከታተሉ',
+        Recommendation.INVESTIGATE_VOLATILITY: 'የዋጋ መዋዠቅን ይመርምሩ',
+        Recommendation.INTERVENE: 'የገበያ ጣልቃ ገብነት እርምጃዎችን ይተግብሩ',
+    },
+}
+
+ROLE_RULES = {
+    'farmer': {
+        'reasoning': {
+            'en': 'As a farmer, {market} offers {phrase} for your {product}. '
+                  'Consider seasonal factors and market competition.',
+            'am': 'እንደ ገበሬ፣ {market} ለ{product}ዎ {phrase} ያቀርባል። ወቅታዊ ሁኔታዎችን እና የገበያ ውድድርን ያስቡ።',
+        },
+        'rules': (
+            ('>=', 1.15, Recommendation.SELL_IMMEDIATELY, {'en': 'excellent prices', 'am': 'እጅግ ጥሩ ዋጋ'}),
+            ('>=', 1.05, Recommendation.SELL_THIS_WEEK, {'en': 'good prices', 'am': 'ጥሩ ዋጋ'}),
+            ('>=', 0.95, Recommendation.WAIT_WEEKS, {'en': 'fair prices', 'am': 'መካከለኛ ዋጋ'}),
+            (None, None, Recommendation.HOLD, {'en': 'below average prices', 'am': 'ከአማካይ በታች ዋጋ'}),
+        ),
+    },
+    'trader': {
+        'reasoning': {
+            'en': 'As a trader, {market} presents {phrase} for {product}. '
+                  'Consider transport costs and market competition.',
+            'am': 'እንደ ነጋዴ፣ {market} ለ{product} {phrase} ያቀርባል። የትራንስፖርት ወጪንና የገበያ ውድድርን ያስቡ።',
+        },
+        'rules': (
+            ('<=', 0.9, Recommendation.BUY_BULK_DISCOUNT, {'en': 'excellent buying opportunity', 'am': 'እጅግ ጥሩ የግዢ ዕድል'}),
+            ('<=', 1.0, Recommendation.BUY_AND_HOLD, {'en': 'good opportunity', 'am': 'ጥሩ ዕድል'}),
+            ('<=', 1.1, Recommendation.WAIT_FOR_SUPPLY, {'en': 'moderate opportunity', 'am': 'መካከለኛ ዕድል'}),
+            (None, None, Recommendation.SEEK_ALTERNATIVE_MARKETS, {'en': 'challenging conditions', 'am': 'አስቸጋሪ ሁኔታ'}),
+        ),
+    },
+    'business': {
+        'reasoning': {
+            'en': 'For your business, {market} offers {phrase} for {product}. '
+                  'Consider supply chain reliability and quality consistency.',
+            'am': 'ለንግድ ድርጅትዎ፣ {market} ለ{product} {phrase} ያቀርባል። '
+                  'የአቅርቦት ሰንሰለት አስተማማኝነትንና የጥራት ወጥነትን ያስቡ።',
+        },
+        'rules': (
+            ('<=', 0.85, Recommendation.BULK_PURCHASE, {'en': 'cost-effective procurement', 'am': 'ወጪ ቆጣቢ ግዢ'}),
+            ('<=', 0.95, Recommendation.NEGOTIATE_DISCOUNT, {'en': 'reasonable pricing', 'am': 'ምክንያታዊ ዋጋ'}),
+            ('<=', 1.05, Recommendation.STANDARD_PURCHASE, {'en': 'market rates', 'am': 'የገበያ ዋጋ'}),
+            (None, None, Recommendation.SEEK_ALTERNATIVES, {'en': 'premium pricing', 'am': 'ከፍተኛ ዋጋ'}),
+        ),
+    },
+    'consumer': {
+        'reasoning': {
+            'en': 'As a consumer, {product} prices in {market} are {phrase}. '
+                  'Consider quality vs price and seasonal availability.',
+            'am': 'እንደ ሸማች፣ በ{market} የ{product} ዋጋ {phrase} ነው። ጥራትን ከዋጋ ጋር እና ወቅታዊ አቅርቦትን ያስቡ።',
+        },
+        'rules': (
+            ('<=', 0.85, Recommendation.BUY_GOOD_VALUE, {'en': 'excellent value', 'am': 'እጅግ ተመጣጣኝ'}),
+            ('<=', 0.95, Recommendation.STANDARD_PURCHASE, {'en': 'fair', 'am': 'ተገቢ'}),
+            ('<=', 1.05, Recommendation.WAIT_FOR_SALES, {'en': 'above average', 'am': 'ከአማካይ በላይ'}),
+            (None, None, Recommendation.CONSIDER_SUBSTITUTES, {'en': 'expensive', 'am': 'ውድ'}),
+        ),
+    },
+    'cooperative': {
+        'reasoning': {
+            'en': 'Your cooperative can leverage collective bargaining power in {market}. '
+                  'Current conditions {phrase} for {product}.',
+            'am': 'ማህበርዎ በ{market} የጋራ የመደራደር አቅሙን መጠቀም ይችላል። አሁን ያለው ሁኔታ ለ{product} {phrase}።',
+        },
+        'rules': (
+            ('>=', 1.15, Recommendation.GROUP_SALE_NOW,
+             {'en': 'favor immediate group action', 'am': 'ፈጣን የጋራ እርምጃን ይደግፋል'}),
+            ('>=', 1.05, Recommendation.GROUP_SALE_THIS_WEEK,
+             {'en': 'support coordinated selling', 'am': 'የተቀናጀ ሽያጭን ይደግፋል'}),
+            ('>=', 0.95, Recommendation.POOL_RESOURCES,
+             {'en': 'require strategic timing', 'am': 'ስልታዊ የጊዜ አመራረጥን ይጠይቃል'}),
+            (None, None, Recommendation.COLLECTIVE_BARGAINING,
+             {'en': 'suggest waiting for better conditions', 'am': 'የተሻለ ሁኔታ መጠበቅን ይጠቁማል'}),
+        ),
+    },
+    'government': {
+        'reasoning': {
+            'en': 'Market analysis for {product} in {market} shows {phrase}. '
+                  'Monitor supply chain factors and market efficiency impacts.',
+            'am': 'በ{market} የ{product} የገበያ ትንተና {phrase} ያሳያል። የአቅርቦት ሰንሰለት ሁኔታዎችንና የገበያ ቅልጥፍናን ይከታተሉ።',
+        },
+        'rules': (
+            ('<=', 1.1, Recommendation.MONITOR_STABILITY, {'en': 'stable conditions', 'am': 'የተረጋጋ ሁኔታ'}),
+            ('<=', 1.2, Recommendation.INVESTIGATE_VOLATILITY, {'en': 'moderate volatility', 'am': 'መካከለኛ መዋዠቅ'}),
+            (None, None, Recommendation.INTERVENE, {'en': 'high volatility', 'am': 'ከፍተኛ መዋዠቅ'}),
+        ),
+    },
+}
+
+# Roles without rules of their own are advised like farmers
+DEFAULT_ROLE = 'farmer'
+
+COMPARISONS = {'>=': operator.ge, '<=': operator.le}
+
+
+def compile_rules(role_rules):
+    """{role: tuple of rules indexed by multiplier band} with the first matching rule per band"""
+    tables = {}
+    for role, spec in role_rules.items():
+        rules = spec['rules']
+        if rules[-1][0] is not None:
+            raise ValueError(f'{role} rules must end with a rule that always matches')
+        table = []
+        for band in range(MAX_BAND + 1):
+            multiplier = band / BANDS_PER_UNIT
+            table.append(next(rule for rule in rules
+                              if rule[0] is None or COMPARISONS[rule[0]](multiplier, rule[1])))
+        tables[role] = tuple(table)
+    return tables
+
+
+RULE_TABLES = compile_rules(ROLE_RULES)
+
+# Rules by (role, recommendation), to render a recommendation already chosen
+RULES_BY_RECOMMENDATION = {
+    (role, rule[2]): rule for role, spec in ROLE_RULES.items() for rule in spec['rules']}
+
+
+def band(multiplier):
+    return min(max(int(round(multiplier * BANDS_PER_UNIT)), 0), MAX_BAND)
+
+
+def recommend(user_role, multiplier):
+    """Recommendation for a role at a market multiplier"""
+    return RULE_TABLES.get(user_role, RULE_TABLES[DEFAULT_ROLE])[band(multiplier)][2]
+
+
+@lru_cache(maxsize=4096)
+def render(user_role, recommendation, product, market, lang='en'):
+    """(recommendation text, reasoning) for a role's recommendation in a language
+
+    Unknown languages fall back to English.
+    """
+    role = user_role if user_role in ROLE_RULES else DEFAULT_ROLE
+    lang = lang if lang in LANGUAGES else 'en'
+    phrases = RULES_BY_RECOMMENDATION[(role, recommendation)][3]
+    text = RECOMMENDATION_TEXT.get(lang, {}).get(recommendation, recommendation.value)
+    reasoning = ROLE_RULES[role]['reasoning'][lang].format(market=market.title(), product=product, phrase=phrases[lang])
+    return text, reasoning
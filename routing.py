@@ -0,0 +1,210 @@
+"""Road distances and transport costs between markets.
+
+The road graph (catalog.ROADS) is reduced to all-pairs shortest distances
+with a vectorized Floyd-Warshall at import, and again whenever a road is
+changed with set_road() or remove_road(). Lookups are then two list
+indexes by market id. Markets without coordinates, such as the farm-gate
+'local' market, are not places on the road graph: they are reached from
+any market by a short local haul and are never used as a shortcut between
+other markets.
+
+Transport cost per unit is distance x the product's freight_per_km, scaled
+by a quantity bucket: small loads travel by bus or pack animal at a premium,
+and truck loads are cheaper per unit.
+"""
+import math
+import re
+import threading
+
+import numpy as np
+
+from catalog import MARKETS, MARKETS_BY_ID, ROADS, get_product
+
+# Distance assumed between a farm-gate market and any other market
+LOCAL_HAUL_KM = 50.0
+
+# Upper bounds (exclusive) of each quantity bucket, per product unit
+BUCKET_LIMITS = {'kg': (100, 1000, 10000), 'animal': (2, 10, 50)}
+
+# Freight rate multiplier for each bucket: small loads, part loads, truck loads, bulk
+BUCKET_FACTORS = (2.0, 1.3, 1.0, 0.8)
+
+# Bucket used when no quantity is given
+DEFAULT_BUCKET = 2
+
+# Quantity unit words and how many kg (or animals) each one is
+QUANTITY_UNITS = {
+    'kg': 1, 'kgs': 1, 'kilo': 1, 'kilos': 1, 'kilogram': 1, 'kilograms': 1,
+    'q': 100, 'quintal': 100, 'quintals': 100,
+    't': 1000, 'ton': 1000, 'tons': 1000, 'tonne': 1000, 'tonnes': 1000,
+    'g': 0.001, 'gram': 0.001, 'grams': 0.001,
+    'head': 1, 'heads': 1, 'animal': 1, 'animals': 1, 'colony': 1, 'colonies': 1, 'hive': 1, 'hives': 1,
+}
+
+# Largest amount accepted, in kg (or animals); larger or non-finite amounts are rejected
+MAX_QUANTITY = 10_000_000
+
+_QUANTITY_PATTERN = re.compile(r'^\s*([\d,]*\.?\d+)\s*([a-z]*)')
+
+_roads = {}
+_listeners = []
+_lock = threading.Lock()
+
+
+def _road_key(a, b):
+    return (a, b) if a <= b else (b, a)
+
+
+def shortest_paths(roads, n):
+    """(distances, next hops) for n markets from {(market id, market id): km}
+
+    distances[i][j] is inf when j cannot be reached from i; next_hop[i][j]
+    is the first market after i on the shortest path, or -1.
+    """
+    dist = np.full((n, n), np.inf)
+    next_hop = np.full((n, n), -1, dtype=np.int64)
+    np.fill_diagonal(dist, 0.0)
+    np.fill_diagonal(next_hop, np.arange(n))
+    for (i, j), km in roads.items():
+        if km < dist[i, j]:
+            dist[i, j] = dist[j, i] = km
+            next_hop[i, j], next_hop[j, i] = j, i
+
+    for k in range(n):
+        through = dist[:, k, None] + dist[None, k, :]
+        shorter = through < dist
+        dist = np.where(shorter, through, dist)
+        next_hop = np.where(shorter, next_hop[:, k, None], next_hop)
+    return dist, next_hop
+
+
+def build_tables(roads):
+    """Distance and next-hop tables over catalog markets as nested tuples for O(1) lookups"""
+    dist, next_hop = shortest_paths({(MARKETS[a].id, MARKETS[b].id): km for (a, b), km in roads.items()},
+                                    len(MARKETS_BY_ID))
+
+    # Unlocated markets are a local haul from everywhere, and never a transit point
+    for market in MARKETS_BY_ID:
+        if market.lat is not None:
+            continue
+        dist[market.id, :] = dist[:, market.id] = LOCAL_HAUL_KM
+        next_hop[market.id, :] = np.arange(len(MARKETS_BY_ID))
+        next_hop[:, market.id] = market.id
+        dist[market.id, market.id] = 0.0
+    return tuple(map(tuple, dist.tolist())), tuple(map(tuple, next_hop.tolist()))
+
+
+def rebuild():
+    """Recompute all-pairs distances from the current roads and notify listeners"""
+    global DISTANCES, NEXT_HOP
+    with _lock:
+        DISTANCES, NEXT_HOP = build_tables(_roads)
+    for callback in _listeners:
+        callback()
+
+
+def add_listener(callback):
+    """Call callback() after distances are recomputed"""
+    _listeners.append(callback)
+
+
+def set_road(a, b, km):
+    """Add a road or change its length, then recompute distances"""
+    if a == b or MARKETS.get(a) is None or MARKETS.get(b) is None or None in (MARKETS[a].lat, MARKETS[b].lat):
+        raise ValueError('roads join two different catalog markets with coordinates')
+    if km <= 0:
+        raise ValueError('road length must be positive')
+    _roads[_road_key(a, b)] = float(km)
+    rebuild()
+
+
+def remove_road(a, b):
+    """Remove a road, then recompute distances; returns False if there was none"""
+    if _roads.pop(_road_key(a, b), None) is None:
+        return False
+    rebuild()
+    return True
+
+
+def distance(origin, destination):
+    """Shortest road distance in km between two catalog markets, or None if unknown or unreachable"""
+    a = MARKETS.get(origin)
+    b = MARKETS.get(destination)
+    if a is None or b is None:
+        return None
+    km = DISTANCES[a.id][b.id]
+    return None if km == float('inf') else km
+
+
+def route(origin, destination):
+    """Market names along the shortest road from origin to destination, or None"""
+    if distance(origin, destination) is None:
+        return None
+    i, j = MARKETS[origin].id, MARKETS[destination].id
+    path = [origin]
+    while i != j:
+        i = NEXT_HOP[i][j]
+        path.append(MARKETS_BY_ID[i].key)
+    return path
+
+
+def _amount(quantity):
+    """Amount in kg (or animals) as written, without range checks, or None if there is none"""
+    if isinstance(quantity, (int, float)):
+        try:
+            return float(quantity)
+        except OverflowError:
+            # JSON integers have no size limit
+            return math.inf
+    match = _QUANTITY_PATTERN.match(str(quantity or '').lower())
+    if match is None:
+        return None
+    amount = float(match.group(1).replace(',', ''))
+    unit = match.group(2)
+    if unit and unit not in QUANTITY_UNITS:
+        return None
+    return amount * QUANTITY_UNITS.get(unit, 1)
+
+
+def parse_quantity(quantity):
+    """Amount in kg (or animals) from input like '100 kg', '2 quintals', '1.5t' or '10', or None"""
+    amount = _amount(quantity)
+    # Also false for nan and inf
+    if amount is None or not 0 < amount <= MAX_QUANTITY:
+        return None
+    return amount
+
+
+def quantity_error(quantity):
+    """Error message for a quantity that is not finite or above MAX_QUANTITY, else None"""
+    amount = _amount(quantity)
+    if amount is not None and not amount <= MAX_QUANTITY:
+        return f'quantity must be a number no larger than {MAX_QUANTITY:,} kg (or animals)'
+    return None
+
+
+def quantity_bucket(product, quantity):
+    """Freight bucket index for a raw quantity of a product"""
+    amount = parse_quantity(quantity)
+    if amount is None:
+        return DEFAULT_BUCKET
+    limits = BUCKET_LIMITS.get(get_product(product).unit, BUCKET_LIMITS['kg'])
+    for bucket, limit in enumerate(limits):
+        if amount < limit:
+            return bucket
+    return len(limits)
+
+
+def freight_cost(product, origin, destination, bucket=DEFAULT_BUCKET):
+    """Per-unit cost of moving a product between two markets, or None if they are not connected"""
+    if not origin or not destination or origin == destination:
+        return 0.0
+    km = distance(origin, destination)
+    if km is None:
+        return None
+    return km * get_product(product).freight_per_km * BUCKET_FACTORS[bucket]
+
+
+for _a, _b, _km in ROADS:
+    _roads[_road_key(_a, _b)] = _km
+DISTANCES, NEXT_HOP = build_tables(_roads)
@@ -0,0 +1,140 @@
+"""Monte Carlo revenue scenarios for selling or buying a quantity.
+
+Price paths are simulated as geometric Brownian motion with NumPy,
+vectorized across N_SCENARIOS paths. Drift comes from the price forecast
+shown to the user, and volatility from the forecasting model's one-step
+error, or from the catalog price range when there is no fitted series.
+Paths are simulated relative to today's price with a seed derived from
+(product, market, horizon). They are cached per (product, market,
+horizon) and price data version, so a request only scales cached arrays
+and takes percentiles.
+
+Quantity enters through square-root market impact (slippage grows with
+the share of a market's daily depth being sold or bought), volume
+discounts on bulk purchases, and holding costs (storage losses,
+spoilage or feed) for the days goods are held.
+"""
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+from catalog import get_market, get_product
+from routing import parse_quantity, quantity_bucket
+
+N_SCENARIOS = 2000
+
+DEFAULT_HORIZON_DAYS = 30
+MAX_HORIZON_DAYS = 90
+
+# Goods can be sold in weekly tranches instead of all at once
+TRANCHE_DAYS = 7
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Units a market absorbs per day at moderate competition before prices move by IMPACT_AT_DEPTH
+MARKET_DEPTH = {'kg': 20000, 'animal': 40}
+DEPTH_BY_COMPETITION = {'high competition': 3.0, 'moderate competition': 1.5, 'low competition': 0.75}
+IMPACT_AT_DEPTH = 0.02
+MAX_SLIPPAGE = 0.3
+
+# Discount bulk buyers negotiate, per routing quantity bucket
+VOLUME_DISCOUNTS = (0.0, 0.01, 0.03, 0.05)
+
+# Share of value lost per day of holding
+HOLDING_COST_PER_DAY = {
+    'highly perishable': 0.02,
+    'moderate perishability': 0.002,
+    'low perishability': 0.0005,
+    'live animal': 0.003,
+}
+DEFAULT_HOLDING_COST = 0.001
+
+
+def daily_volatility(product_info, current, rmse=None):
+    """Daily log-price volatility from the model's one-step error, or the catalog price range"""
+    if rmse is not None and current:
+        return min(rmse / current, 0.2)
+    # Treat the catalog min-max range as roughly a 95% band over a month
+    return (product_info.max - product_info.min) / product_info.avg / 4 / np.sqrt(30)
+
+
+def tranche_days(horizon):
+    return tuple(range(TRANCHE_DAYS, horizon + 1, TRANCHE_DAYS)) or (horizon,)
+
+
+@lru_cache(maxsize=512)
+def simulate(product, market, horizon, drift, volatility, version=None):
+    """Relative prices (today = 1) at each tranche day, as an N_SCENARIOS x tranches array
+
+    The last column is the price at the horizon. version only keys the cache.
+    """
+    rng = np.random.default_rng(zlib.crc32(f'{product}|{market}|{horizon}'.encode('utf-8')))
+    shocks = rng.standard_normal((N_SCENARIOS, horizon))
+    log_paths = np.cumsum((drift - 0.5 * volatility ** 2) + volatility * shocks, axis=1)
+    days = np.array(tranche_days(horizon)) - 1
+    relative = np.exp(log_paths[:, days])
+    relative.setflags(write=False)
+    return relative
+
+
+def slippage(product_info, market_info, amount):
+    """Share of price lost (or paid extra) trading amount units at once in a market"""
+    depth = MARKET_DEPTH.get(product_info.unit, MARKET_DEPTH['kg']) * DEPTH_BY_COMPETITION.get(
+        market_info.competition, 1.0)
+    return min(IMPACT_AT_DEPTH * np.sqrt(amount / depth), MAX_SLIPPAGE)
+
+
+def _percentiles(values):
+    return {f'p{p}': int(round(v)) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def simulate_quantity(product, market, side, quantity, current, next_month, rmse=None,
+                      horizon=DEFAULT_HORIZON_DAYS, version=None):
+    """Revenue (sellers) or cost (buyers) distributions for acting now, at the horizon, or in weekly tranches
+
+    Returns None when the quantity cannot be parsed.
+    """
+    amount = parse_quantity(quantity)
+    if amount is None or not current:
+        return None
+    product_info = get_product(product)
+    market_info = get_market(market)
+    horizon = max(1, min(int(horizon), MAX_HORIZON_DAYS))
+    drift = float(np.log(next_month / current) / 30) if next_month and next_month > 0 else 0.0
+    volatility = float(daily_volatility(product_info, current, rmse))
+    relative = simulate(product, market, horizon, round(drift, 6), round(volatility, 6), version)
+
+    days = np.array(tranche_days(horizon))
+    holding = HOLDING_COST_PER_DAY.get(product_info.perishability, DEFAULT_HOLDING_COST)
+    impact_all = slippage(product_info, market_info, amount)
+    impact_tranche = slippage(product_info, market_info, amount / len(days))
+    value = amount * current
+
+    if side == 'sell':
+        now = value * (1 - impact_all)
+        # Held goods lose value every day they are stored
+        later = value * relative[:, -1] * (1 - impact_all) * max(0.0, 1 - holding * horizon)
+        staggered = value * (1 - impact_tranche) * (relative * np.maximum(0.0, 1 - holding * days)).mean(axis=1)
+        better = (later > now).mean(), (staggered > now).mean()
+    else:
+        discount = VOLUME_DISCOUNTS[quantity_bucket(product, quantity)]
+        now = value * (1 + impact_all) * (1 - discount)
+        later = value * relative[:, -1] * (1 + impact_all) * (1 - discount)
+        staggered = value * (1 + impact_tranche) * (1 - VOLUME_DISCOUNTS[
+            quantity_bucket(product, amount / len(days))]) * relative.mean(axis=1)
+        better = (later < now).mean(), (staggered < now).mean()
+
+    return {
+        'side': side,
+        'quantity': amount,
+        'unit': product_info.unit,
+        'horizon_days': horizon,
+        'scenarios': N_SCENARIOS,
+        'slippage_pct': round(impact_all * 100, 2),
+        'volume_discount_pct': round(discount * 100, 1) if side == 'buy' else 0.0,
+        'act_now': int(round(now)),
+        'wait': dict(_percentiles(later), probability_better=round(float(better[0]), 3)),
+        'weekly_tranches': dict(_percentiles(staggered), tranches=len(days),
+                                probability_better=round(float(better[1]), 3)),
+    }
@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+
+from flask import Response
+
+from metrics import STREAM_REJECTED
+
+# Comment line sent when nothing else was, so proxies keep the connection open
+HEARTBEAT = ': keep-alive\n\n'
+
+# Seconds between heartbeats on an idle stream
+HEARTBEAT_INTERVAL = 15
+
+# Milliseconds browsers wait before reconnecting after the stream drops
+RETRY_MS = 3000
+
+# Each open stream holds a server thread until it closes. By default, streams may use at most half
+# of a worker's threads so pages and /analyze keep being served; the stream server raises this
+MAX_STREAMS = int(os.getenv('MAX_STREAMS') or max(1, int(os.getenv('WEB_THREADS', '4')) // 2))
+
+# Seconds a client turned away for lack of stream capacity is told to wait
+BUSY_RETRY_SECONDS = 30
+
+
+class StreamSlots:
+    """Count of open streams in this process, capped at a limit"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+
+stream_slots = StreamSlots(MAX_STREAMS)
+
+
+def format_event(data, event=None, event_id=None):
+    """One Server-Sent Events message; data is sent as compact JSON"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event is not None:
+        lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+def last_event_id(request, default=0):
+    """Integer Last-Event-ID a reconnecting browser sent (or ?last_event_id=), else default"""
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def event_stream(messages, route):
+    """Streaming text/event-stream response for an iterable of formatted messages, or 503 when streams are full"""
+    if not stream_slots.acquire():
+        STREAM_REJECTED.inc(route)
+        response = Response('Too many open streams\n', status=503, mimetype='text/plain')
+        response.headers['Retry-After'] = str(BUSY_RETRY_SECONDS)
+        return response
+
+    def generate():
+        yield f'retry: {RETRY_MS}\n\n'
+        yield from messages
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    # Runs when the server closes the response, even if the generator never started
+    response.call_on_close(stream_slots.release)
+    return response
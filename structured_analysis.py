@@ -0,0 +1,179 @@
+"""Schema-constrained Gemini analysis with a stale-while-revalidate cache.
+
+The prompt carries a JSON schema and asks for a single JSON object. Replies
+are decoded with json.JSONDecoder.raw_decode from the first brace, so no
+regex scans the reply, and are checked against the schema: unknown keys are
+dropped, enum values are normalized, and a missing or mistyped field
+rejects the reply.
+
+Validated results are cached per normalized (role, product, market,
+quantity bucket). Within CACHE_TTL a hit is returned as is. Until
+CACHE_STALE_TTL it is still returned immediately, and one background call
+through the gateway's thread pool refreshes it. Older entries, and misses,
+wait for the model.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from catalog import get_product
+from llm_gateway import LLMUnavailable
+from market_analysis import normalize_key
+from routing import BUCKET_LIMITS, quantity_bucket
+
+CACHE_TTL = float(os.getenv('ANALYSIS_CACHE_TTL', '600'))
+CACHE_STALE_TTL = float(os.getenv('ANALYSIS_CACHE_STALE_TTL', '3600'))
+CACHE_SIZE = 4096
+
+MAX_REASONING_LENGTH = 600
+
+ANALYSIS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'recommendation': {'type': 'string', 'description': 'Clear action, e.g. "Sell Now", "Wait 3-5 days", "Buy Now", "Hold"'},
+        'best_market': {'type': 'string', 'description': 'Specific Ethiopian market to trade in'},
+        'trend': {'type': 'string', 'enum': ['Rising', 'Falling', 'Stable']},
+        'reasoning': {'type': 'string', 'description': '2-3 sentences'},
+        'confidence': {'type': 'string', 'enum': ['High', 'Medium', 'Low']},
+    },
+    'required': ['recommendation', 'best_market', 'trend', 'reasoning', 'confidence'],
+}
+
+ROLE_GOALS = {
+    'farmer': 'As a farmer in Ethiopia, you want to maximize your selling price.',
+    'trader': 'As a trader in Ethiopia, you want to buy low and sell efficiently.',
+    'business': 'As a small business owner in Ethiopia, you want to reduce costs and avoid price spikes.',
+    'consumer': 'As a consumer in Ethiopia, you want to buy essentials at the lowest cost.',
+    'cooperative': 'As a cooperative in Ethiopia, you want to sell members\' produce together at the best price.',
+    'government': 'As a government analyst in Ethiopia, you want to keep markets stable and efficient.',
+}
+
+_SCHEMA_TEXT = json.dumps(ANALYSIS_SCHEMA, separators=(',', ':'))
+_decoder = json.JSONDecoder()
+
+
+class InvalidReply(ValueError):
+    """The model's reply does not match ANALYSIS_SCHEMA"""
+
+
+def bucket_label(product, bucket):
+    """Quantity range of a bucket, e.g. '100-1000 kg'"""
+    unit = get_product(product).unit
+    limits = BUCKET_LIMITS.get(unit, BUCKET_LIMITS['kg'])
+    unit = 'kg' if unit == 'kg' else 'animals'
+    if bucket == 0:
+        return f'under {limits[0]} {unit}'
+    if bucket == len(limits):
+        return f'{limits[-1]} {unit} or more'
+    return f'{limits[bucket - 1]}-{limits[bucket]} {unit}'
+
+
+def build_prompt(user_role, product, market, bucket):
+    """Prompt for a normalized key; the quantity is given as its bucket so similar requests share a prompt"""
+    return (
+        f"You are an AI market analyst for Ethiopian markets. {ROLE_GOALS.get(user_role, '')}\n"
+        f"Product: {product}\n"
+        f"Market/Location: {market}\n"
+        f"Quantity: {bucket_label(product, bucket)}\n"
+        f"User Role: {user_role}\n"
+        "Consider Ethiopian market conditions, seasonal factors and typical supply/demand patterns. "
+        "Be practical and actionable.\n"
+        "Reply with one JSON object and nothing else, matching this JSON schema:\n"
+        f"{_SCHEMA_TEXT}"
+    )
+
+
+def parse_reply(text):
+    """Validated analysis dict from reply text; raises InvalidReply"""
+    start = text.find('{')
+    if start < 0:
+        raise InvalidReply('no JSON object in reply')
+    try:
+        data, _ = _decoder.raw_decode(text, start)
+    except ValueError as e:
+        raise InvalidReply(f'malformed JSON: {e}') from e
+    if not isinstance(data, dict):
+        raise InvalidReply('reply is not a JSON object')
+
+    result = {}
+    for name in ANALYSIS_SCHEMA['required']:
+        value = data.get(name)
+        if not isinstance(value, str) or not value.strip():
+            raise InvalidReply(f'{name} must be a non-empty string')
+        value = value.strip()
+        allowed = ANALYSIS_SCHEMA['properties'][name].get('enum')
+        if allowed:
+            matches = [option for option in allowed if option.lower() == value.lower()]
+            if not matches:
+                raise InvalidReply(f"{name} must be one of {', '.join(allowed)}")
+            value = matches[0]
+        result[name] = value
+    result['reasoning'] = result['reasoning'][:MAX_REASONING_LENGTH]
+    return result
+
+
+class StructuredAnalyzer:
+    """Cached, validated structured analyses through an LLM gateway"""
+
+    def __init__(self, llm, ttl=CACHE_TTL, stale_ttl=CACHE_STALE_TTL, maxsize=CACHE_SIZE, clock=time.monotonic):
+        self.llm = llm
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _store(self, key, result):
+        with self._lock:
+            self._entries[key] = (result, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _refresh(self, key, prompt):
+        """Start one background call for a stale entry"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def done(future):
+            try:
+                self._store(key, parse_reply(future.result()))
+            except Exception as e:
+                # The stale entry keeps being served until it expires
+                print(f"Warning: background analysis refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        try:
+            self.llm.submit(prompt).add_done_callback(done)
+        except LLMUnavailable:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def analyze(self, user_role, product, market, quantity):
+        """(validated result, 'hit' | 'stale' | 'miss'); raises LLMUnavailable or InvalidReply on a miss"""
+        role, product, market = normalize_key(user_role, product, market)
+        bucket = quantity_bucket(product, quantity)
+        key = (role, product, market, bucket)
+
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            result, stored_at = entry
+            age = self.clock() - stored_at
+            if age < self.ttl:
+                return result, 'hit'
+            if age < self.stale_ttl:
+                self._refresh(key, build_prompt(role, product, market, bucket))
+                return result, 'stale'
+
+        result = parse_reply(self.llm.generate(build_prompt(role, product, market, bucket)))
+        self._store(key, result)
+        return result, 'miss'
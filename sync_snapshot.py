@@ -0,0 +1,118 @@
+"""Versioned offline snapshots for the mobile client.
+
+A snapshot holds the catalog, current prices and forecasts, and every
+role's recommendation and best market for every product and market: enough
+for the mobile page to answer queries without calling /analyze. Rows are
+positional lists with field names listed once, and the response is gzipped,
+which folds the repeated recommendation texts, so the whole snapshot is a
+few kB on the wire. Texts are kept inline rather than in a lookup table so
+that one new text never renumbers, and so changes, every other row.
+
+A snapshot is built once per price data version and shared by every client.
+Its version is a hash of its content, so workers that build from the same
+data agree on versions. A client that sends the version it already holds
+gets only the rows that changed, as long as that version is still among the
+last SNAPSHOT_HISTORY snapshots; otherwise it gets a full snapshot.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import price_store
+from catalog import MARKETS_BY_ID, PRODUCTS_BY_ID, ROLES
+from market_analysis import lookup_analysis
+
+# Earlier snapshots kept to answer delta requests
+SNAPSHOT_HISTORY = 16
+
+# Sections holding fixed-length lists of rows, diffed row by row
+ROW_SECTIONS = ('cells', 'advice')
+
+CELL_FIELDS = ('price', 'next_week', 'next_month', 'trend', 'confidence', 'opportunity_score', 'risk')
+ADVICE_FIELDS = ('recommendation', 'best_market')
+
+
+def build_snapshot():
+    """Snapshot dict for the current price data, with a content-hash version"""
+    market_index = {market.name: market.id for market in MARKETS_BY_ID}
+    cells = []
+    advice = [[] for _ in ROLES]
+    for product in PRODUCTS_BY_ID:
+        for market in MARKETS_BY_ID:
+            for role_id, role in enumerate(ROLES):
+                analysis = lookup_analysis(role, product.key, market.key)
+                advice[role_id].append([analysis['recommendation'], market_index[analysis['best_market']]])
+            # Prices, trend and risk do not depend on the role
+            insights = analysis['detailed_insights']
+            forecast = insights['price_forecast']
+            cells.append([forecast['current_price'], forecast['next_week'], forecast['next_month'],
+                          analysis['trend'], analysis['confidence'], insights['opportunity_score'],
+                          insights['risk_assessment']['overall_risk']])
+
+    snapshot = {
+        'products': [[product.key, product.name, product.unit] for product in PRODUCTS_BY_ID],
+        'markets': [[market.key, market.name, market.region] for market in MARKETS_BY_ID],
+        'roles': list(ROLES),
+        'cell_fields': list(CELL_FIELDS),
+        'advice_fields': list(ADVICE_FIELDS),
+        # One row per (product, market), product-major
+        'cells': cells,
+        # One row per (role, product, market), role-major
+        'advice': [row for rows in advice for row in rows],
+    }
+    content = json.dumps(snapshot, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    snapshot['version'] = hashlib.sha1(content).hexdigest()[:16]
+    return snapshot
+
+
+def diff_snapshots(old, new):
+    """Delta turning old into new: changed rows by index, and whole sections that differ"""
+    changes = {}
+    replace = {}
+    for section, value in new.items():
+        if section == 'version' or old.get(section) == value:
+            continue
+        if section in ROW_SECTIONS and len(old.get(section, ())) == len(value):
+            changes[section] = [[index, row] for index, (before, row) in enumerate(zip(old[section], value))
+                                if before != row]
+        else:
+            replace[section] = value
+    return {'type': 'delta', 'base': old['version'], 'version': new['version'], 'changes': changes, 'replace': replace}
+
+
+class SnapshotBuilder:
+    """Current snapshot per price data version, plus recent history for deltas"""
+
+    def __init__(self, history=SNAPSHOT_HISTORY):
+        self.history = history
+        self._snapshots = OrderedDict()
+        self._current = None
+        self._data_version = object()
+        self._lock = threading.Lock()
+
+    def current(self):
+        """The snapshot for the current price data, built at most once per data version"""
+        version = price_store.data_version()
+        if version == self._data_version:
+            return self._current
+        with self._lock:
+            if version != self._data_version:
+                snapshot = build_snapshot()
+                self._snapshots.pop(snapshot['version'], None)
+                self._snapshots[snapshot['version']] = snapshot
+                while len(self._snapshots) > self.history:
+                    self._snapshots.popitem(last=False)
+                self._current = snapshot
+                self._data_version = version
+        return self._current
+
+    def delta(self, since):
+        """Delta from a client's version to the current snapshot, or None if that version is unknown"""
+        current = self.current()
+        base = self._snapshots.get(since)
+        if base is None:
+            return None
+        if base is current:
+            return {'type': 'delta', 'base': since, 'version': since, 'changes': {}, 'replace': {}}
+        return diff_snapshots(base, current)
@@ -0,0 +1,74 @@
+from datetime import date, timedelta
+
+import pytest
+
+import forecasting
+import price_store
+
+START = date(2026, 1, 1)
+DAYS = 30
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv('PRICE_DB_PATH', str(tmp_path / 'prices.db'))
+    monkeypatch.setattr(forecasting, '_model', None)
+    monkeypatch.setattr(forecasting, '_model_version', None)
+    conn = price_store.connect(create=True)
+    yield conn
+    conn.close()
+
+
+def observation(market, day, price):
+    return {'product': 'teff', 'market': market, 'date': (START + timedelta(days=day)).isoformat(), 'price': price}
+
+
+def refit_forecast(key):
+    model = forecasting.fit_from_store()
+    return model.forecast(key, 7), model.forecast(key, 30)
+
+
+def test_same_day_observation_after_update_is_applied(store):
+    # gondar has no price for the last day yet, so the model forward-fills it
+    price_store.add_observations([observation('jimma', day, 60 + day % 7) for day in range(DAYS)], store)
+    price_store.add_observations([observation('gondar', day, 65) for day in range(DAYS - 1)], store)
+    assert forecasting.get_forecast('teff', 'gondar')[0] == 65
+
+    price_store.add_observations([observation('gondar', DAYS - 1, 200)], store)
+    current, next_week, next_month, _ = forecasting.get_forecast('teff', 'gondar')
+
+    assert current == 200
+    assert (next_week, next_month) == pytest.approx(refit_forecast(('teff', 'gondar')))
+
+
+def test_correction_to_a_fitted_day_is_applied(store):
+    price_store.add_observations([observation('jimma', day, 60 + day % 7) for day in range(DAYS)], store)
+    forecasting.get_forecast('teff', 'jimma')
+
+    price_store.add_observations([observation('jimma', DAYS - 3, 90)], store)
+    _, next_week, next_month, _ = forecasting.get_forecast('teff', 'jimma')
+
+    assert (next_week, next_month) == pytest.approx(refit_forecast(('teff', 'jimma')))
+
+
+def test_new_days_still_advance_incrementally(store, monkeypatch):
+    price_store.add_observations([observation('jimma', day, 60 + day % 7) for day in range(DAYS)], store)
+    forecasting.get_model()
+    monkeypatch.setattr(forecasting, 'fit_from_store', lambda: pytest.fail('refit for a new day'))
+
+    price_store.add_observations([observation('jimma', DAYS, 70)], store)
+
+    assert forecasting.get_forecast('teff', 'jimma')[0] == 70
+
+
+def test_update_leaves_the_previous_model_untouched(store):
+    price_store.add_observations([observation('jimma', day, 60 + day % 7) for day in range(DAYS)], store)
+    previous = forecasting.get_model()
+    level = previous.level.copy()
+    fitted_through = previous.fitted_through
+
+    price_store.add_observations([observation('jimma', DAYS, 70)], store)
+
+    assert forecasting.get_model() is not previous
+    assert previous.fitted_through == fitted_through
+    assert (previous.level == level).all()
@@ -0,0 +1,43 @@
+import threading
+import time
+
+import pytest
+
+import llm_gateway
+import llm_model
+from llm_gateway import GeminiBackend, LLMGateway, LLMUnavailable
+
+
+class Model:
+    def generate_content(self, prompt):
+        return llm_gateway.LLMResponse('reply to ' + prompt)
+
+
+@pytest.fixture
+def loading(monkeypatch):
+    """Gemini configured, with a model load that finishes when the returned event is set"""
+    done = threading.Event()
+
+    def load_model():
+        done.wait(5)
+        return Model()
+    monkeypatch.setenv('GEMINI_API_KEY', 'test')
+    monkeypatch.setattr(llm_model, 'load_model', load_model)
+    monkeypatch.setattr(llm_model, '_loaded', False)
+    monkeypatch.setattr(llm_model, '_model', None)
+    monkeypatch.setattr(llm_model, '_warming_pid', None)
+    return done
+
+
+def test_calls_before_the_model_loads_fall_back_at_once(loading):
+    gateway = LLMGateway(GeminiBackend(), timeout=5)
+
+    with pytest.raises(LLMUnavailable):
+        gateway.generate('hello')
+
+    loading.set()
+    for _ in range(500):
+        if llm_model.loaded():
+            break
+        time.sleep(0.01)
+    assert gateway.generate('hello') == 'reply to hello'
@@ -0,0 +1,25 @@
+import math
+
+import pytest
+
+from routing import MAX_QUANTITY, parse_quantity, quantity_error
+
+
+@pytest.mark.parametrize('quantity, amount', [
+    ('100 kg', 100.0), ('2 quintals', 200.0), ('1.5t', 1500.0), (10, 10.0), ('10000 t', MAX_QUANTITY),
+])
+def test_parse_quantity(quantity, amount):
+    assert parse_quantity(quantity) == amount
+    assert quantity_error(quantity) is None
+
+
+@pytest.mark.parametrize('quantity', [1e308, math.inf, math.nan, 10 ** 400, '9' * 400, '10001 t'])
+def test_out_of_range_quantities_are_rejected(quantity):
+    assert parse_quantity(quantity) is None
+    assert quantity_error(quantity) is not None
+
+
+@pytest.mark.parametrize('quantity', ['', None, 'a few bags', -5])
+def test_missing_quantities_are_not_errors(quantity):
+    assert parse_quantity(quantity) is None
+    assert quantity_error(quantity) is None
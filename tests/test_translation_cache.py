@@ -0,0 +1,75 @@
+import re
+
+import pytest
+
+import translation_cache
+from llm_gateway import FakeBackend, LLMGateway
+from translation_cache import TranslationCache, parse_batch_response, translate_batch
+
+SEGMENT = re.compile(r'<<<(\d+)>>> (.*)')
+
+
+def batch_responder(prompt):
+    """Upper-cases every numbered segment, or the single text of a one-string prompt"""
+    segments = SEGMENT.findall(prompt)
+    if segments:
+        return '\n'.join(f'<<<{index}>>> {text.upper()}' for index, text in segments)
+    return prompt.rsplit('\n', 1)[-1].upper()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return TranslationCache(str(tmp_path / 'translations.db'))
+
+
+def test_parse_batch_response():
+    assert parse_batch_response('<<<0>>> a\n<<<1>>> b c\n', 2) == ['a', 'b c']
+    assert parse_batch_response('<<<1>>> b\n<<<0>>> a', 2) == ['a', 'b']
+
+
+@pytest.mark.parametrize('reply', ['a\nb', '<<<0>>> a', '<<<0>>> a\n<<<1>>>', ''])
+def test_parse_batch_response_rejects_missing_segments(reply):
+    assert parse_batch_response(reply, 2) is None
+
+
+def test_batch_uses_one_call_and_the_cache(cache):
+    backend = FakeBackend(responder=batch_responder)
+    model = LLMGateway(backend)
+
+    assert translate_batch(['sell now', 'rising', 'sell now'], 'am', model, cache) == ['SELL NOW', 'RISING', 'SELL NOW']
+    assert backend.calls == 1
+    assert translate_batch(['rising', 'sell now'], 'am', model, cache) == ['RISING', 'SELL NOW']
+    assert backend.calls == 1
+
+
+def test_fallback_translates_one_by_one_when_markers_are_lost(cache):
+    backend = FakeBackend(responder=lambda prompt: batch_responder(prompt) if '<<<' not in prompt else 'no markers')
+
+    assert translate_batch(['a', 'b', 'c'], 'am', LLMGateway(backend), cache) == ['A', 'B', 'C']
+    assert backend.calls == 4
+
+
+def test_fallback_stops_at_the_time_budget(cache, monkeypatch):
+    clock = Clock()
+
+    def responder(prompt):
+        clock.now += 10
+        return batch_responder(prompt) if '<<<' not in prompt else 'no markers'
+    backend = FakeBackend(responder=responder)
+    monkeypatch.setattr(translation_cache, 'MAX_BATCH_SIZE', 3)
+
+    texts = ['a', 'b', 'c', 'd', 'e', 'f']
+    result = translate_batch(texts, 'am', LLMGateway(backend), cache, time_budget=25, clock=clock)
+
+    # Batch call at 0, single calls at 10 and 20; nothing is started from 30 on
+    assert result == ['A', 'B', 'c', 'd', 'e', 'f']
+    assert backend.calls == 3
+    assert cache.get('c', 'am') is None
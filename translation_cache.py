@@ -0,0 +1,207 @@
+"""Cached, batched text translation.
+
+Translations are stored on disk in SQLite keyed by (sha256 of text, target
+language), with an in-memory LRU in front, so repeated UI strings never
+reach the model again. Cache misses from a batch are packed into a single
+model call. Any object with a generate_content(prompt) method returning
+something with .text works as the model, which makes a stub easy to use.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'translations.db')
+
+LANGUAGE_NAMES = {'am': 'Amharic', 'en': 'English'}
+
+# Most strings kept on disk before the least recently used are evicted
+MAX_DISK_ENTRIES = 50000
+
+# Most strings kept in process memory
+MAX_MEMORY_ENTRIES = 2048
+
+# Largest number of strings packed into one model call
+MAX_BATCH_SIZE = 50
+
+# Seconds a batch may keep starting model calls; texts not reached by then are returned untranslated
+BATCH_TIME_BUDGET = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS translations (
+    text_hash TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    translated TEXT NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (text_hash, lang)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used);
+"""
+
+_SEGMENT_PATTERN = re.compile(r'<<<(\d+)>>>\s*(.*?)\s*(?=<<<\d+>>>|\Z)', re.DOTALL)
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class TranslationCache:
+    """On-disk translation store with an in-memory LRU front"""
+
+    def __init__(self, path=None, max_entries=MAX_DISK_ENTRIES, memory_entries=MAX_MEMORY_ENTRIES):
+        self.path = path or os.getenv('TRANSLATION_CACHE_PATH', DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes_since_trim = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def reset_connections(self):
+        """Forget connections opened before a fork; each worker opens its own"""
+        self._local = threading.local()
+
+    def _remember(self, key, translated):
+        with self._lock:
+            self._memory[key] = translated
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, text, lang):
+        """Cached translation or None"""
+        key = (text_hash(text), lang)
+        with self._lock:
+            translated = self._memory.get(key)
+            if translated is not None:
+                self._memory.move_to_end(key)
+                return translated
+
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT translated FROM translations WHERE text_hash = ? AND lang = ?', key).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE translations SET last_used = ? WHERE text_hash = ? AND lang = ?',
+                     (int(time.time()),) + key)
+        conn.commit()
+        self._remember(key, row[0])
+        return row[0]
+
+    def put_many(self, pairs, lang):
+        """Store (text, translated) pairs"""
+        now = int(time.time())
+        rows = []
+        for text, translated in pairs:
+            key = (text_hash(text), lang)
+            self._remember(key, translated)
+            rows.append((key[0], lang, translated, now))
+
+        conn = self._conn()
+        conn.executemany('INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)', rows)
+        conn.commit()
+
+        self._writes_since_trim += len(rows)
+        if self._writes_since_trim >= max(1, self.max_entries // 10):
+            self.trim()
+
+    def put(self, text, lang, translated):
+        self.put_many([(text, translated)], lang)
+
+    def trim(self):
+        """Evict least recently used entries beyond the size cap"""
+        conn = self._conn()
+        count = conn.execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                'DELETE FROM translations WHERE (text_hash, lang) IN '
+                '(SELECT text_hash, lang FROM translations ORDER BY last_used LIMIT ?)',
+                (count - self.max_entries,))
+            conn.commit()
+        self._writes_since_trim = 0
+
+
+def build_prompt(text, target_lang):
+    target_language = LANGUAGE_NAMES.get(target_lang, 'English')
+    return f"Translate the following text to {target_language}. Only return the translated text, no explanations:\n\n{text}"
+
+
+def build_batch_prompt(texts, target_lang):
+    target_language = LANGUAGE_NAMES.get(target_lang, 'English')
+    segments = '\n'.join(f'<<<{i}>>> {text}' for i, text in enumerate(texts))
+    return (
+        f"Translate each numbered segment below to {target_language}. "
+        f"Keep every <<<n>>> marker exactly as given, followed by its translation. "
+        f"Only return the markers and translated text, no explanations:\n\n{segments}"
+    )
+
+
+def parse_batch_response(response_text, count):
+    """Split a batched reply back into a list, or None if any segment is missing"""
+    segments = {int(index): translated for index, translated in _SEGMENT_PATTERN.findall(response_text)}
+    if any(i not in segments or not segments[i] for i in range(count)):
+        return None
+    return [segments[i] for i in range(count)]
+
+
+def translate(text, target_lang, model, cache):
+    """Translate one string, consulting the cache first"""
+    if target_lang == 'en':
+        return text
+    cached = cache.get(text, target_lang)
+    if cached is not None:
+        return cached
+    translated = model.generate_content(build_prompt(text, target_lang)).text.strip()
+    cache.put(text, target_lang, translated)
+    return translated
+
+
+def translate_batch(texts, target_lang, model, cache, time_budget=BATCH_TIME_BUDGET, clock=time.monotonic):
+    """Translate many strings with one model call per MAX_BATCH_SIZE cache misses
+
+    No model call is started after time_budget seconds; texts left by then
+    are returned as given and not cached.
+    """
+    if target_lang == 'en':
+        return list(texts)
+
+    deadline = clock() + time_budget
+    results = [cache.get(text, target_lang) for text in texts]
+    misses = list(OrderedDict.fromkeys(text for text, cached in zip(texts, results) if cached is None))
+
+    translated = {}
+    for start in range(0, len(misses), MAX_BATCH_SIZE):
+        if clock() >= deadline:
+            break
+        chunk = misses[start:start + MAX_BATCH_SIZE]
+        if len(chunk) == 1:
+            parts = [model.generate_content(build_prompt(chunk[0], target_lang)).text.strip()]
+        else:
+            response = model.generate_content(build_batch_prompt(chunk, target_lang))
+            parts = parse_batch_response(response.text, len(chunk))
+            if parts is None:
+                # The model did not keep the markers; translate this chunk one by one while time allows
+                parts = []
+                for text in chunk:
+                    if clock() >= deadline:
+                        break
+                    parts.append(model.generate_content(build_prompt(text, target_lang)).text.strip())
+        done = list(zip(chunk, parts))
+        translated.update(done)
+        cache.put_many(done, target_lang)
+
+    return [cached if cached is not None else translated.get(text, text) for text, cached in zip(texts, results)]
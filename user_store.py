@@ -0,0 +1,182 @@
+"""SQLite user repository shared by every worker.
+
+Users get a random, stable id when first seen. Emails are stored normalized
+under a unique index, so a login finds its user with one indexed lookup and
+two workers can never create the same user twice. Connections come from a
+small per-process pool rather than one per thread, so a server that starts
+a thread per request does not pay for a new connection (and its schema
+setup) on every request; each pooled connection keeps its compiled
+statements between uses.
+
+get() is read-through cached for login_required and role lookups. Writes
+update this process's cache directly; changes made by other workers are
+picked up within CACHE_TTL seconds.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import metrics
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'users.db')
+
+# Idle connections kept per process; busier moments open extra ones that are closed after use
+POOL_SIZE = int(os.getenv('USER_DB_POOL_SIZE', '8'))
+
+# Users cached per process, and how long a cached user may lag another worker's change
+CACHE_SIZE = 20000
+CACHE_TTL = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    role TEXT
+);
+"""
+
+# Stores from before the unique index could hold the same email under several ids; keep the newest
+EMAIL_INDEX = """
+BEGIN IMMEDIATE;
+UPDATE users SET email = lower(trim(email)) WHERE email != lower(trim(email));
+DELETE FROM users WHERE rowid NOT IN (SELECT MAX(rowid) FROM users GROUP BY email);
+CREATE UNIQUE INDEX IF NOT EXISTS users_email ON users (email);
+COMMIT;
+"""
+
+SELECT_BY_ID = 'SELECT user_id, email, role FROM users WHERE user_id = ?'
+SELECT_BY_EMAIL = 'SELECT user_id, email, role FROM users WHERE email = ?'
+INSERT_USER = 'INSERT OR IGNORE INTO users (user_id, email) VALUES (?, ?)'
+UPDATE_ROLE = 'UPDATE users SET role = ? WHERE user_id = ?'
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+class UserStore:
+    """Users in SQLite (WAL mode) behind a connection pool and a read-through cache"""
+
+    def __init__(self, path=None, pool_size=POOL_SIZE, cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL,
+                 clock=time.monotonic):
+        self.path = path or os.getenv('USER_DB_PATH', DEFAULT_DB_PATH)
+        self.pool_size = pool_size
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.clock = clock
+        self._idle = queue.LifoQueue(pool_size)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'users_email'").fetchone() is None:
+            conn.executescript(EMAIL_INDEX)
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """A pooled connection for one operation; returned to the pool afterwards"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def reset_connections(self):
+        """Forget connections and cached users from before a fork; each worker opens its own"""
+        self._idle = queue.LifoQueue(self.pool_size)
+        with self._lock:
+            self._cache.clear()
+
+    def _remember(self, user):
+        with self._lock:
+            self._cache[user['user_id']] = (user, self.clock())
+            self._cache.move_to_end(user['user_id'])
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def get(self, user_id):
+        """User dict (user_id, email, role) or None, cached for up to cache_ttl seconds"""
+        with self._lock:
+            entry = self._cache.get(user_id)
+        if entry is not None and self.clock() - entry[1] < self.cache_ttl:
+            metrics.USER_CACHE.inc('hit')
+            return entry[0]
+        metrics.USER_CACHE.inc('miss')
+        with self._connection() as conn:
+            row = conn.execute(SELECT_BY_ID, (user_id,)).fetchone()
+        if row is None:
+            # Unknown ids are not cached, so a user just created by another worker is found at once
+            with self._lock:
+                self._cache.pop(user_id, None)
+            return None
+        user = dict(row)
+        self._remember(user)
+        return user
+
+    def find(self, email):
+        """User dict for an email, or None"""
+        with self._connection() as conn:
+            row = conn.execute(SELECT_BY_EMAIL, (normalize_email(email),)).fetchone()
+        return dict(row) if row else None
+
+    def _insert(self, email):
+        """(user dict, whether it was created) for an email"""
+        email = normalize_email(email)
+        with self._connection() as conn:
+            row = conn.execute(SELECT_BY_EMAIL, (email,)).fetchone()
+            created = False
+            if row is None:
+                # Two workers may race here; the unique index lets exactly one insert win
+                created = conn.execute(INSERT_USER, (uuid.uuid4().hex, email)).rowcount > 0
+                conn.commit()
+                row = conn.execute(SELECT_BY_EMAIL, (email,)).fetchone()
+            user = dict(row)
+        self._remember(user)
+        return user, created
+
+    def create(self, email):
+        """New user dict, or None if the email is already registered"""
+        user, created = self._insert(email)
+        return user if created else None
+
+    def get_or_create(self, email):
+        """The user for an email, created (without a role) if new"""
+        return self._insert(email)[0]
+
+    def set_role(self, user_id, role):
+        """Set a user's role; returns False if the user does not exist"""
+        with self._connection() as conn:
+            updated = conn.execute(UPDATE_ROLE, (role, user_id)).rowcount
+            conn.commit()
+            row = conn.execute(SELECT_BY_ID, (user_id,)).fetchone() if updated else None
+        if row is None:
+            return False
+        self._remember(dict(row))
+        return True
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def count(self):
+        with self._connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
@@ -0,0 +1,32 @@
+"""Production entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Importing this module builds the analysis table and fits the forecasting
+model once in the master process. Workers then inherit all of it at fork
+time instead of each doing it again. The Gemini SDK is not imported in the
+master: each worker loads it in a background thread after forking, so a new
+worker starts serving immediately.
+"""
+import forecasting
+import llm_model
+import metrics
+import price_store
+from app import app, users, history, translations_cache, alert_engine
+
+# Fit once before forking; workers share the fitted arrays copy-on-write
+forecasting.get_model()
+
+
+def reset_after_fork():
+    """Drop SQLite connections and metric values inherited from the master process and start loading Gemini"""
+    metrics.REGISTRY.clear()
+    price_store.reset_connections()
+    users.reset_connections()
+    history.reset_connections()
+    translations_cache.reset_connections()
+    alert_engine.reset_connections()
+    llm_model.warm_up()
+
+
+__all__ = ['app', 'reset_after_fork']